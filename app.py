@@ -3,7 +3,7 @@
 69交易機器人監控系統 v3.2 - 帶登入認證
 包含數據顯示、同步監控、API接口、登入認證
 """
-from flask import Flask, render_template, jsonify, session
+from flask import Flask, render_template, jsonify, session, request
 from datetime import datetime
 import logging
 import os
@@ -12,7 +12,9 @@ import json
 import subprocess
 
 # 導入認證模組
-from auth import setup_auth_routes, configure_session, login_required
+from auth import setup_auth_routes, configure_session, login_required, token_required
+from sync.snapshot_manager import snapshot_manager
+from sync.hot_replica import hot_replica
 
 # 設置日誌
 logging.basicConfig(level=logging.INFO)
@@ -27,6 +29,22 @@ setup_auth_routes(app)
 DB_PATH = "data/trading_signals.db"
 SYNC_STATE_FILE = "data/sync_state.json"
 
+# 統計分析面板：路徑 -> AnalyticsManager 方法（均接受 window/start_ts/end_ts）
+ANALYTICS_PANELS = {
+    'summary': 'get_performance_summary',
+    'win-rate': 'get_win_rate_stats',
+    'execution': 'get_execution_analysis',
+    'symbols': 'get_symbol_performance',
+    'time': 'get_time_analysis'
+}
+
+_analytics_manager = None
+_equity_curve_engine = None
+
+# 啟用記憶體副本時於啟動時載入，避免首個請求承擔載入時間
+if hot_replica.enabled:
+    hot_replica.refresh_if_changed()
+
 @app.route('/')
 @login_required
 def dashboard():
@@ -67,15 +85,16 @@ def health():
         'database_exists': os.path.exists(DB_PATH),
         'database_path': DB_PATH,
         'timestamp': datetime.now().isoformat(),
-        'auth_enabled': True
+        'auth_enabled': True,
+        'hot_replica': hot_replica.get_metrics()
     })
 
 @app.route('/api/stats')
 @login_required
 def api_stats():
-    """統計數據API - 需要登入"""
+    """統計數據API - 需要登入（exact=1 時逐行計數）"""
     try:
-        stats = get_basic_stats_simple()
+        stats = get_basic_stats_simple(exact=request.args.get('exact') == '1')
         stats['user'] = session.get('username', 'Unknown')
         return jsonify(stats)
     except Exception as e:
@@ -87,8 +106,10 @@ def api_stats():
 def api_sync():
     """手動同步API - 需要登入"""
     try:
-        from smart_sync import sync_from_remote
-        result = sync_from_remote()
+        from smart_sync import sync_all_sources
+        
+        # 單一或多個來源都以合併同步寫入各自分區（新記錄與既有記錄的變更），不覆蓋推送接收的記錄
+        result = sync_all_sources()
         
         return jsonify({
             'success': True,
@@ -104,6 +125,63 @@ def api_sync():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/ingest', methods=['POST'])
+@token_required
+def api_ingest():
+    """推送式數據接收API - 交易主機以令牌認證推送壓縮NDJSON批次"""
+    try:
+        from sync.ingest_handler import ingest_handler, IngestError, MAX_DECOMPRESSED_BYTES
+        
+        if request.content_length and request.content_length > MAX_DECOMPRESSED_BYTES:
+            return jsonify({'success': False, 'error': '批次過大'}), 413
+        
+        result = ingest_handler.process_batch(
+            request.get_data(cache=False),
+            content_encoding=request.headers.get('Content-Encoding', 'identity'),
+            source_id=request.headers.get('X-Source-Id')
+        )
+        if result.get('records_applied'):
+            snapshot_manager.schedule_publish()
+        result['timestamp'] = datetime.now().isoformat()
+        return jsonify(result), 200 if result['success'] else 500
+        
+    except IngestError as e:
+        logger.warning(f"Ingest rejected: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'details': e.details
+        }), 400
+    except Exception as e:
+        logger.error(f"Ingest error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sources')
+@login_required
+def api_sources():
+    """同步來源API - 需要登入"""
+    try:
+        from sync.source_registry import source_registry
+        
+        source_counts = get_source_signal_counts()
+        sources = []
+        for source in source_registry.sources.values():
+            sources.append({
+                'source_id': source.source_id,
+                'enabled': source.enabled,
+                'partition_slot': source.partition_slot,
+                'total_signals': source_counts.get(source.source_id, 0)
+            })
+        
+        return jsonify({
+            'sources': sources,
+            'count': len(sources),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"API sources error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/signals')
 @login_required
 def api_signals():
@@ -120,39 +198,237 @@ def api_signals():
         logger.error(f"API signals error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def get_basic_stats_simple():
-    """獲取基本統計信息 - 簡化版"""
+@app.route('/api/equity-curve')
+@login_required
+def api_equity_curve():
+    """權益曲線API - 需要登入（start_ts/end_ts 為時間戳範圍，max_points 為最多點數）"""
+    try:
+        equity_curve_engine = get_equity_curve_engine()
+        
+        start_ts = request.args.get('start_ts', type=float)
+        end_ts = request.args.get('end_ts', type=float)
+        max_points = min(max(request.args.get('max_points', 500, type=int), 2), 5000)
+        
+        curve = equity_curve_engine.get_equity_curve(start_ts, end_ts, max_points)
+        curve['summary'] = equity_curve_engine.get_equity_summary()
+        curve['timestamp'] = datetime.now().isoformat()
+        return jsonify(curve)
+    except Exception as e:
+        logger.error(f"API equity curve error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/bundle')
+@login_required
+def api_analytics_bundle():
+    """統計分析批次API - 需要登入（一次返回全部面板，數據未變更時使用快取）"""
+    try:
+        from database import ml_data_manager
+        
+        bundle = dict(get_analytics_manager().get_analytics_bundle(**get_time_range_args(),
+                                                                   percentiles=get_percentile_args()))
+        bundle['equity'] = get_equity_curve_engine().get_equity_summary()
+        bundle['ml'] = ml_data_manager.get_ml_table_stats()
+        bundle['timestamp'] = datetime.now().isoformat()
+        return jsonify(bundle)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API analytics bundle error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/percentiles')
+@login_required
+def api_analytics_percentiles():
+    """分佈百分位數API - 需要登入（metric 必填，group_key 省略時為全部）"""
+    try:
+        result = get_analytics_manager().get_percentiles(
+            request.args.get('metric', 'final_pnl'),
+            request.args.get('group_key'),
+            request.args.get('dimension', 'symbol'),
+            get_percentile_args()
+        )
+        result['timestamp'] = datetime.now().isoformat()
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API analytics percentiles error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/distribution')
+@login_required
+def api_analytics_distribution():
+    """分組分佈API - 需要登入"""
+    try:
+        result = get_analytics_manager().get_distribution_stats(
+            request.args.get('metric', 'pnl_percentage'),
+            request.args.get('dimension', 'signal_type'),
+            get_percentile_args()
+        )
+        result['timestamp'] = datetime.now().isoformat()
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API analytics distribution error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/database')
+@login_required
+def api_analytics_database():
+    """資料庫統計API - 需要登入（exact=1 時逐行計數）"""
+    try:
+        stats = get_analytics_manager().get_database_stats(exact=request.args.get('exact') == '1')
+        stats['timestamp'] = datetime.now().isoformat()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"API analytics database error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/ml')
+@login_required
+def api_analytics_ml():
+    """ML數據API - 需要登入（表格統計與最近的信號品質評估，exact=1 時逐行計數）"""
     try:
-        if not os.path.exists(DB_PATH):
+        from database import ml_data_manager
+        
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        return jsonify({
+            'tables': ml_data_manager.get_ml_table_stats(exact=request.args.get('exact') == '1'),
+            'recent_signal_quality': [row.to_dict() for row in ml_data_manager.get_recent_signal_quality(limit)],
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"API analytics ml error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/fill-quality')
+@login_required
+def api_analytics_fill_quality():
+    """成交品質API - 需要登入（group_by 為 strategy 或 symbol，時間範圍按訂單執行時間）"""
+    try:
+        result = get_analytics_manager().get_fill_quality(request.args.get('group_by', 'strategy'),
+                                                          **get_time_range_args())
+        result['timestamp'] = datetime.now().isoformat()
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API analytics fill quality error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/risk-simulation')
+@login_required
+def api_analytics_risk_simulation():
+    """蒙地卡羅風險模擬API - 需要登入（simulations/horizon/position_fraction/ruin_loss/percentiles/seed）"""
+    try:
+        result = dict(get_analytics_manager().get_risk_simulation(
+            simulations=min(max(request.args.get('simulations', 10000, type=int), 1), 100000),
+            horizon=min(max(request.args.get('horizon', 100, type=int), 1), 5000),
+            position_fraction=request.args.get('position_fraction', 1.0, type=float),
+            ruin_loss=request.args.get('ruin_loss', 0.5, type=float),
+            percentiles=get_percentile_args((5, 25, 50, 75, 95)),
+            seed=request.args.get('seed', 0, type=int)
+        ))
+        result['timestamp'] = datetime.now().isoformat()
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"API analytics risk simulation error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/<panel>')
+@login_required
+def api_analytics_panel(panel):
+    """統計分析面板API - 需要登入（window 為 24h/7d/30d，或以 start_ts/end_ts 指定範圍）"""
+    if panel not in ANALYTICS_PANELS:
+        return jsonify({'error': f'未知的統計面板: {panel}'}), 404
+    try:
+        result = getattr(get_analytics_manager(), ANALYTICS_PANELS[panel])(**get_time_range_args())
+        result['timestamp'] = datetime.now().isoformat()
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API analytics {panel} error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def get_analytics_manager():
+    """統計分析管理器（讀取唯讀快照，首次使用時創建）"""
+    global _analytics_manager
+    if _analytics_manager is None:
+        from database.analytics_manager import create_analytics_manager
+        _analytics_manager = create_analytics_manager(DB_PATH, connection_provider=snapshot_manager.connect)
+    return _analytics_manager
+
+def get_equity_curve_engine():
+    """權益曲線引擎（讀取唯讀快照的檢查點，請求不寫入數據庫，首次使用時創建）"""
+    global _equity_curve_engine
+    if _equity_curve_engine is None:
+        from database.equity_curve import EquityCurveEngine
+        _equity_curve_engine = EquityCurveEngine(DB_PATH, connection_provider=snapshot_manager.connect)
+    return _equity_curve_engine
+
+def get_time_range_args():
+    """請求中的時間範圍參數"""
+    return {
+        'window': request.args.get('window'),
+        'start_ts': request.args.get('start_ts', type=float),
+        'end_ts': request.args.get('end_ts', type=float)
+    }
+
+def get_percentile_args(default=(50, 90, 99)):
+    """請求中的百分位參數（逗號分隔）"""
+    raw = request.args.get('percentiles')
+    if not raw:
+        return default
+    percentiles = tuple(float(p) for p in raw.split(','))
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError('百分位必須在 0 到 100 之間')
+    return percentiles
+
+def get_basic_stats_simple(exact=False):
+    """
+    獲取基本統計信息 - 簡化版
+    
+    計數讀取觸發器維護的表格計數與交易對聚合表（不隨表格大小增長），exact=True 時逐行計算
+    """
+    try:
+        from database.table_counts import get_row_counts
+        
+        if not snapshot_manager.has_data():
             return get_empty_stats()
             
-        with sqlite3.connect(DB_PATH) as conn:
+        with snapshot_manager.connect() as conn:
             cursor = conn.cursor()
             
-            # 基本統計
-            cursor.execute("SELECT COUNT(*) FROM signals_received")
-            total_signals = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM orders_executed")
-            total_orders = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM trading_results WHERE is_successful = 1")
-            successful_trades = cursor.fetchone()[0]
+            # 基本統計與ML統計
+            counts = get_row_counts(conn, ('signals_received', 'orders_executed', 'successful_trades',
+                                           'failed_trades', 'ml_features_v2', 'ml_signal_quality'), exact=exact)
+            total_signals = counts['signals_received']
+            total_orders = counts['orders_executed']
+            successful_trades = counts['successful_trades']
+            failed_trades = counts['failed_trades']
+            ml_features_count = counts['ml_features_v2']
+            ml_decisions_count = counts['ml_signal_quality']
             
-            cursor.execute("SELECT COUNT(*) FROM trading_results WHERE is_successful = 0")
-            failed_trades = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT SUM(final_pnl) FROM trading_results WHERE final_pnl IS NOT NULL")
-            total_pnl_result = cursor.fetchone()[0]
+            total_pnl_result = None
+            if not exact:
+                try:
+                    cursor.execute("SELECT TOTAL(pnl_sum), SUM(pnl_count) FROM analytics_symbol_stats")
+                    pnl_sum, pnl_count = cursor.fetchone()
+                    total_pnl_result = pnl_sum if pnl_count is not None else 0.0
+                except sqlite3.OperationalError:
+                    # 舊快照沒有聚合表
+                    pass
+            if total_pnl_result is None:
+                cursor.execute("SELECT SUM(final_pnl) FROM trading_results WHERE final_pnl IS NOT NULL")
+                total_pnl_result = cursor.fetchone()[0]
             total_pnl = total_pnl_result if total_pnl_result else 0.0
             
-            # ML統計
-            cursor.execute("SELECT COUNT(*) FROM ml_features_v2")
-            ml_features_count = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM ml_signal_quality")
-            ml_decisions_count = cursor.fetchone()[0]
-            
             # 計算勝率
             total_trades = successful_trades + failed_trades
             win_rate = (successful_trades / total_trades * 100) if total_trades > 0 else 0
@@ -174,81 +450,111 @@ def get_basic_stats_simple():
         logger.error(f"統計數據獲取錯誤: {str(e)}")
         return get_empty_stats()
 
+def get_source_signal_counts():
+    """按來源統計信號數量"""
+    try:
+        if not snapshot_manager.has_data():
+            return {}
+            
+        with snapshot_manager.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COALESCE(source_id, 'primary'), COUNT(*)
+                FROM signals_received
+                GROUP BY COALESCE(source_id, 'primary')
+            """)
+            return dict(cursor.fetchall())
+            
+    except sqlite3.OperationalError:
+        # 尚未進行多來源同步，沒有source_id欄位
+        return {}
+    except Exception as e:
+        logger.error(f"來源統計獲取錯誤: {str(e)}")
+        return {}
+
+def _query_recent_signals(connect, limit):
+    """查詢最近的信號及其主訂單結果"""
+    with connect() as conn:
+        cursor = conn.cursor()
+        
+        # 修改查詢：只取主訂單，並優先顯示交易結果
+        cursor.execute("""
+            SELECT 
+                sr.id, 
+                sr.signal_type, 
+                sr.symbol, 
+                sr.side, 
+                sr.timestamp,
+                CASE 
+                    WHEN tr.exit_method IS NOT NULL THEN tr.exit_method
+                    WHEN oe.status IS NOT NULL THEN oe.status
+                    ELSE 'PENDING'
+                END as final_status,
+                COALESCE(tr.final_pnl, 0) as final_pnl,
+                tr.is_successful
+            FROM signals_received sr
+            LEFT JOIN orders_executed oe ON sr.id = oe.signal_id 
+                AND oe.client_order_id NOT LIKE '%T'  -- 排除止盈單
+                AND oe.client_order_id NOT LIKE '%S'  -- 排除止損單
+            LEFT JOIN trading_results tr ON oe.id = tr.order_id
+            ORDER BY sr.timestamp DESC
+            LIMIT ?
+        """, (limit,))
+        return cursor.fetchall()
+
 def get_recent_signals_simple(limit=5):
     """獲取最近的信號 - 只顯示主要交易結果"""
     try:
-        if not os.path.exists(DB_PATH):
+        if not snapshot_manager.has_data():
             return []
             
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
+        rows = _query_recent_signals(hot_replica.connect, limit) if hot_replica.enabled else []
+        if len(rows) < limit:
+            # 記憶體副本只保存最近數天，不足時讀取完整快照
+            rows = _query_recent_signals(snapshot_manager.connect, limit)
+        
+        results = []
+        for row in rows:
+            signal_id, signal_type, symbol, side, timestamp, final_status, final_pnl, is_successful = row
             
-            # 修改查詢：只取主訂單，並優先顯示交易結果
-            cursor.execute("""
-                SELECT 
-                    sr.id, 
-                    sr.signal_type, 
-                    sr.symbol, 
-                    sr.side, 
-                    sr.timestamp,
-                    CASE 
-                        WHEN tr.exit_method IS NOT NULL THEN tr.exit_method
-                        WHEN oe.status IS NOT NULL THEN oe.status
-                        ELSE 'PENDING'
-                    END as final_status,
-                    COALESCE(tr.final_pnl, 0) as final_pnl,
-                    tr.is_successful
-                FROM signals_received sr
-                LEFT JOIN orders_executed oe ON sr.id = oe.signal_id 
-                    AND oe.client_order_id NOT LIKE '%T'  -- 排除止盈單
-                    AND oe.client_order_id NOT LIKE '%S'  -- 排除止損單
-                LEFT JOIN trading_results tr ON oe.id = tr.order_id
-                ORDER BY sr.timestamp DESC
-                LIMIT ?
-            """, (limit,))
+            # 轉換時間戳
+            try:
+                dt = datetime.fromtimestamp(timestamp)
+                formatted_time = dt.strftime('%Y-%m-%d %H:%M:%S')
+            except:
+                formatted_time = str(timestamp)
             
-            results = []
-            for row in cursor.fetchall():
-                signal_id, signal_type, symbol, side, timestamp, final_status, final_pnl, is_successful = row
-                
-                # 轉換時間戳
-                try:
-                    dt = datetime.fromtimestamp(timestamp)
-                    formatted_time = dt.strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    formatted_time = str(timestamp)
-                
-                # 轉換狀態顯示 - 保持原有的TP/SL顯示
-                if final_status == 'TAKE_PROFIT':
-                    display_status = 'TP_FILLED'
-                    result_icon = '✅'
-                elif final_status == 'STOP_LOSS':
-                    display_status = 'SL_FILLED' 
-                    result_icon = '❌'
-                elif final_status == 'FILLED':
-                    display_status = 'FILLED'
-                    result_icon = '✅' if is_successful else '❌'
-                elif final_status == 'CANCELED':
-                    display_status = 'CANCELED'
-                    result_icon = '⏸️'
-                else:
-                    display_status = final_status
-                    result_icon = '🔄'
-                
-                results.append({
-                    'id': signal_id,
-                    'signal_type': signal_type,
-                    'symbol': symbol,
-                    'side': side,
-                    'timestamp': formatted_time,
-                    'order_status': display_status,
-                    'final_pnl': final_pnl,
-                    'is_successful': is_successful,
-                    'result_icon': result_icon
-                })
-                
-            return results
+            # 轉換狀態顯示 - 保持原有的TP/SL顯示
+            if final_status == 'TAKE_PROFIT':
+                display_status = 'TP_FILLED'
+                result_icon = '✅'
+            elif final_status == 'STOP_LOSS':
+                display_status = 'SL_FILLED' 
+                result_icon = '❌'
+            elif final_status == 'FILLED':
+                display_status = 'FILLED'
+                result_icon = '✅' if is_successful else '❌'
+            elif final_status == 'CANCELED':
+                display_status = 'CANCELED'
+                result_icon = '⏸️'
+            else:
+                display_status = final_status
+                result_icon = '🔄'
+            
+            results.append({
+                'id': signal_id,
+                'signal_type': signal_type,
+                'symbol': symbol,
+                'side': side,
+                'timestamp': formatted_time,
+                'order_status': display_status,
+                'final_pnl': final_pnl,
+                'is_successful': is_successful,
+                'result_icon': result_icon
+            })
             
+        return results
+        
     except Exception as e:
         logger.error(f"最近信號獲取錯誤: {str(e)}")
         return []
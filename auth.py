@@ -4,11 +4,13 @@
 提供基於session的簡單認證機制
 =============================================================================
 """
+import os
+import hmac
 import hashlib
 import secrets
 from datetime import datetime
 from functools import wraps
-from flask import session, request, redirect, url_for, flash, render_template_string
+from flask import session, request, redirect, url_for, flash, render_template_string, jsonify
 
 # 簡單的用戶憑證配置 (生產環境建議使用環境變量)
 USERS = {
@@ -34,6 +36,22 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def token_required(f):
+    """API令牌裝飾器 - 用於交易主機推送等機器對機器接口"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected_token = os.environ.get('INGEST_API_TOKEN')
+        if not expected_token:
+            # 未配置令牌時關閉接口，避免無認證寫入
+            return jsonify({'success': False, 'error': 'Ingest API disabled'}), 503
+        
+        auth_header = request.headers.get('Authorization', '')
+        provided_token = auth_header[7:] if auth_header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(provided_token.encode(), expected_token.encode()):
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 def setup_auth_routes(app):
     """設置認證相關路由"""
     
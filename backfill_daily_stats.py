@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+每日統計回填工具
+並行重建指定日期範圍（UTC）的 daily_stats
+=============================================================================
+用法:
+    python backfill_daily_stats.py                       # 重建最近30天
+    python backfill_daily_stats.py 2025-07-01 2025-07-31
+    python backfill_daily_stats.py 2025-07-01 2025-07-31 --workers 8
+"""
+import sys
+import logging
+from datetime import datetime, timedelta, timezone
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """主程式"""
+    args = sys.argv[1:]
+    workers = 4
+    if '--workers' in args:
+        index = args.index('--workers')
+        workers = int(args[index + 1])
+        del args[index:index + 2]
+
+    today = datetime.now(timezone.utc).date()
+    start_date = args[0] if len(args) > 0 else (today - timedelta(days=29)).isoformat()
+    end_date = args[1] if len(args) > 1 else today.isoformat()
+
+    from database import trading_data_manager
+
+    started = datetime.now()
+    result = trading_data_manager.backfill_daily_stats(start_date, end_date, max_workers=workers)
+    duration = (datetime.now() - started).total_seconds()
+
+    print(f"✅ 每日統計回填完成: {start_date} ~ {end_date}")
+    print(f"   處理天數: {result['days_processed']}，有數據: {result['days_written']}")
+    print(f"   耗時: {duration:.2f} 秒（{workers} 線程）")
+
+if __name__ == '__main__':
+    main()
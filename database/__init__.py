@@ -1,12 +1,17 @@
 """
 Database模組初始化 - 監控主機版本
 統一管理所有數據管理器實例
+管理器實例在首次訪問時創建：只導入子模組（如交易主機上的同步客戶端使用 database.signal_payload）
+不會打開、建立或遷移 DB_PATH 的數據庫
 =============================================================================
 """
 import os
+import threading
 from .trading_data_manager import TradingDataManager
 from .ml_data_manager import MLDataManager
 from .analytics_manager import AnalyticsManager
+from .archive_manager import ArchiveManager
+from .equity_curve import EquityCurveEngine
 
 # 獲取資料庫路徑
 def get_database_path():
@@ -14,24 +19,50 @@ def get_database_path():
     data_dir = os.path.join(os.getcwd(), 'data')
     return os.path.join(data_dir, 'trading_signals.db')
 
-# 創建統一的管理器實例
+# 統一的管理器實例使用的數據庫
 DB_PATH = get_database_path()
 
-# 核心交易數據管理器
-trading_data_manager = TradingDataManager(DB_PATH)
+# 寫後模式：MONITOR_WRITE_BEHIND=1 時 record_* 由共用寫入線程群組提交
+WRITE_BEHIND = os.environ.get('MONITOR_WRITE_BEHIND', '0') == '1'
 
-# ML數據管理器
-ml_data_manager = MLDataManager(DB_PATH)
+# 管理器實例名稱 -> 創建函數
+_MANAGER_FACTORIES = {
+    # 核心交易數據管理器
+    'trading_data_manager': lambda: TradingDataManager(DB_PATH, write_behind=WRITE_BEHIND),
+    # ML數據管理器
+    'ml_data_manager': lambda: MLDataManager(DB_PATH, write_behind=WRITE_BEHIND),
+    # 冷數據歸檔管理器
+    'archive_manager': lambda: ArchiveManager(DB_PATH),
+    # 統計分析管理器（時間範圍查詢涉及已歸檔月份時合併歸檔分區）
+    'analytics_manager': lambda: AnalyticsManager(DB_PATH, archive_manager=__getattr__('archive_manager')),
+    # 權益曲線引擎（重放時合併歸檔分區）
+    'equity_curve_engine': lambda: EquityCurveEngine(DB_PATH, archive_manager=__getattr__('archive_manager'))
+}
+_managers_lock = threading.RLock()
 
-# 統計分析管理器
-analytics_manager = AnalyticsManager(DB_PATH)
+# 導入子模組時設置的同名屬性會遮蔽實例，刪除後由 __getattr__ 創建實例（子模組仍在 sys.modules 中）
+del trading_data_manager, ml_data_manager, analytics_manager, archive_manager
+
+def __getattr__(name):
+    """首次訪問管理器實例時創建"""
+    factory = _MANAGER_FACTORIES.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _managers_lock:
+        if name not in globals():
+            globals()[name] = factory()
+        return globals()[name]
 
 # 統一導出接口
 __all__ = [
     'trading_data_manager',
-    'ml_data_manager', 
+    'ml_data_manager',
     'analytics_manager',
+    'archive_manager',
+    'equity_curve_engine',
     'TradingDataManager',
     'MLDataManager',
-    'AnalyticsManager'
+    'AnalyticsManager',
+    'ArchiveManager',
+    'EquityCurveEngine'
 ]
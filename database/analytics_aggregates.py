@@ -0,0 +1,423 @@
+"""
+統計分析聚合表模組
+勝率、執行率、交易對及時段統計以聚合表保存，由觸發器按單行貢獻在信號、訂單、交易結果
+寫入、更新（含同步UPSERT）及刪除（含歸檔）時增量維護，分析查詢只需讀取少量聚合行
+=============================================================================
+用法:
+    python -m database.analytics_aggregates --rebuild [資料庫路徑]
+"""
+import os
+import sys
+import sqlite3
+import logging
+from typing import Dict, Optional
+from .time_buckets import bucket_sql, init_time_buckets
+from .quantile_sketches import DISTRIBUTION_TABLE, SKETCH_CONTRIBUTIONS, init_sketch_bounds
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 訂單狀態分類（與分析查詢一致）
+EXECUTED_STATUSES = "('FILLED', 'TP_FILLED', 'SL_FILLED')"
+FAILED_STATUSES = "('CANCELED', 'CANCELLED', 'EXPIRED')"
+
+# opposite 為NULL時的鍵值（唯一鍵中的NULL互不衝突，無法UPSERT）
+NULL_OPPOSITE = -1
+
+AGGREGATE_TABLES = {
+    # 信號類型勝率：signals ⋈ orders ⋈ results
+    'analytics_signal_type_stats': '''
+        CREATE TABLE IF NOT EXISTS analytics_signal_type_stats (
+            signal_type TEXT PRIMARY KEY,
+            trades INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            pnl_sum REAL NOT NULL DEFAULT 0,
+            pnl_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    # 策略組合執行率：signals ⋈ orders
+    'analytics_strategy_stats': '''
+        CREATE TABLE IF NOT EXISTS analytics_strategy_stats (
+            signal_type TEXT NOT NULL,
+            opposite INTEGER NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            executed_orders INTEGER NOT NULL DEFAULT 0,
+            price_gap_sum REAL NOT NULL DEFAULT 0,
+            price_gap_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (signal_type, opposite)
+        )
+    ''',
+    # 時段統計：signals ⟕ orders ⟕ results，按交易時區的星期與小時（見 time_buckets）
+    'analytics_time_stats': '''
+        CREATE TABLE IF NOT EXISTS analytics_time_stats (
+            weekday INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            signal_rows INTEGER NOT NULL DEFAULT 0,
+            completed_trades INTEGER NOT NULL DEFAULT 0,
+            successful_trades INTEGER NOT NULL DEFAULT 0,
+            pnl_sum REAL NOT NULL DEFAULT 0,
+            pnl_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (weekday, hour)
+        )
+    ''',
+    # 交易對表現：trading_results
+    'analytics_symbol_stats': '''
+        CREATE TABLE IF NOT EXISTS analytics_symbol_stats (
+            symbol TEXT PRIMARY KEY,
+            trades INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            pnl_sum REAL NOT NULL DEFAULT 0,
+            pnl_count INTEGER NOT NULL DEFAULT 0,
+            holding_sum REAL NOT NULL DEFAULT 0,
+            holding_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    # 訂單狀態計數：orders_executed
+    'analytics_order_stats': '''
+        CREATE TABLE IF NOT EXISTS analytics_order_stats (
+            status TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    # 盈虧、持倉時間與執行延遲的分位數草圖桶計數（見 quantile_sketches）
+    'analytics_distribution_buckets': DISTRIBUTION_TABLE
+}
+
+# ----------------------------------------------------------------------
+# 聚合貢獻：{signals}/{orders}/{results} 為各表的行來源，{sign} 為 1/-1
+# 完整重建時以基礎表套用一次；觸發器中將變更行所屬表的來源替換為該行（OLD/NEW），
+# 結果即為該行對聚合的增減（只涉及含該行的聯結行，不重新計算整個信號）
+# ----------------------------------------------------------------------
+
+_SIGNAL_TYPE_CONTRIBUTION = '''
+    INSERT INTO analytics_signal_type_stats (signal_type, trades, wins, pnl_sum, pnl_count)
+    SELECT s.signal_type,
+           {sign} * COUNT(*),
+           {sign} * SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END),
+           {sign} * TOTAL(r.final_pnl),
+           {sign} * COUNT(r.final_pnl)
+    FROM {signals} s
+    JOIN {orders} o ON o.signal_id = s.id
+    JOIN {results} r ON r.order_id = o.id
+    GROUP BY s.signal_type
+    ON CONFLICT(signal_type) DO UPDATE SET
+        trades = trades + excluded.trades,
+        wins = wins + excluded.wins,
+        pnl_sum = pnl_sum + excluded.pnl_sum,
+        pnl_count = pnl_count + excluded.pnl_count;
+'''
+
+_STRATEGY_CONTRIBUTION = f'''
+    INSERT INTO analytics_strategy_stats (signal_type, opposite, orders, executed_orders, price_gap_sum, price_gap_count)
+    SELECT s.signal_type,
+           COALESCE(s.opposite, {NULL_OPPOSITE}),
+           {{sign}} * COUNT(*),
+           {{sign}} * SUM(CASE WHEN o.status IN {EXECUTED_STATUSES} THEN 1 ELSE 0 END),
+           {{sign}} * TOTAL(ABS(s.close_price - o.price) / s.close_price),
+           {{sign}} * COUNT(ABS(s.close_price - o.price) / s.close_price)
+    FROM {{signals}} s
+    JOIN {{orders}} o ON o.signal_id = s.id
+    GROUP BY 1, 2
+    ON CONFLICT(signal_type, opposite) DO UPDATE SET
+        orders = orders + excluded.orders,
+        executed_orders = executed_orders + excluded.executed_orders,
+        price_gap_sum = price_gap_sum + excluded.price_gap_sum,
+        price_gap_count = price_gap_count + excluded.price_gap_count;
+'''
+
+_SYMBOL_CONTRIBUTION = '''
+    INSERT INTO analytics_symbol_stats (symbol, trades, wins, pnl_sum, pnl_count, holding_sum, holding_count)
+    SELECT r.symbol,
+           {sign} * COUNT(*),
+           {sign} * SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END),
+           {sign} * TOTAL(r.final_pnl),
+           {sign} * COUNT(r.final_pnl),
+           {sign} * TOTAL(r.holding_time_minutes),
+           {sign} * COUNT(r.holding_time_minutes)
+    FROM {results} r
+    GROUP BY r.symbol
+    ON CONFLICT(symbol) DO UPDATE SET
+        trades = trades + excluded.trades,
+        wins = wins + excluded.wins,
+        pnl_sum = pnl_sum + excluded.pnl_sum,
+        pnl_count = pnl_count + excluded.pnl_count,
+        holding_sum = holding_sum + excluded.holding_sum,
+        holding_count = holding_count + excluded.holding_count;
+'''
+
+_ORDER_STATUS_CONTRIBUTION = '''
+    INSERT INTO analytics_order_stats (status, orders)
+    SELECT COALESCE(o.status, ''), {sign} * COUNT(*)
+    FROM {orders} o
+    GROUP BY 1
+    ON CONFLICT(status) DO UPDATE SET orders = orders + excluded.orders;
+'''
+
+# ----------------------------------------------------------------------
+# 時段統計：signals ⟕ orders ⟕ results 的行數不是各聯結行之和
+# （沒有訂單的信號、沒有結果的訂單各佔一行），訂單與結果的增減按同一信號/訂單下是否還有其他行修正
+# 信號本身的增減以時間戳計算分桶，不依賴分桶觸發器與聚合觸發器的執行順序；
+# 訂單與結果寫入時信號的分桶欄位已由分桶觸發器計算，直接讀取
+# ----------------------------------------------------------------------
+
+_TIME_UPSERT = '''
+    ON CONFLICT(weekday, hour) DO UPDATE SET
+        signal_rows = signal_rows + excluded.signal_rows,
+        completed_trades = completed_trades + excluded.completed_trades,
+        successful_trades = successful_trades + excluded.successful_trades,
+        pnl_sum = pnl_sum + excluded.pnl_sum,
+        pnl_count = pnl_count + excluded.pnl_count;
+'''
+
+_TIME_CONTRIBUTION = f'''
+    INSERT INTO analytics_time_stats (weekday, hour, signal_rows, completed_trades, successful_trades, pnl_sum, pnl_count)
+    SELECT {bucket_sql('s.timestamp')['bucket_weekday']},
+           {bucket_sql('s.timestamp')['bucket_hour']},
+           {{sign}} * COUNT(*),
+           {{sign}} * COUNT(r.id),
+           {{sign}} * SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END),
+           {{sign}} * TOTAL(r.final_pnl),
+           {{sign}} * COUNT(r.final_pnl)
+    FROM {{signals}} s
+    LEFT JOIN orders_executed o ON o.signal_id = s.id
+    LEFT JOIN trading_results r ON r.order_id = o.id
+    GROUP BY 1, 2
+    {_TIME_UPSERT}'''
+
+# 訂單：佔 MAX(結果數, 1) 行，信號原本沒有其他訂單時取代信號本身的一行
+_TIME_ORDER_CONTRIBUTION = f'''
+    INSERT INTO analytics_time_stats (weekday, hour, signal_rows, completed_trades, successful_trades, pnl_sum, pnl_count)
+    SELECT s.bucket_weekday, s.bucket_hour,
+           {{sign}} * (MAX(COUNT(r.id), 1) - NOT EXISTS (
+               SELECT 1 FROM orders_executed x WHERE x.signal_id = s.id AND x.id IS NOT o.id)),
+           {{sign}} * COUNT(r.id),
+           {{sign}} * SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END),
+           {{sign}} * TOTAL(r.final_pnl),
+           {{sign}} * COUNT(r.final_pnl)
+    FROM {{orders}} o
+    JOIN signals_received s ON s.id = o.signal_id
+    LEFT JOIN trading_results r ON r.order_id = o.id
+    GROUP BY o.id
+    {_TIME_UPSERT}'''
+
+# 結果：訂單原本沒有其他結果時取代訂單本身的一行
+_TIME_RESULT_CONTRIBUTION = f'''
+    INSERT INTO analytics_time_stats (weekday, hour, signal_rows, completed_trades, successful_trades, pnl_sum, pnl_count)
+    SELECT s.bucket_weekday, s.bucket_hour,
+           {{sign}} * EXISTS (SELECT 1 FROM trading_results x WHERE x.order_id = r.order_id AND x.id IS NOT r.id),
+           {{sign}},
+           {{sign}} * (CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END),
+           {{sign}} * COALESCE(r.final_pnl, 0),
+           {{sign}} * (r.final_pnl IS NOT NULL)
+    FROM {{results}} r
+    JOIN orders_executed o ON o.id = r.order_id
+    JOIN signals_received s ON s.id = o.signal_id
+    WHERE 1
+    {_TIME_UPSERT}'''
+
+# 完整重建套用的貢獻；各表變更時套用引用該表來源佔位符的貢獻
+_REBUILD_CONTRIBUTIONS = (_SIGNAL_TYPE_CONTRIBUTION, _STRATEGY_CONTRIBUTION, _TIME_CONTRIBUTION,
+                          _SYMBOL_CONTRIBUTION, _ORDER_STATUS_CONTRIBUTION) + SKETCH_CONTRIBUTIONS
+_CONTRIBUTIONS = _REBUILD_CONTRIBUTIONS + (_TIME_ORDER_CONTRIBUTION, _TIME_RESULT_CONTRIBUTION)
+
+# 各表的來源佔位符、觸發器簡稱及貢獻讀取的欄位（更新只改其他欄位時不觸發）
+_SOURCES = {
+    'signals_received': ('signals', 'signal', ('timestamp', 'signal_type', 'opposite', 'close_price')),
+    'orders_executed': ('orders', 'order', ('signal_id', 'symbol', 'status', 'price', 'execution_delay_ms')),
+    'trading_results': ('results', 'result', ('order_id', 'symbol', 'is_successful', 'final_pnl',
+                                              'pnl_percentage', 'holding_time_minutes'))
+}
+
+def _sources(**rows: str) -> Dict[str, str]:
+    """各佔位符的行來源：預設為基礎表"""
+    sources = {placeholder: table_name for table_name, (placeholder, _, _) in _SOURCES.items()}
+    sources.update(rows)
+    return sources
+
+# 行增減經由各表的視圖 INSTEAD OF 觸發器執行：貢獻語句每表只保存一次，表觸發器只寫入（正負號, 行ID），
+# 貢獻以該ID限定所屬表的來源；變更前的貢獻在 BEFORE 觸發器中減去，每個新連接需要解析的結構保持精簡
+CHANGE_VIEWS = {
+    f'analytics_{short_name}_changes': f'''
+    CREATE VIEW IF NOT EXISTS analytics_{short_name}_changes AS
+    SELECT NULL AS sign, NULL AS id
+    WHERE 0
+'''
+    for _, short_name, _ in _SOURCES.values()
+}
+
+_BUMP_VERSION = '''
+                UPDATE analytics_data_version SET version = version + 1 WHERE id = 1;'''
+
+def _build_triggers() -> Dict[str, str]:
+    """生成觸發器語句：名稱 -> CREATE TRIGGER"""
+    triggers = {}
+    for table_name, (placeholder, short_name, columns) in _SOURCES.items():
+        view = f'analytics_{short_name}_changes'
+        sources = _sources(**{placeholder: f'(SELECT * FROM {table_name} WHERE id = NEW.id)'})
+        statements = ''.join(template.format(sign='NEW.sign', **sources)
+                             for template in _CONTRIBUTIONS if '{' + placeholder + '}' in template)
+        triggers[f'trg_analytics_{short_name}_changes'] = f'''
+            CREATE TRIGGER IF NOT EXISTS trg_analytics_{short_name}_changes
+            INSTEAD OF INSERT ON {view}
+            BEGIN
+                {statements}
+            END
+        '''
+
+        # 插入與刪除（含歸檔）：加上/減去該行的貢獻，同時遞增數據版本
+        triggers[f'trg_analytics_{short_name}_insert'] = f'''
+            CREATE TRIGGER IF NOT EXISTS trg_analytics_{short_name}_insert
+            AFTER INSERT ON {table_name}
+            BEGIN
+                INSERT INTO {view} VALUES (1, NEW.id);{_BUMP_VERSION}
+            END
+        '''
+        triggers[f'trg_analytics_{short_name}_before_delete'] = f'''
+            CREATE TRIGGER IF NOT EXISTS trg_analytics_{short_name}_before_delete
+            BEFORE DELETE ON {table_name}
+            BEGIN
+                INSERT INTO {view} VALUES (-1, OLD.id);{_BUMP_VERSION}
+            END
+        '''
+
+        # 更新：只在貢獻讀取的欄位實際變更時（同步UPSERT重寫相同值時跳過）減去舊行、加上新行
+        changed = ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in columns)
+        for timing, sign, row in (('before', -1, 'OLD'), ('after', 1, 'NEW')):
+            triggers[f'trg_analytics_{short_name}_{timing}_update'] = f'''
+            CREATE TRIGGER IF NOT EXISTS trg_analytics_{short_name}_{timing}_update
+            {timing.upper()} UPDATE OF {', '.join(columns)} ON {table_name}
+            WHEN {changed}
+            BEGIN
+                INSERT INTO {view} VALUES ({sign}, {row}.id);
+            END
+        '''
+    return triggers
+
+ANALYTICS_TRIGGERS = _build_triggers()
+
+# 數據版本：基礎表任何寫入、更新或刪除都遞增，供分析結果快取判斷失效
+# （插入與刪除在聚合觸發器中遞增；更新可能只改聚合以外的欄位，另以觸發器遞增）
+DATA_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS analytics_data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+DATA_VERSION_TRIGGERS = {
+    f'trg_analytics_version_{short_name}_update': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analytics_version_{short_name}_update
+        AFTER UPDATE ON {table_name}
+        BEGIN{_BUMP_VERSION}
+        END
+    '''
+    for table_name, (_, short_name, _) in _SOURCES.items()
+}
+
+# 舊版觸發器與視圖（按整個信號先減後加、數據版本獨立的插入/刪除觸發器），升級時刪除
+_LEGACY_TRIGGERS = ('trg_analytics_order_after_delete', 'trg_analytics_result_after_delete') + tuple(
+    f'trg_analytics_version_{short_name}_{event}'
+    for short_name in ('signal', 'order', 'result') for event in ('insert', 'delete')
+)
+_LEGACY_VIEWS = ('analytics_signal_delta',)
+
+def create_triggers(cursor: sqlite3.Cursor, triggers: Dict[str, str]) -> bool:
+    """
+    建立觸發器，定義與現有同名觸發器不同時（升級後）刪除重建
+
+    Returns:
+        bool: 是否替換了既有觸發器（聚合需要重建）
+    """
+    existing = dict(cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall())
+    replaced = False
+    for name, create_sql in triggers.items():
+        # sqlite_master 保存的語句不含 IF NOT EXISTS
+        expected = create_sql.strip().replace('CREATE TRIGGER IF NOT EXISTS', 'CREATE TRIGGER', 1)
+        if name in existing and existing[name].strip() != expected:
+            cursor.execute(f"DROP TRIGGER {name}")
+            replaced = True
+        cursor.execute(create_sql)
+    return replaced
+
+def init_analytics_aggregates(conn: sqlite3.Connection) -> bool:
+    """
+    建立聚合表與觸發器，聚合表為新建、觸發器定義變更或時段分桶的時區變更時從現有數據重建
+
+    Returns:
+        bool: 是否執行了重建
+    """
+    buckets_changed = init_time_buckets(conn)
+    buckets_changed = init_sketch_bounds(conn) or buckets_changed
+    cursor = conn.cursor()
+    existing = {row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'analytics_%'"
+    )}
+
+    for create_sql in AGGREGATE_TABLES.values():
+        cursor.execute(create_sql)
+    for name in _LEGACY_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for name in _LEGACY_VIEWS:
+        cursor.execute(f"DROP VIEW IF EXISTS {name}")
+    for create_sql in CHANGE_VIEWS.values():
+        cursor.execute(create_sql)
+    triggers_replaced = create_triggers(cursor, ANALYTICS_TRIGGERS)
+
+    cursor.execute(DATA_VERSION_TABLE)
+    cursor.execute("INSERT OR IGNORE INTO analytics_data_version (id, version) VALUES (1, 0)")
+    for create_sql in DATA_VERSION_TRIGGERS.values():
+        cursor.execute(create_sql)
+
+    if set(AGGREGATE_TABLES) <= existing and not buckets_changed and not triggers_replaced:
+        return False
+
+    rebuild_analytics_aggregates(conn)
+    return True
+
+def rebuild_analytics_aggregates(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    從基礎表完整重建所有聚合表（在調用方的事務中執行）
+
+    Returns:
+        Dict: 各聚合表的行數
+    """
+    cursor = conn.cursor()
+    for table_name in AGGREGATE_TABLES:
+        cursor.execute(f"DELETE FROM {table_name}")
+
+    for template in _REBUILD_CONTRIBUTIONS:
+        cursor.execute(template.format(sign=1, **_sources()))
+
+    counts = {
+        table_name: cursor.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        for table_name in AGGREGATE_TABLES
+    }
+    logger.info(f"統計聚合表已重建: {counts}")
+    return counts
+
+def get_data_version(conn: sqlite3.Connection) -> Optional[int]:
+    """讀取數據版本，未建立版本表時返回None（不可快取）"""
+    try:
+        row = conn.execute("SELECT version FROM analytics_data_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    positional = [a for a in args if not a.startswith('--')]
+    db_path = positional[0] if positional else os.path.join('data', 'trading_signals.db')
+
+    if '--rebuild' in args:
+        with sqlite3.connect(db_path, timeout=30) as conn:
+            init_analytics_aggregates(conn)
+            counts = rebuild_analytics_aggregates(conn)
+        print(f"✅ 統計聚合表已重建: {counts}")
+    else:
+        print(__doc__)
+
+if __name__ == '__main__':
+    main()
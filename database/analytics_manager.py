@@ -1,38 +1,224 @@
 """
 統計分析數據管理模組
 負責勝率統計、策略分析和資料庫統計功能
+勝率、執行率、交易對與時段統計讀取觸發器維護的聚合表（見 analytics_aggregates），
+指定時間窗口時改以時間戳索引範圍查詢，常用窗口的勝率由記憶體滾動統計提供
 =============================================================================
 """
 import sqlite3
 import os
+import time
 import logging
+import threading
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional, Tuple
+from .analytics_aggregates import EXECUTED_STATUSES, FAILED_STATUSES, NULL_OPPOSITE, get_data_version
+from .rolling_windows import ANALYTICS_WINDOWS, RollingWindowStats, resolve_time_range
+from .risk_simulation import RiskSimulator
+from .time_buckets import bucket_sql
+from .quantile_sketches import DIMENSIONS, METRICS, RELATIVE_ACCURACY, load_sketches, merge_all, summarize
+from .table_counts import get_row_counts
 
 # 設置logger
 logger = logging.getLogger(__name__)
 
+# 時段分桶欄位（舊歸檔分區缺少欄位時按時間戳計算）
+_SIGNAL_BUCKETS = bucket_sql('s.timestamp')
+
+# 指定時間範圍時代替聚合表的子查詢（欄位與聚合表相同），各以所屬表的時間戳索引範圍掃描：
+# 勝率與交易對按結果時間、執行率按訂單執行時間、時段統計按信號時間
+_WINDOW_SOURCES = {
+    'analytics_signal_type_stats': """
+        SELECT s.signal_type,
+               COUNT(*) AS trades,
+               SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END) AS wins,
+               TOTAL(r.final_pnl) AS pnl_sum,
+               COUNT(r.final_pnl) AS pnl_count
+        FROM trading_results r
+        JOIN orders_executed o ON r.order_id = o.id
+        JOIN signals_received s ON o.signal_id = s.id
+        WHERE r.result_timestamp >= :start AND r.result_timestamp < :end
+        GROUP BY s.signal_type
+    """,
+    'analytics_strategy_stats': f"""
+        SELECT s.signal_type,
+               COALESCE(s.opposite, {NULL_OPPOSITE}) AS opposite,
+               COUNT(*) AS orders,
+               SUM(CASE WHEN o.status IN {EXECUTED_STATUSES} THEN 1 ELSE 0 END) AS executed_orders,
+               TOTAL(ABS(s.close_price - o.price) / s.close_price) AS price_gap_sum,
+               COUNT(ABS(s.close_price - o.price) / s.close_price) AS price_gap_count
+        FROM orders_executed o
+        JOIN signals_received s ON s.id = o.signal_id
+        WHERE o.execution_timestamp >= :start AND o.execution_timestamp < :end
+        GROUP BY 1, 2
+    """,
+    'analytics_time_stats': f"""
+        SELECT COALESCE(s.bucket_weekday, {_SIGNAL_BUCKETS['bucket_weekday']}) AS weekday,
+               COALESCE(s.bucket_hour, {_SIGNAL_BUCKETS['bucket_hour']}) AS hour,
+               COUNT(*) AS signal_rows,
+               COUNT(r.id) AS completed_trades,
+               SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END) AS successful_trades,
+               TOTAL(r.final_pnl) AS pnl_sum,
+               COUNT(r.final_pnl) AS pnl_count
+        FROM signals_received s
+        LEFT JOIN orders_executed o ON s.id = o.signal_id
+        LEFT JOIN trading_results r ON o.id = r.order_id
+        WHERE s.timestamp >= :start AND s.timestamp < :end
+        GROUP BY 1, 2
+    """,
+    'analytics_symbol_stats': """
+        SELECT symbol,
+               COUNT(*) AS trades,
+               SUM(CASE WHEN is_successful = 1 THEN 1 ELSE 0 END) AS wins,
+               TOTAL(final_pnl) AS pnl_sum,
+               COUNT(final_pnl) AS pnl_count,
+               TOTAL(holding_time_minutes) AS holding_sum,
+               COUNT(holding_time_minutes) AS holding_count
+        FROM trading_results
+        WHERE result_timestamp >= :start AND result_timestamp < :end
+        GROUP BY symbol
+    """,
+    'analytics_order_stats': """
+        SELECT COALESCE(status, '') AS status, COUNT(*) AS orders
+        FROM orders_executed
+        WHERE execution_timestamp >= :start AND execution_timestamp < :end
+        GROUP BY 1
+    """
+}
+
+# 成交品質統計（訂單寫入時計算的欄位，見 fill_quality），orders_executed 別名為 o
+_FILL_QUALITY_METRICS = """
+    COUNT(*) AS orders,
+    COUNT(o.slippage) AS priced_orders,
+    AVG(o.slippage) AS avg_slippage,
+    MAX(o.slippage) AS worst_slippage,
+    AVG(o.price_gap) AS avg_price_gap,
+    AVG(ABS(o.price_gap)) AS avg_abs_price_gap,
+    AVG(o.execution_delay_ms) AS avg_delay_ms,
+    MAX(o.execution_delay_ms) AS max_delay_ms,
+    AVG(o.tp_distance) AS avg_tp_distance,
+    AVG(o.sl_distance) AS avg_sl_distance
+"""
+
+# 成交品質的分組方式 -> (分組欄位, 分組表達式, 來源)
+FILL_QUALITY_GROUPS = {
+    'strategy': (('signal_type', 'opposite'),
+                 f"s.signal_type, COALESCE(s.opposite, {NULL_OPPOSITE})",
+                 "orders_executed o JOIN signals_received s ON s.id = o.signal_id"),
+    'symbol': (('symbol',), "o.symbol", "orders_executed o")
+}
+
+# 批次統計結果按數據版本快取；相對當前時間的窗口（window 且未指定 end_ts）另按秒數過期
+BUNDLE_WINDOW_CACHE_SECONDS = float(os.environ.get('MONITOR_ANALYTICS_WINDOW_CACHE_SECONDS', '60'))
+_BUNDLE_CACHE_SIZE = 32
+
+# 批次結果包含的分佈：指標 -> 分組維度
+BUNDLE_DISTRIBUTIONS = {
+    'pnl_percentage': 'signal_type',
+    'holding_time_minutes': 'signal_type',
+    'execution_delay_ms': 'symbol'
+}
+
 class AnalyticsManager:
     """統計分析管理類"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, connection_provider: Optional[Callable] = None,
+                 archive_manager=None):
+        """
+        Args:
+            db_path: 資料庫路徑
+            connection_provider: 返回連接上下文管理器的函數（如唯讀快照或記憶體副本的 connect），
+                以 time_range 參數傳入查詢需要的記錄時間範圍（None 為只讀取聚合表），預設每次查詢打開 db_path
+            archive_manager: 冷數據歸檔管理器，時間範圍涉及已歸檔月份時合併查詢歸檔分區
+                （只在未指定 connection_provider 時使用）
+        """
         self.db_path = db_path
+        self.connection_provider = connection_provider
+        self.archive_manager = archive_manager
+        # 滾動統計與風險模擬逐行讀取記錄，需要全部記錄的連接
+        all_rows = partial(self._connect, all_rows=True)
+        # 常用窗口（24h/7d/30d）的滾動勝率統計，首次查詢時載入
+        self.rolling = RollingWindowStats(all_rows)
+        # 蒙地卡羅風險模擬（需要NumPy，結果按數據版本快取）
+        self.risk = RiskSimulator(all_rows) if RiskSimulator.is_available() else None
+        # 分位數草圖按數據版本快取在記憶體，查詢只需二分查找
+        self._sketch_lock = threading.Lock()
+        self._sketch_cache = {}
+        self._sketch_version = None
+        # 儀表板批次結果：(數據版本, 參數) -> (計算時間, 結果)
+        self._bundle_lock = threading.Lock()
+        self._bundle_cache = {}
+        self._bundle_version = None
         logger.info(f"統計分析管理器已初始化，資料庫路徑: {self.db_path}")
     
-    def get_win_rate_stats(self) -> Dict[str, Any]:
-        """獲取勝率統計"""
+    @contextmanager
+    def _connect(self, time_range: Optional[Tuple[float, float]] = None, all_rows: bool = False):
+        """
+        打開查詢連接，指定時間範圍時按需合併歸檔分區
+
+        Args:
+            time_range: 查詢記錄的時間範圍
+            all_rows: 未指定範圍但需要逐行讀取全部記錄（記憶體副本只有近期記錄，會改用快照）
+        """
+        if time_range is not None and self.archive_manager is not None and self.connection_provider is None:
+            start_ts, end_ts = time_range
+            with self.archive_manager.connect(start_ts if start_ts != float('-inf') else None,
+                                              end_ts if end_ts != float('inf') else None) as conn:
+                yield conn
+            return
+        
+        if self.connection_provider is not None:
+            if time_range is None and all_rows:
+                time_range = (float('-inf'), float('inf'))
+            with self.connection_provider(time_range=time_range) as conn:
+                yield conn
+            return
+        
+        conn = sqlite3.connect(self.db_path)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            yield conn
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _source(table_name: str, time_range: Optional[Tuple[float, float]]) -> Tuple[str, Dict[str, float]]:
+        """查詢來源：全部時間讀取聚合表，指定時間範圍時為同欄位的範圍查詢子查詢"""
+        if time_range is None:
+            return table_name, {}
+        start_ts, end_ts = time_range
+        return f"({_WINDOW_SOURCES[table_name]}) AS {table_name}", {'start': start_ts, 'end': end_ts}
+    
+    def get_win_rate_stats(self, window: Optional[str] = None, start_ts: Optional[float] = None,
+                           end_ts: Optional[float] = None) -> Dict[str, Any]:
+        """
+        獲取勝率統計
+        
+        Args:
+            window: 時間窗口（24h / 7d / 30d），與 start_ts/end_ts 均未指定時統計全部時間
+            start_ts: 範圍起點（含），按交易結果時間
+            end_ts: 範圍終點（不含），指定 window 時為窗口終點
+        """
+        time_range = resolve_time_range(window, start_ts, end_ts)
+        try:
+            # 常用窗口由記憶體滾動統計直接提供
+            if window in ANALYTICS_WINDOWS and start_ts is None and end_ts is None:
+                return self.rolling.get_win_rate_stats(window)
+            
+            with self._connect(time_range) as conn:
                 cursor = conn.cursor()
                 
-                # 總體勝率
-                cursor.execute("""
+                # 總體勝率（交易對聚合涵蓋全部交易結果）
+                source, params = self._source('analytics_symbol_stats', time_range)
+                cursor.execute(f"""
                     SELECT 
-                        COUNT(*) as total,
-                        SUM(CASE WHEN is_successful = 1 THEN 1 ELSE 0 END) as wins,
-                        SUM(final_pnl) as total_pnl
-                    FROM trading_results
-                """)
+                        COALESCE(SUM(trades), 0) as total,
+                        SUM(wins) as wins,
+                        CASE WHEN SUM(pnl_count) > 0 THEN SUM(pnl_sum) END as total_pnl
+                    FROM {source}
+                    WHERE trades > 0
+                """, params)
                 
                 overall = cursor.fetchone()
                 total, wins, total_pnl = overall
@@ -40,28 +226,27 @@ class AnalyticsManager:
                 overall_win_rate = (wins / total * 100) if total > 0 else 0
                 
                 # 按信號類型統計
-                cursor.execute("""
+                source, params = self._source('analytics_signal_type_stats', time_range)
+                cursor.execute(f"""
                     SELECT 
-                        s.signal_type,
-                        COUNT(*) as total,
-                        SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END) as wins,
-                        SUM(r.final_pnl) as pnl,
-                        AVG(r.final_pnl) as avg_pnl
-                    FROM trading_results r
-                    JOIN orders_executed o ON r.order_id = o.id  
-                    JOIN signals_received s ON o.signal_id = s.id
-                    GROUP BY s.signal_type
+                        signal_type,
+                        trades as total,
+                        wins,
+                        CASE WHEN pnl_count > 0 THEN pnl_sum END as pnl,
+                        CASE WHEN pnl_count > 0 THEN pnl_sum / pnl_count END as avg_pnl
+                    FROM {source}
+                    WHERE trades > 0
                     ORDER BY wins DESC
-                """)
+                """, params)
                 
                 signal_stats = []
                 for row in cursor.fetchall():
-                    signal_type, total, wins, pnl, avg_pnl = row
-                    win_rate = (wins / total * 100) if total > 0 else 0
+                    signal_type, type_total, type_wins, pnl, avg_pnl = row
+                    win_rate = (type_wins / type_total * 100) if type_total > 0 else 0
                     signal_stats.append({
                         'signal_type': signal_type,
-                        'total': total,
-                        'wins': wins,
+                        'total': type_total,
+                        'wins': type_wins,
                         'win_rate': round(win_rate, 1),
                         'total_pnl': round(pnl or 0, 4),
                         'avg_pnl': round(avg_pnl or 0, 4)
@@ -85,20 +270,24 @@ class AnalyticsManager:
                 'by_signal_type': []
             }
     
-    def get_execution_analysis(self) -> Dict[str, Any]:
-        """獲取執行成功率分析"""
+    def get_execution_analysis(self, window: Optional[str] = None, start_ts: Optional[float] = None,
+                               end_ts: Optional[float] = None) -> Dict[str, Any]:
+        """獲取執行成功率分析（時間範圍按訂單執行時間，參數同 get_win_rate_stats）"""
+        time_range = resolve_time_range(window, start_ts, end_ts)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(time_range) as conn:
                 cursor = conn.cursor()
                 
                 # 總體執行分析
-                cursor.execute("""
+                source, params = self._source('analytics_order_stats', time_range)
+                cursor.execute(f"""
                     SELECT 
-                        COUNT(*) as total_orders,
-                        SUM(CASE WHEN status IN ('FILLED', 'TP_FILLED', 'SL_FILLED') THEN 1 ELSE 0 END) as executed_orders,
-                        SUM(CASE WHEN status IN ('CANCELED', 'CANCELLED', 'EXPIRED') THEN 1 ELSE 0 END) as failed_orders
-                    FROM orders_executed
-                """)
+                        COALESCE(SUM(orders), 0) as total_orders,
+                        SUM(CASE WHEN status IN {EXECUTED_STATUSES} THEN orders ELSE 0 END) as executed_orders,
+                        SUM(CASE WHEN status IN {FAILED_STATUSES} THEN orders ELSE 0 END) as failed_orders
+                    FROM {source}
+                    WHERE orders > 0
+                """, params)
                 
                 result = cursor.fetchone()
                 total_orders, executed_orders, failed_orders = result
@@ -106,18 +295,18 @@ class AnalyticsManager:
                 execution_rate = (executed_orders / total_orders * 100) if total_orders > 0 else 0
                 
                 # 按策略組合分析執行率
-                cursor.execute("""
+                source, params = self._source('analytics_strategy_stats', time_range)
+                cursor.execute(f"""
                     SELECT 
-                        s.signal_type,
-                        s.opposite,
-                        COUNT(*) as total,
-                        SUM(CASE WHEN o.status IN ('FILLED', 'TP_FILLED', 'SL_FILLED') THEN 1 ELSE 0 END) as executed,
-                        AVG(ABS(s.close_price - o.price) / s.close_price) as avg_price_gap
-                    FROM signals_received s
-                    JOIN orders_executed o ON s.id = o.signal_id
-                    GROUP BY s.signal_type, s.opposite
+                        signal_type,
+                        NULLIF(opposite, {NULL_OPPOSITE}) as opposite,
+                        orders as total,
+                        executed_orders as executed,
+                        CASE WHEN price_gap_count > 0 THEN price_gap_sum / price_gap_count END as avg_price_gap
+                    FROM {source}
+                    WHERE orders > 0
                     ORDER BY executed DESC
-                """)
+                """, params)
                 
                 strategy_execution = []
                 for row in cursor.fetchall():
@@ -151,24 +340,27 @@ class AnalyticsManager:
                 'by_strategy_combo': []
             }
     
-    def get_symbol_performance(self) -> Dict[str, Any]:
-        """獲取交易對表現分析"""
+    def get_symbol_performance(self, window: Optional[str] = None, start_ts: Optional[float] = None,
+                               end_ts: Optional[float] = None) -> Dict[str, Any]:
+        """獲取交易對表現分析（時間範圍按交易結果時間，參數同 get_win_rate_stats）"""
+        time_range = resolve_time_range(window, start_ts, end_ts)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(time_range) as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute("""
+                source, params = self._source('analytics_symbol_stats', time_range)
+                cursor.execute(f"""
                     SELECT 
-                        r.symbol,
-                        COUNT(*) as total_trades,
-                        SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END) as successful_trades,
-                        SUM(r.final_pnl) as total_pnl,
-                        AVG(r.final_pnl) as avg_pnl,
-                        AVG(r.holding_time_minutes) as avg_holding_time
-                    FROM trading_results r
-                    GROUP BY r.symbol
+                        symbol,
+                        trades as total_trades,
+                        wins as successful_trades,
+                        CASE WHEN pnl_count > 0 THEN pnl_sum END as total_pnl,
+                        CASE WHEN pnl_count > 0 THEN pnl_sum / pnl_count END as avg_pnl,
+                        CASE WHEN holding_count > 0 THEN holding_sum / holding_count END as avg_holding_time
+                    FROM {source}
+                    WHERE trades > 0
                     ORDER BY total_pnl DESC
-                """)
+                """, params)
                 
                 symbol_performance = []
                 for row in cursor.fetchall():
@@ -190,26 +382,28 @@ class AnalyticsManager:
             logger.error(f"獲取交易對表現時出錯: {str(e)}")
             return {'by_symbol': []}
     
-    def get_time_analysis(self) -> Dict[str, Any]:
-        """獲取時間分析統計"""
+    def get_time_analysis(self, window: Optional[str] = None, start_ts: Optional[float] = None,
+                          end_ts: Optional[float] = None) -> Dict[str, Any]:
+        """獲取時間分析統計（時間範圍按信號時間，參數同 get_win_rate_stats）"""
+        time_range = resolve_time_range(window, start_ts, end_ts)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(time_range) as conn:
                 cursor = conn.cursor()
                 
                 # 按小時統計
-                cursor.execute("""
+                source, params = self._source('analytics_time_stats', time_range)
+                cursor.execute(f"""
                     SELECT 
-                        strftime('%H', datetime(s.timestamp, 'unixepoch')) as hour,
-                        COUNT(*) as total_signals,
-                        COUNT(r.id) as completed_trades,
-                        SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END) as successful_trades,
-                        AVG(r.final_pnl) as avg_pnl
-                    FROM signals_received s
-                    LEFT JOIN orders_executed o ON s.id = o.signal_id
-                    LEFT JOIN trading_results r ON o.id = r.order_id
+                        hour,
+                        SUM(signal_rows) as total_signals,
+                        SUM(completed_trades) as completed_trades,
+                        SUM(successful_trades) as successful_trades,
+                        CASE WHEN SUM(pnl_count) > 0 THEN SUM(pnl_sum) / SUM(pnl_count) END as avg_pnl
+                    FROM {source}
+                    WHERE signal_rows > 0
                     GROUP BY hour
                     ORDER BY hour
-                """)
+                """, params)
                 
                 hourly_stats = []
                 for row in cursor.fetchall():
@@ -225,18 +419,17 @@ class AnalyticsManager:
                     })
                 
                 # 按星期統計
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT 
-                        strftime('%w', datetime(s.timestamp, 'unixepoch')) as weekday,
-                        COUNT(*) as total_signals,
-                        COUNT(r.id) as completed_trades,
-                        SUM(CASE WHEN r.is_successful = 1 THEN 1 ELSE 0 END) as successful_trades
-                    FROM signals_received s
-                    LEFT JOIN orders_executed o ON s.id = o.signal_id
-                    LEFT JOIN trading_results r ON o.id = r.order_id
+                        weekday,
+                        SUM(signal_rows) as total_signals,
+                        SUM(completed_trades) as completed_trades,
+                        SUM(successful_trades) as successful_trades
+                    FROM {source}
+                    WHERE signal_rows > 0
                     GROUP BY weekday
                     ORDER BY weekday
-                """)
+                """, params)
                 
                 weekday_names = ['週日', '週一', '週二', '週三', '週四', '週五', '週六']
                 weekly_stats = []
@@ -259,23 +452,165 @@ class AnalyticsManager:
             logger.error(f"獲取時間分析時出錯: {str(e)}")
             return {'hourly_stats': [], 'weekly_stats': []}
     
-    def get_database_stats(self) -> Dict[str, Any]:
-        """獲取完整資料庫統計信息"""
+    def get_fill_quality(self, group_by: str = 'strategy', window: Optional[str] = None,
+                         start_ts: Optional[float] = None, end_ts: Optional[float] = None) -> Dict[str, Any]:
+        """
+        獲取成交品質統計（滑價、價差、延遲與止盈/止損距離，比例值）
+        
+        Args:
+            group_by: strategy（信號類型與反向參數）或 symbol
+            window / start_ts / end_ts: 時間範圍，按訂單執行時間，同 get_win_rate_stats
+        """
+        if group_by not in FILL_QUALITY_GROUPS:
+            raise ValueError(f'不支援的分組: {group_by}（可用: {", ".join(FILL_QUALITY_GROUPS)}）')
+        time_range = resolve_time_range(window, start_ts, end_ts)
+        key_names, keys, source = FILL_QUALITY_GROUPS[group_by]
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(time_range, all_rows=True) as conn:
                 cursor = conn.cursor()
                 
-                # 基礎表格統計
-                stats = {}
+                where, params = '', {}
+                if time_range is not None:
+                    where = "WHERE o.execution_timestamp >= :start AND o.execution_timestamp < :end"
+                    params = {'start': time_range[0], 'end': time_range[1]}
+                
+                cursor.execute(f"SELECT {_FILL_QUALITY_METRICS} FROM {source} {where}", params)
+                overall = self._format_fill_quality(cursor.fetchone())
+                
+                cursor.execute(f"""
+                    SELECT {keys}, {_FILL_QUALITY_METRICS}
+                    FROM {source} {where}
+                    GROUP BY {keys}
+                    ORDER BY orders DESC
+                """, params)
+                groups = []
+                for row in cursor.fetchall():
+                    group = dict(zip(key_names, row))
+                    if group_by == 'strategy':
+                        if group['opposite'] == NULL_OPPOSITE:
+                            group['opposite'] = None
+                        group['strategy_combo'] = f"{group['signal_type']}_opposite_{group['opposite']}"
+                    group.update(self._format_fill_quality(row[len(key_names):]))
+                    groups.append(group)
                 
-                cursor.execute('SELECT COUNT(*) FROM signals_received')
-                stats['total_signals'] = cursor.fetchone()[0]
+                return {'group_by': group_by, 'overall': overall, 'groups': groups}
                 
-                cursor.execute('SELECT COUNT(*) FROM orders_executed')
-                stats['total_orders'] = cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"獲取成交品質統計時出錯: {str(e)}")
+            return {'group_by': group_by, 'overall': {}, 'groups': []}
+    
+    @staticmethod
+    def _format_fill_quality(row: tuple) -> Dict[str, Any]:
+        (orders, priced_orders, avg_slippage, worst_slippage, avg_price_gap, avg_abs_price_gap,
+         avg_delay_ms, max_delay_ms, avg_tp_distance, avg_sl_distance) = row
+        def ratio(value):
+            return round(value, 6) if value is not None else None
+        
+        return {
+            'total_orders': orders,
+            'priced_orders': priced_orders,
+            'avg_slippage': ratio(avg_slippage),
+            'worst_slippage': ratio(worst_slippage),
+            'avg_price_gap': ratio(avg_price_gap),
+            'avg_abs_price_gap': ratio(avg_abs_price_gap),
+            'avg_delay_ms': round(avg_delay_ms, 1) if avg_delay_ms is not None else None,
+            'max_delay_ms': max_delay_ms,
+            'avg_tp_distance': ratio(avg_tp_distance),
+            'avg_sl_distance': ratio(avg_sl_distance)
+        }
+    
+    def get_risk_simulation(self, **options) -> Dict[str, Any]:
+        """
+        按策略組合的盈虧百分比進行蒙地卡羅風險模擬
+        
+        Args:
+            **options: RiskSimulator.simulate 的參數（simulations、horizon、position_fraction、ruin_loss、percentiles、seed）
+        """
+        if self.risk is None:
+            raise RuntimeError('風險模擬需要 NumPy')
+        return self.risk.simulate(**options)
+    
+    @staticmethod
+    def _check_sketch_args(metric: str, dimension: str):
+        if metric not in METRICS:
+            raise ValueError(f'不支援的指標: {metric}（可用: {", ".join(METRICS)}）')
+        if dimension not in DIMENSIONS:
+            raise ValueError(f'不支援的維度: {dimension}（可用: {", ".join(DIMENSIONS)}）')
+    
+    def _get_sketches(self, metric: str, dimension: str) -> Dict[Optional[str], Any]:
+        """某個指標與維度下各組的草圖（鍵None為全部組合併），數據版本未變時使用快取"""
+        with self._connect() as conn:
+            data_version = get_data_version(conn)
+            with self._sketch_lock:
+                if data_version is None or data_version != self._sketch_version:
+                    self._sketch_cache = {}
+                    self._sketch_version = data_version
+                sketches = self._sketch_cache.get((metric, dimension))
+                if sketches is None:
+                    sketches = load_sketches(conn, metric, dimension)
+                    sketches[None] = merge_all(sketches.values())
+                    self._sketch_cache[(metric, dimension)] = sketches
+        return sketches
+    
+    def get_percentiles(self, metric: str, group_key: Optional[str] = None, dimension: str = 'symbol',
+                        percentiles: Tuple[float, ...] = (50, 90, 99)) -> Dict[str, Any]:
+        """
+        獲取分佈百分位數（相對誤差不超過 RELATIVE_ACCURACY）
+        
+        Args:
+            metric: final_pnl / pnl_percentage / holding_time_minutes / execution_delay_ms
+            group_key: 信號類型或交易對，None 時合併該維度的全部組
+            dimension: signal_type 或 symbol
+            percentiles: 百分位（0-100）
+        """
+        self._check_sketch_args(metric, dimension)
+        try:
+            sketch = self._get_sketches(metric, dimension).get(group_key)
+            result = {'metric': metric, 'dimension': dimension, 'group_key': group_key}
+            if sketch is None:
+                result.update({'count': 0, 'percentiles': {f'p{p:g}': None for p in percentiles}})
+            else:
+                result.update(summarize(sketch, percentiles))
+            return result
+            
+        except Exception as e:
+            logger.error(f"獲取百分位數時出錯: {str(e)}")
+            return {}
+    
+    def get_distribution_stats(self, metric: str, dimension: str = 'signal_type',
+                               percentiles: Tuple[float, ...] = (50, 90, 99)) -> Dict[str, Any]:
+        """獲取某個指標按維度分組的百分位數，參數同 get_percentiles"""
+        self._check_sketch_args(metric, dimension)
+        try:
+            sketches = self._get_sketches(metric, dimension)
+            groups = [dict(group_key=group_key, **summarize(sketch, percentiles))
+                      for group_key, sketch in sketches.items() if group_key is not None]
+            groups.sort(key=lambda group: -group['count'])
+            return {
+                'metric': metric,
+                'dimension': dimension,
+                'relative_accuracy': RELATIVE_ACCURACY,
+                'overall': summarize(sketches[None], percentiles),
+                'groups': groups
+            }
+            
+        except Exception as e:
+            logger.error(f"獲取分佈統計時出錯: {str(e)}")
+            return {}
+    
+    def get_database_stats(self, exact: bool = False) -> Dict[str, Any]:
+        """獲取完整資料庫統計信息（基礎表格行數讀取維護的計數，exact=True 時逐行計數）"""
+        try:
+            with self._connect(all_rows=True) as conn:
+                cursor = conn.cursor()
                 
-                cursor.execute('SELECT COUNT(*) FROM trading_results')
-                stats['total_results'] = cursor.fetchone()[0]
+                # 基礎表格統計
+                counts = get_row_counts(conn, ('signals_received', 'orders_executed', 'trading_results'), exact=exact)
+                stats = {
+                    'total_signals': counts['signals_received'],
+                    'total_orders': counts['orders_executed'],
+                    'total_results': counts['trading_results']
+                }
                 
                 # ML表格統計（如果存在）
                 try:
@@ -339,42 +674,122 @@ class AnalyticsManager:
             logger.error(f"獲取資料庫統計時出錯: {str(e)}")
             return {}
     
-    def get_performance_summary(self) -> Dict[str, Any]:
-        """獲取綜合表現摘要"""
+    def get_breakdowns(self, window: Optional[str] = None, start_ts: Optional[float] = None,
+                       end_ts: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        獲取全部分類統計
+        
+        Args:
+            window / start_ts / end_ts: 時間範圍，同 get_win_rate_stats
+        
+        Returns:
+            Dict: win_rate / execution / symbol / time，分別同
+                get_win_rate_stats、get_execution_analysis、get_symbol_performance、get_time_analysis
+        """
+        return {
+            'win_rate': self.get_win_rate_stats(window, start_ts, end_ts),
+            'execution': self.get_execution_analysis(window, start_ts, end_ts),
+            'symbol': self.get_symbol_performance(window, start_ts, end_ts),
+            'time': self.get_time_analysis(window, start_ts, end_ts)
+        }
+    
+    def get_performance_summary(self, window: Optional[str] = None, start_ts: Optional[float] = None,
+                                end_ts: Optional[float] = None) -> Dict[str, Any]:
+        """獲取綜合表現摘要（時間範圍作用於分類統計，數據庫統計為全部時間）"""
+        try:
+            return self._build_summary(self.get_breakdowns(window, start_ts, end_ts), self.get_database_stats())
+            
+        except Exception as e:
+            logger.error(f"獲取表現摘要時出錯: {str(e)}")
+            return {}
+    
+    def _build_summary(self, breakdowns: Dict[str, Dict[str, Any]], database_stats: Dict[str, Any]) -> Dict[str, Any]:
+        """由分類統計與數據庫統計推導綜合摘要"""
+        win_rate_stats = breakdowns['win_rate']
+        execution_analysis = breakdowns['execution']
+        symbol_performance = breakdowns['symbol']
+        
+        # 計算關鍵指標
+        return {
+            'overview': {
+                'total_signals': database_stats.get('total_signals', 0),
+                'total_orders': database_stats.get('total_orders', 0),
+                'total_trades': win_rate_stats.get('total_trades', 0),
+                'execution_rate': execution_analysis.get('overall_execution_rate', 0),
+                'win_rate': win_rate_stats.get('overall_win_rate', 0),
+                'total_pnl': win_rate_stats.get('total_pnl', 0)
+            },
+            'data_quality': {
+                'order_completion_rate': database_stats.get('order_completion_rate', 0),
+                'result_completion_rate': database_stats.get('result_completion_rate', 0),
+                'last_signal_time': database_stats.get('last_signal_time', '無'),
+                'database_size_kb': database_stats.get('database_size_kb', 0)
+            },
+            'best_performers': {
+                'best_signal_type': self._get_best_signal_type(win_rate_stats),
+                'best_symbol': self._get_best_symbol(symbol_performance),
+                'best_strategy_combo': self._get_best_strategy_combo(execution_analysis)
+            }
+        }
+    
+    def get_analytics_bundle(self, window: Optional[str] = None, start_ts: Optional[float] = None,
+                             end_ts: Optional[float] = None,
+                             percentiles: Tuple[float, ...] = (50, 90, 99)) -> Dict[str, Any]:
+        """
+        一次獲取儀表板全部統計面板
+        
+        分類統計以 get_breakdowns 計算一次，摘要與最佳表現由同一結果推導；
+        結果按數據版本快取，數據未變更時直接返回
+        
+        Args:
+            window / start_ts / end_ts: 時間範圍，作用於分類統計與摘要（數據庫統計與分佈為全部時間）
+            percentiles: 分佈的百分位（0-100）
+        
+        Returns:
+            Dict: summary / win_rate / execution / symbol / time / fill_quality / database /
+                distributions / data_version
+        """
+        resolve_time_range(window, start_ts, end_ts)
+        key = (window, start_ts, end_ts, tuple(percentiles))
+        relative = window is not None and end_ts is None
         try:
-            # 整合各種統計
-            win_rate_stats = self.get_win_rate_stats()
-            execution_analysis = self.get_execution_analysis()
-            symbol_performance = self.get_symbol_performance()
-            database_stats = self.get_database_stats()
+            with self._connect() as conn:
+                data_version = get_data_version(conn)
             
-            # 計算關鍵指標
-            summary = {
-                'overview': {
-                    'total_signals': database_stats.get('total_signals', 0),
-                    'total_orders': database_stats.get('total_orders', 0),
-                    'total_trades': win_rate_stats.get('total_trades', 0),
-                    'execution_rate': execution_analysis.get('overall_execution_rate', 0),
-                    'win_rate': win_rate_stats.get('overall_win_rate', 0),
-                    'total_pnl': win_rate_stats.get('total_pnl', 0)
-                },
-                'data_quality': {
-                    'order_completion_rate': database_stats.get('order_completion_rate', 0),
-                    'result_completion_rate': database_stats.get('result_completion_rate', 0),
-                    'last_signal_time': database_stats.get('last_signal_time', '無'),
-                    'database_size_kb': database_stats.get('database_size_kb', 0)
+            now = time.time()
+            if data_version is not None:
+                with self._bundle_lock:
+                    if data_version != self._bundle_version:
+                        self._bundle_cache = {}
+                        self._bundle_version = data_version
+                    cached = self._bundle_cache.get(key)
+                if cached is not None and (not relative or now - cached[0] < BUNDLE_WINDOW_CACHE_SECONDS):
+                    return cached[1]
+            
+            breakdowns = self.get_breakdowns(window, start_ts, end_ts)
+            database_stats = self.get_database_stats()
+            bundle = dict(breakdowns)
+            bundle.update({
+                'summary': self._build_summary(breakdowns, database_stats),
+                'fill_quality': self.get_fill_quality('strategy', window, start_ts, end_ts),
+                'database': database_stats,
+                'distributions': {
+                    metric: self.get_distribution_stats(metric, dimension, percentiles)
+                    for metric, dimension in BUNDLE_DISTRIBUTIONS.items()
                 },
-                'best_performers': {
-                    'best_signal_type': self._get_best_signal_type(win_rate_stats),
-                    'best_symbol': self._get_best_symbol(symbol_performance),
-                    'best_strategy_combo': self._get_best_strategy_combo(execution_analysis)
-                }
-            }
+                'data_version': data_version
+            })
             
-            return summary
+            if data_version is not None:
+                with self._bundle_lock:
+                    if data_version == self._bundle_version:
+                        if len(self._bundle_cache) >= _BUNDLE_CACHE_SIZE:
+                            self._bundle_cache.clear()
+                        self._bundle_cache[key] = (now, bundle)
+            return bundle
             
         except Exception as e:
-            logger.error(f"獲取表現摘要時出錯: {str(e)}")
+            logger.error(f"獲取批次統計時出錯: {str(e)}")
             return {}
     
     def _get_best_signal_type(self, win_rate_stats: Dict) -> Dict[str, Any]:
@@ -421,6 +836,7 @@ class AnalyticsManager:
         }
 
 # 創建統計分析管理器實例（需要傳入資料庫路徑）
-def create_analytics_manager(db_path: str) -> AnalyticsManager:
+def create_analytics_manager(db_path: str, connection_provider: Optional[Callable] = None,
+                             archive_manager=None) -> AnalyticsManager:
     """創建統計分析管理器實例"""
-    return AnalyticsManager(db_path)
\ No newline at end of file
+    return AnalyticsManager(db_path, connection_provider, archive_manager)
\ No newline at end of file
@@ -0,0 +1,348 @@
+"""
+冷數據歸檔管理模組
+將超過保留期的交易鏈（信號→訂單→交易結果→ML記錄）按月份移至獨立的歸檔數據庫，
+查詢時只 ATTACH 時間範圍涉及的月份分區
+=============================================================================
+用法:
+    python -m database.archive_manager                  # 歸檔超過保留期的數據
+    python -m database.archive_manager --older-than-days 60 --vacuum
+    python -m database.archive_manager --list
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+
+# 預設保留最近90天的數據在主數據庫
+DEFAULT_ARCHIVE_AFTER_DAYS = int(os.environ.get('MONITOR_ARCHIVE_AFTER_DAYS', '90'))
+
+# 與 database.local_ids.ID_PARTITION_SIZE 一致：記錄每個來源分區已歸檔的最大ID
+ID_PARTITION_BITS = 40
+
+_CREATE_TABLE_PREFIX = re.compile(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?["`\[]?\w+["`\]]?', re.IGNORECASE)
+
+# 歸檔的表及其關聯到信號鏈的方式（父表在前，刪除時逆序）
+ARCHIVE_TABLES = [
+    ('signals_received', "id IN (SELECT id FROM temp._archive_signal_ids)"),
+    ('orders_executed', "signal_id IN (SELECT id FROM temp._archive_signal_ids)"),
+    ('trading_results', "order_id IN (SELECT id FROM temp._archive_order_ids)"),
+    ('ml_features_v2', "signal_id IN (SELECT id FROM temp._archive_signal_ids)"),
+    ('ml_signal_quality', "signal_id IN (SELECT id FROM temp._archive_signal_ids)"),
+    ('ml_price_optimization', "signal_id IN (SELECT id FROM temp._archive_signal_ids)")
+]
+
+class ArchiveManager:
+    """冷數據歸檔管理類"""
+
+    def __init__(self, db_path: str, archive_dir: Optional[str] = None):
+        self.db_path = db_path
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive')
+        self.manifest_path = os.path.join(self.archive_dir, MANIFEST_FILE)
+
+    # ------------------------------------------------------------------
+    # 清單
+    # ------------------------------------------------------------------
+
+    def load_manifest(self) -> Dict:
+        """載入歸檔清單"""
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"載入歸檔清單失敗: {str(e)}")
+        return {'partitions': {}}
+
+    def _save_manifest(self, manifest: Dict):
+        """原子寫入歸檔清單"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def partition_path(self, partition: str) -> str:
+        """月份分區文件路徑，partition 格式 YYYY_MM"""
+        return os.path.join(self.archive_dir, f'trading_archive_{partition}.db')
+
+    def get_partitions_for_range(self, start_ts: Optional[float] = None,
+                                 end_ts: Optional[float] = None) -> List[str]:
+        """時間範圍 [start_ts, end_ts) 涉及的歸檔分區"""
+        partitions = []
+        for partition, info in sorted(self.load_manifest()['partitions'].items()):
+            if start_ts is not None and info['end_ts'] < start_ts:
+                continue
+            if end_ts is not None and info['start_ts'] >= end_ts:
+                continue
+            partitions.append(partition)
+        return partitions
+
+    def get_archived_id_ceiling(self, table_name: str, partition_slot: int = 0) -> int:
+        """來源分區中已歸檔的最大ID（本地ID），未歸檔返回0"""
+        ceiling = 0
+        for info in self.load_manifest()['partitions'].values():
+            max_id = info.get('max_ids', {}).get(table_name, {}).get(str(partition_slot))
+            if max_id:
+                ceiling = max(ceiling, max_id)
+        return ceiling
+
+    # ------------------------------------------------------------------
+    # 歸檔
+    # ------------------------------------------------------------------
+
+    def _get_columns(self, conn: sqlite3.Connection, schema: str, table_name: str) -> List[Tuple]:
+        return conn.execute(f"PRAGMA {schema}.table_info({table_name})").fetchall()
+
+    def _prepare_archive_tables(self, conn: sqlite3.Connection, tables: List[str]):
+        """按主數據庫結構在歸檔分區建表，並補齊主數據庫後來新增的欄位"""
+        for table_name in tables:
+            create_sql = conn.execute(
+                "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+            ).fetchone()[0]
+            archive_columns = {row[1] for row in self._get_columns(conn, 'arc', table_name)}
+
+            if not archive_columns:
+                conn.execute(_CREATE_TABLE_PREFIX.sub(f'CREATE TABLE arc.{table_name}', create_sql, count=1))
+                continue
+
+            for row in self._get_columns(conn, 'main', table_name):
+                if row[1] not in archive_columns:
+                    conn.execute(f'ALTER TABLE arc.{table_name} ADD COLUMN "{row[1]}" {row[2]}')
+
+        # 歸檔分區按時間查詢使用的索引
+        conn.execute('CREATE INDEX IF NOT EXISTS arc.idx_signals_timestamp ON signals_received(timestamp)')
+        conn.execute('CREATE INDEX IF NOT EXISTS arc.idx_orders_signal_id ON orders_executed(signal_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS arc.idx_results_order_id ON trading_results(order_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS arc.idx_results_timestamp ON trading_results(result_timestamp)')
+
+    def _archive_partition(self, conn: sqlite3.Connection, partition: str, month_start: float,
+                           month_end: float, cutoff_ts: float, tables: List[str]) -> Dict:
+        """將一個月份的已完結交易鏈移至歸檔分區"""
+        conn.execute("ATTACH DATABASE ? AS arc", (self.partition_path(partition),))
+        try:
+            self._prepare_archive_tables(conn, tables)
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 信號早於截止時間，且其交易結果也都早於截止時間（仍在進行的交易鏈保留在主數據庫）
+                conn.execute("DROP TABLE IF EXISTS temp._archive_signal_ids")
+                conn.execute("""
+                    CREATE TEMP TABLE _archive_signal_ids AS
+                    SELECT s.id FROM main.signals_received s
+                    WHERE s.timestamp >= ? AND s.timestamp < ?
+                      AND NOT EXISTS (
+                          SELECT 1 FROM main.orders_executed o
+                          JOIN main.trading_results r ON r.order_id = o.id
+                          WHERE o.signal_id = s.id AND r.result_timestamp >= ?
+                      )
+                """, (month_start, min(month_end, cutoff_ts), cutoff_ts))
+                conn.execute("DROP TABLE IF EXISTS temp._archive_order_ids")
+                conn.execute("""
+                    CREATE TEMP TABLE _archive_order_ids AS
+                    SELECT id FROM main.orders_executed
+                    WHERE signal_id IN (SELECT id FROM temp._archive_signal_ids)
+                """)
+
+                rows_moved = {}
+                max_ids = {}
+                span = [None, None]
+                for table_name, condition in ARCHIVE_TABLES:
+                    if table_name not in tables:
+                        continue
+
+                    columns = ','.join(f'"{row[1]}"' for row in self._get_columns(conn, 'main', table_name))
+                    conn.execute(f"""
+                        INSERT OR REPLACE INTO arc.{table_name} ({columns})
+                        SELECT {columns} FROM main.{table_name} WHERE {condition}
+                    """)
+                    rows_moved[table_name] = conn.execute(f"""
+                        SELECT COUNT(*) FROM main.{table_name} WHERE {condition}
+                    """).fetchone()[0]
+
+                    max_ids[table_name] = {
+                        str(slot): max_id for slot, max_id in conn.execute(f"""
+                            SELECT id >> {ID_PARTITION_BITS}, MAX(id) FROM main.{table_name}
+                            WHERE {condition} GROUP BY id >> {ID_PARTITION_BITS}
+                        """)
+                    }
+
+                    time_column = {'signals_received': 'timestamp', 'orders_executed': 'execution_timestamp',
+                                   'trading_results': 'result_timestamp'}.get(table_name)
+                    if time_column:
+                        low, high = conn.execute(f"""
+                            SELECT MIN({time_column}), MAX({time_column}) FROM main.{table_name} WHERE {condition}
+                        """).fetchone()
+                        if low is not None:
+                            span[0] = low if span[0] is None else min(span[0], low)
+                            span[1] = high if span[1] is None else max(span[1], high)
+
+                # 子表先刪除，避免外鍵引用懸空
+                for table_name, condition in reversed(ARCHIVE_TABLES):
+                    if table_name in tables:
+                        conn.execute(f"DELETE FROM main.{table_name} WHERE {condition}")
+
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.execute("DETACH DATABASE arc")
+
+        return {'rows_moved': rows_moved, 'max_ids': max_ids, 'span': span}
+
+    def archive_older_than(self, days: int = DEFAULT_ARCHIVE_AFTER_DAYS, vacuum: bool = False) -> Dict:
+        """
+        歸檔早於保留期的交易鏈
+
+        Args:
+            days: 主數據庫保留的天數
+            vacuum: 歸檔後是否VACUUM主數據庫以回收空間
+
+        Returns:
+            Dict: 各分區移動的記錄數
+        """
+        cutoff_ts = (datetime.now(timezone.utc) - timedelta(days=days)).timestamp()
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        result = {
+            'success': True,
+            'cutoff': datetime.fromtimestamp(cutoff_ts, timezone.utc).isoformat(),
+            'partitions': {},
+            'total_rows_moved': 0
+        }
+
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            tables = [table_name for table_name, _ in ARCHIVE_TABLES if table_name in existing]
+            if 'signals_received' not in tables:
+                return result
+
+            months = [row[0] for row in conn.execute("""
+                SELECT DISTINCT strftime('%Y_%m', timestamp, 'unixepoch') FROM signals_received
+                WHERE timestamp < ? ORDER BY 1
+            """, (cutoff_ts,))]
+
+            manifest = self.load_manifest()
+            for partition in months:
+                year, month = (int(part) for part in partition.split('_'))
+                month_start = datetime(year, month, 1, tzinfo=timezone.utc)
+                month_end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+                moved = self._archive_partition(conn, partition, month_start.timestamp(),
+                                                month_end.timestamp(), cutoff_ts, tables)
+                moved_count = sum(moved['rows_moved'].values())
+                if not moved_count:
+                    continue
+
+                info = manifest['partitions'].setdefault(partition, {
+                    'path': os.path.basename(self.partition_path(partition)),
+                    'start_ts': moved['span'][0],
+                    'end_ts': moved['span'][1],
+                    'rows': {},
+                    'max_ids': {}
+                })
+                info['start_ts'] = min(info['start_ts'], moved['span'][0])
+                info['end_ts'] = max(info['end_ts'], moved['span'][1])
+                for table_name, count in moved['rows_moved'].items():
+                    info['rows'][table_name] = info['rows'].get(table_name, 0) + count
+                for table_name, slots in moved['max_ids'].items():
+                    table_ids = info['max_ids'].setdefault(table_name, {})
+                    for slot, max_id in slots.items():
+                        table_ids[slot] = max(table_ids.get(slot, 0), max_id)
+                info['archived_at'] = datetime.now().isoformat()
+
+                # 每個分區完成後即保存清單，中途失敗時已歸檔的分區仍可查詢
+                self._save_manifest(manifest)
+                result['partitions'][partition] = moved['rows_moved']
+                result['total_rows_moved'] += moved_count
+                logger.info(f"📦 已歸檔 {partition}: {moved['rows_moved']}")
+
+            if vacuum and result['total_rows_moved']:
+                conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+        return result
+
+    # ------------------------------------------------------------------
+    # 查詢
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def connect(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+                include_archive: bool = True):
+        """
+        打開查詢連接：只 ATTACH 時間範圍 [start_ts, end_ts) 涉及的歸檔分區，
+        並以同名臨時視圖合併主數據庫與分區，原有SQL無需修改即可查詢歷史數據
+
+        不涉及歸檔分區時返回普通連接，只觸及主數據庫的近期數據
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            partitions = self.get_partitions_for_range(start_ts, end_ts) if include_archive else []
+            attached = []
+            for partition in partitions:
+                path = self.partition_path(partition)
+                if os.path.exists(path):
+                    alias = f'arc_{partition}'
+                    conn.execute("ATTACH DATABASE ? AS " + alias, (f"file:{path}?mode=ro",))
+                    attached.append(alias)
+
+            if attached:
+                self._create_union_views(conn, attached)
+            yield conn
+        finally:
+            conn.close()
+
+    def _create_union_views(self, conn: sqlite3.Connection, aliases: List[str]):
+        """以臨時視圖遮蔽同名主表，合併主數據庫與歸檔分區"""
+        for table_name, _ in ARCHIVE_TABLES:
+            main_columns = [row[1] for row in self._get_columns(conn, 'main', table_name)]
+            if not main_columns:
+                continue
+
+            selects = [f"SELECT {', '.join(main_columns)} FROM main.{table_name}"]
+            for alias in aliases:
+                archive_columns = {row[1] for row in self._get_columns(conn, alias, table_name)}
+                if not archive_columns:
+                    continue
+                # 分區缺少的欄位（歸檔後主數據庫新增的欄位）以NULL補齊
+                columns = [c if c in archive_columns else f'NULL AS {c}' for c in main_columns]
+                selects.append(f"SELECT {', '.join(columns)} FROM {alias}.{table_name}")
+
+            conn.execute(f"CREATE TEMP VIEW {table_name} AS " + " UNION ALL ".join(selects))
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    db_path = os.path.join('data', 'trading_signals.db')
+    manager = ArchiveManager(db_path)
+
+    if '--list' in args:
+        partitions = manager.load_manifest()['partitions']
+        if not partitions:
+            print("📦 尚無歸檔分區")
+        for partition, info in sorted(partitions.items()):
+            print(f"📦 {partition}: {info['path']} {info['rows']}")
+        return
+
+    days = int(args[args.index('--older-than-days') + 1]) if '--older-than-days' in args else DEFAULT_ARCHIVE_AFTER_DAYS
+    result = manager.archive_older_than(days, vacuum='--vacuum' in args)
+    print(f"✅ 歸檔完成（截止 {result['cutoff']}）: {result['total_rows_moved']} 筆記錄，"
+          f"{len(result['partitions'])} 個分區")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+列式數據導出模組
+將交易表按ID分批流式導出為 Parquet 或可記憶體映射的 .npy 欄位文件，
+每次只追加上次導出水位之後的記錄，離線分析不再逐行讀取SQLite
+=============================================================================
+用法:
+    python -m database.columnar_exporter                          # 導出為 .npy（預設）
+    python -m database.columnar_exporter --format parquet --output data/export
+    python -m database.columnar_exporter --tables signals_received,trading_results
+
+讀取:
+    numpy.load('data/export/npy/trading_results/final_pnl.npy', mmap_mode='r')
+    pyarrow.dataset.dataset('data/export/parquet/trading_results')
+"""
+import os
+import sys
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+EXPORT_TABLES = ['signals_received', 'orders_executed', 'trading_results', 'ml_features_v2']
+
+# 不導出的欄位（壓縮的信號原始數據不適合列式分析）
+SKIP_COLUMNS = {'signals_received': {'signal_data_json'}}
+
+DEFAULT_BATCH_SIZE = 50000
+
+# 欄位類型（按SQLite類型親和性）及 .npy 表示
+# int/bool 以哨兵值表示NULL，float 以NaN表示，文本以字典編碼（代碼-1為NULL）
+COLUMN_KINDS = {
+    'int': ('<i8', -(2 ** 63)),
+    'bool': ('|i1', -1),
+    'float': ('<f8', None),
+    'text': ('<i4', -1)
+}
+
+# .npy 固定頭部長度：追加數據後原地改寫shape，不需重寫整個文件
+NPY_HEADER_SIZE = 128
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+def _column_kind(declared_type: str) -> Optional[str]:
+    """按SQLite類型親和性規則判斷欄位類型"""
+    declared_type = (declared_type or '').upper()
+    if 'BOOL' in declared_type:
+        return 'bool'
+    if 'INT' in declared_type:
+        return 'int'
+    if any(t in declared_type for t in ('CHAR', 'CLOB', 'TEXT')):
+        return 'text'
+    if not declared_type or 'BLOB' in declared_type:
+        return None
+    return 'float'
+
+def _coerce(kind: str, value: Any) -> Any:
+    """將SQLite動態類型的值轉換為欄位類型，無法轉換時為None"""
+    if value is None:
+        return None
+    try:
+        if kind == 'int':
+            return int(value)
+        if kind == 'bool':
+            return 1 if value in (1, True, '1', 'true', 'True') else 0
+        if kind == 'float':
+            return float(value)
+        return value if isinstance(value, str) else str(value)
+    except (TypeError, ValueError):
+        return None
+
+def _npy_header(dtype: str, rows: int) -> bytes:
+    """固定長度的 .npy v1.0 頭部"""
+    header = repr({'descr': dtype, 'fortran_order': False, 'shape': (rows,)}).encode('latin1')
+    padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(header) - 1
+    return NPY_MAGIC + (NPY_HEADER_SIZE - len(NPY_MAGIC) - 2).to_bytes(2, 'little') + header + b' ' * padding + b'\n'
+
+class NpyColumnWriter:
+    """單一欄位的 .npy 追加寫入器"""
+
+    def __init__(self, path: str, kind: str):
+        self.path = path
+        self.kind = kind
+        self.dtype, self.null_value = COLUMN_KINDS[kind]
+        self.itemsize = np.dtype(self.dtype).itemsize
+
+    def open(self, rows: int):
+        """準備追加：截斷到清單記錄的行數（丟棄上次中斷時未確認的數據），缺失的欄位以NULL補齊"""
+        if not os.path.exists(self.path):
+            with open(self.path, 'wb') as f:
+                f.write(_npy_header(self.dtype, 0))
+            if rows:
+                self.append(self._null_array(rows))
+                self.set_rows(rows)
+            return
+
+        with open(self.path, 'r+b') as f:
+            f.truncate(NPY_HEADER_SIZE + rows * self.itemsize)
+
+    def _null_array(self, rows: int):
+        return np.full(rows, np.nan if self.null_value is None else self.null_value, dtype=self.dtype)
+
+    def append(self, array):
+        with open(self.path, 'ab') as f:
+            array.astype(self.dtype, copy=False).tofile(f)
+
+    def set_rows(self, rows: int):
+        """原地改寫頭部的shape"""
+        with open(self.path, 'r+b') as f:
+            f.write(_npy_header(self.dtype, rows))
+
+class TextDictionary:
+    """文本欄位的字典編碼（類別按首次出現順序追加，代碼穩定）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values = []
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.values = json.load(f)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, values: List[Optional[str]]) -> List[int]:
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(-1)
+                continue
+            code = self.codes.get(value)
+            if code is None:
+                code = len(self.values)
+                self.codes[value] = code
+                self.values.append(value)
+            codes.append(code)
+        return codes
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.values, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+class ColumnarExporter:
+    """列式數據導出器"""
+
+    def __init__(self, db_path: str, output_dir: str = os.path.join('data', 'export'),
+                 export_format: str = 'npy', batch_size: int = DEFAULT_BATCH_SIZE):
+        if export_format not in ('npy', 'parquet'):
+            raise ValueError(f'不支援的導出格式: {export_format}')
+        if export_format == 'npy' and np is None:
+            raise ImportError('導出 .npy 需要安裝 numpy')
+        if export_format == 'parquet' and pa is None:
+            raise ImportError('導出 Parquet 需要安裝 pyarrow')
+
+        self.db_path = db_path
+        self.export_format = export_format
+        self.output_dir = os.path.join(output_dir, export_format)
+        self.batch_size = batch_size
+        self.manifest_path = os.path.join(self.output_dir, 'manifest.json')
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> Dict:
+        """載入導出清單（各表水位、行數與欄位類型）"""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        return {'format': self.export_format, 'tables': {}}
+
+    def _save_manifest(self):
+        """原子寫入導出清單，清單中的行數與水位是已確認的導出進度"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def _get_columns(self, conn: sqlite3.Connection, table_name: str,
+                     table_state: Dict) -> List[Tuple[str, str]]:
+        """導出欄位及類型：沿用清單中已導出的欄位類型，新欄位的既有行以NULL補齊"""
+        known = dict(table_state.get('columns', []))
+        columns = []
+        for _, name, declared_type, *_ in conn.execute(f"PRAGMA table_info({table_name})"):
+            if name in SKIP_COLUMNS.get(table_name, ()):
+                continue
+            kind = known.get(name) or _column_kind(declared_type)
+            if kind:
+                columns.append((name, kind))
+        return columns
+
+    def export_table(self, conn: sqlite3.Connection, table_name: str) -> Dict:
+        """
+        導出單個表水位之後的記錄
+
+        Returns:
+            Dict: 導出結果
+        """
+        table_state = self.manifest['tables'].setdefault(table_name, {'last_id': 0, 'rows': 0, 'columns': []})
+        columns = self._get_columns(conn, table_name, table_state)
+        if not columns or columns[0][0] != 'id':
+            columns = [('id', 'int')] + [c for c in columns if c[0] != 'id']
+
+        table_dir = os.path.join(self.output_dir, table_name)
+        os.makedirs(table_dir, exist_ok=True)
+
+        writer = self._npy_writers(table_dir, columns, table_state['rows']) if self.export_format == 'npy' else None
+        select_sql = (f"SELECT {', '.join(name for name, _ in columns)} FROM {table_name} "
+                      f"WHERE id > ? ORDER BY id LIMIT ?")
+
+        rows_exported = 0
+        while True:
+            rows = conn.execute(select_sql, (table_state['last_id'], self.batch_size)).fetchall()
+            if not rows:
+                break
+
+            column_values = {
+                name: [_coerce(kind, value) for value in values]
+                for (name, kind), values in zip(columns, zip(*rows))
+            }
+            if self.export_format == 'npy':
+                self._append_npy(writer, columns, column_values, table_state['rows'] + len(rows))
+            else:
+                self._write_parquet_part(table_dir, columns, column_values)
+
+            table_state['last_id'] = rows[-1][0]
+            table_state['rows'] += len(rows)
+            table_state['columns'] = columns
+            table_state['last_export'] = datetime.now().isoformat()
+            self._save_manifest()
+            rows_exported += len(rows)
+
+            if len(rows) < self.batch_size:
+                break
+
+        table_state['columns'] = columns
+        self._save_manifest()
+        return {
+            'table_name': table_name,
+            'rows_exported': rows_exported,
+            'total_rows': table_state['rows'],
+            'last_id': table_state['last_id']
+        }
+
+    def _npy_writers(self, table_dir: str, columns: List[Tuple[str, str]], rows: int) -> Dict:
+        writers = {'columns': {}, 'dictionaries': {}}
+        for name, kind in columns:
+            column_writer = NpyColumnWriter(os.path.join(table_dir, f'{name}.npy'), kind)
+            column_writer.open(rows)
+            writers['columns'][name] = column_writer
+            if kind == 'text':
+                writers['dictionaries'][name] = TextDictionary(os.path.join(table_dir, f'{name}.categories.json'))
+        return writers
+
+    def _append_npy(self, writers: Dict, columns: List[Tuple[str, str]],
+                    column_values: Dict[str, List], total_rows: int):
+        """追加一批數據，全部欄位寫入後才改寫頭部與字典"""
+        for name, kind in columns:
+            column_writer = writers['columns'][name]
+            values = column_values[name]
+            if kind == 'text':
+                values = writers['dictionaries'][name].encode(values)
+            elif kind == 'float':
+                values = [np.nan if value is None else value for value in values]
+            else:
+                values = [column_writer.null_value if value is None else value for value in values]
+            column_writer.append(np.asarray(values, dtype=column_writer.dtype))
+
+        for dictionary in writers['dictionaries'].values():
+            dictionary.save()
+        for column_writer in writers['columns'].values():
+            column_writer.set_rows(total_rows)
+
+    def _write_parquet_part(self, table_dir: str, columns: List[Tuple[str, str]],
+                            column_values: Dict[str, List]):
+        """每批寫為一個Parquet分片，目錄即為可直接讀取的數據集"""
+        arrow_types = {'int': pa.int64(), 'bool': pa.bool_(), 'float': pa.float64(), 'text': pa.string()}
+        arrays = []
+        for name, kind in columns:
+            values = column_values[name]
+            if kind == 'bool':
+                values = [None if value is None else bool(value) for value in values]
+            arrays.append(pa.array(values, type=arrow_types[kind]))
+
+        ids = column_values['id']
+        part_path = os.path.join(table_dir, f'part-{ids[0]:012d}-{ids[-1]:012d}.parquet')
+        temp_path = part_path + '.tmp'
+        pq.write_table(pa.Table.from_arrays(arrays, names=[name for name, _ in columns]), temp_path,
+                       compression='zstd')
+        os.replace(temp_path, part_path)
+
+    def export_all(self, tables: Optional[List[str]] = None) -> Dict:
+        """導出所有表水位之後的記錄"""
+        result = {'success': True, 'format': self.export_format, 'tables': {}, 'errors': []}
+
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, timeout=30)
+        try:
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table_name in tables or EXPORT_TABLES:
+                if table_name not in existing:
+                    continue
+                try:
+                    result['tables'][table_name] = self.export_table(conn, table_name)
+                    logger.info(f"📤 {table_name}: 導出 {result['tables'][table_name]['rows_exported']} 筆")
+                except Exception as e:
+                    result['success'] = False
+                    result['errors'].append(f'{table_name}: {str(e)}')
+                    logger.error(f"導出 {table_name} 時出錯: {str(e)}")
+        finally:
+            conn.close()
+
+        return result
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+
+    def option(name: str, default: Optional[str] = None) -> Optional[str]:
+        return args[args.index(name) + 1] if name in args else default
+
+    tables = option('--tables')
+    exporter = ColumnarExporter(
+        option('--db', os.path.join('data', 'trading_signals.db')),
+        output_dir=option('--output', os.path.join('data', 'export')),
+        export_format=option('--format', 'npy'),
+        batch_size=int(option('--batch-size', str(DEFAULT_BATCH_SIZE)))
+    )
+    result = exporter.export_all(tables.split(',') if tables else None)
+
+    for table_name, table_result in result['tables'].items():
+        print(f"📤 {table_name}: 新增 {table_result['rows_exported']} 筆，共 {table_result['total_rows']} 筆 "
+              f"(水位 ID {table_result['last_id']})")
+    for error in result['errors']:
+        print(f"❌ {error}")
+
+if __name__ == '__main__':
+    main()
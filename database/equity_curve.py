@@ -0,0 +1,444 @@
+"""
+權益曲線與回撤模組
+按交易結果時間累計盈虧，增量維護累計盈虧、峰值與最大回撤（每筆結果O(1)），
+每 CHECKPOINT_INTERVAL 筆保存檢查點：重新啟動不需重掃，亂序到達、更新或刪除的結果
+由觸發器標記最早受影響的時間，只從其前一個檢查點重放
+=============================================================================
+用法:
+    python -m database.equity_curve --rebuild [資料庫路徑]
+"""
+import os
+import sys
+import math
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from .analytics_aggregates import get_data_version
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 每多少筆結果保存一個檢查點
+CHECKPOINT_INTERVAL = int(os.environ.get('MONITOR_EQUITY_CHECKPOINT_INTERVAL', '100'))
+
+# 範圍內結果數不超過此值時逐筆重放後降採樣，否則直接取樣檢查點
+RAW_CURVE_LIMIT = 50000
+
+# 狀態與檢查點共用的欄位（累計至 result_timestamp/result_id 為止，按 (時間, ID) 排序）
+_STATE_COLUMNS = ('trades', 'result_timestamp', 'result_id', 'cumulative_pnl',
+                  'peak_pnl', 'max_drawdown', 'max_drawdown_timestamp')
+
+EQUITY_TABLES = {
+    'equity_curve_state': '''
+        CREATE TABLE IF NOT EXISTS equity_curve_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            dirty_from REAL,
+            trades INTEGER NOT NULL DEFAULT 0,
+            result_timestamp REAL,
+            result_id INTEGER,
+            cumulative_pnl REAL NOT NULL DEFAULT 0,
+            peak_pnl REAL NOT NULL DEFAULT 0,
+            max_drawdown REAL NOT NULL DEFAULT 0,
+            max_drawdown_timestamp REAL
+        )
+    ''',
+    'equity_checkpoints': '''
+        CREATE TABLE IF NOT EXISTS equity_checkpoints (
+            trades INTEGER PRIMARY KEY,
+            result_timestamp REAL NOT NULL,
+            result_id INTEGER NOT NULL,
+            cumulative_pnl REAL NOT NULL,
+            peak_pnl REAL NOT NULL,
+            max_drawdown REAL NOT NULL,
+            max_drawdown_timestamp REAL
+        )
+    '''
+}
+
+# 結果變更時記錄最早受影響的時間（同步UPSERT未改變時間與盈虧時不標記）
+_MARK_DIRTY = '''
+    UPDATE equity_curve_state
+    SET dirty_from = MIN(COALESCE(dirty_from, 1e18), {timestamps})
+    WHERE id = 1;
+'''
+
+EQUITY_TRIGGERS = {
+    'trg_equity_result_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_equity_result_insert
+        AFTER INSERT ON trading_results
+        WHEN NEW.result_timestamp IS NOT NULL
+        BEGIN
+            {_MARK_DIRTY.format(timestamps='NEW.result_timestamp')}
+        END
+    ''',
+    'trg_equity_result_update': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_equity_result_update
+        AFTER UPDATE OF result_timestamp, final_pnl ON trading_results
+        WHEN (NEW.result_timestamp IS NOT OLD.result_timestamp OR NEW.final_pnl IS NOT OLD.final_pnl)
+             AND COALESCE(NEW.result_timestamp, OLD.result_timestamp) IS NOT NULL
+        BEGIN
+            {_MARK_DIRTY.format(timestamps='COALESCE(OLD.result_timestamp, 1e18), COALESCE(NEW.result_timestamp, 1e18)')}
+        END
+    ''',
+    'trg_equity_result_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_equity_result_delete
+        AFTER DELETE ON trading_results
+        WHEN OLD.result_timestamp IS NOT NULL
+        BEGIN
+            {_MARK_DIRTY.format(timestamps='OLD.result_timestamp')}
+        END
+    '''
+}
+
+def init_equity_curve(conn: sqlite3.Connection):
+    """建立狀態表、檢查點表與觸發器（新建時標記為需要從頭計算）"""
+    cursor = conn.cursor()
+    for create_sql in EQUITY_TABLES.values():
+        cursor.execute(create_sql)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_equity_checkpoints_timestamp '
+                   'ON equity_checkpoints(result_timestamp, result_id)')
+    cursor.execute("INSERT OR IGNORE INTO equity_curve_state (id, dirty_from) VALUES (1, -1e18)")
+    for create_sql in EQUITY_TRIGGERS.values():
+        cursor.execute(create_sql)
+
+def _empty_state() -> Dict[str, Any]:
+    return {
+        'trades': 0,
+        'result_timestamp': None,
+        'result_id': None,
+        'cumulative_pnl': 0.0,
+        'peak_pnl': 0.0,
+        'max_drawdown': 0.0,
+        'max_drawdown_timestamp': None
+    }
+
+def _advance(state: Dict[str, Any], result_id: int, result_timestamp: float, final_pnl: Optional[float]):
+    """累計一筆結果（盈虧為NULL時只計入交易數）"""
+    state['trades'] += 1
+    state['result_timestamp'] = result_timestamp
+    state['result_id'] = result_id
+    state['cumulative_pnl'] += final_pnl or 0.0
+    if state['cumulative_pnl'] > state['peak_pnl']:
+        state['peak_pnl'] = state['cumulative_pnl']
+    drawdown = state['peak_pnl'] - state['cumulative_pnl']
+    if drawdown > state['max_drawdown']:
+        state['max_drawdown'] = drawdown
+        state['max_drawdown_timestamp'] = result_timestamp
+
+def _point(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'timestamp': state['result_timestamp'],
+        'trades': state['trades'],
+        'cumulative_pnl': round(state['cumulative_pnl'], 4),
+        'drawdown': round(state['peak_pnl'] - state['cumulative_pnl'], 4)
+    }
+
+# 按 (結果時間, ID) 讀取某個位置之後的結果（結果時間戳索引範圍掃描）
+_RESULTS_AFTER = '''
+    SELECT id, result_timestamp, final_pnl FROM trading_results
+    WHERE result_timestamp >= :ts AND (result_timestamp > :ts OR id > :id)
+    ORDER BY result_timestamp, id
+'''
+
+class EquityCurveEngine:
+    """權益曲線引擎"""
+
+    def __init__(self, db_path: str, archive_manager=None, checkpoint_interval: int = CHECKPOINT_INTERVAL,
+                 connection_provider: Optional[Callable] = None):
+        """
+        Args:
+            db_path: 監控數據庫路徑（檢查點寫入主數據庫）
+            archive_manager: 冷數據歸檔管理器，重放時合併已歸檔的結果（只在未指定 connection_provider 時使用）
+            checkpoint_interval: 檢查點間隔（筆）
+            connection_provider: 返回唯讀連接上下文管理器的函數（如唯讀快照的 connect），
+                指定時只讀取已保存的檢查點，尚未處理的變更在記憶體中重放，不寫入數據庫
+        """
+        self.db_path = db_path
+        self.archive_manager = archive_manager
+        self.checkpoint_interval = checkpoint_interval
+        self.connection_provider = connection_provider
+        self._lock = threading.Lock()
+        # 唯讀模式下記憶體重放的最新狀態：(數據版本, 狀態)
+        self._replayed_state = (None, None)
+
+    @contextmanager
+    def _connect(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None):
+        """打開連接：唯讀模式使用 connection_provider，否則設置歸檔管理器時合併範圍涉及的歸檔分區（按月歸檔的刪除不影響曲線）"""
+        if self.connection_provider is not None:
+            with self.connection_provider(time_range=(start_ts if start_ts is not None else -math.inf,
+                                                      end_ts if end_ts is not None else math.inf)) as conn:
+                yield conn
+        elif self.archive_manager is not None:
+            with self.archive_manager.connect(start_ts, end_ts) as conn:
+                yield conn
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _read_state(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+        row = conn.execute(f"SELECT dirty_from, {', '.join(_STATE_COLUMNS)} FROM equity_curve_state WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        state = dict(zip(_STATE_COLUMNS, row[1:]))
+        state['dirty_from'] = row[0]
+        return state
+
+    @staticmethod
+    def _checkpoint_before(conn: sqlite3.Connection, timestamp: float) -> Dict[str, Any]:
+        """時間早於 timestamp 的最後一個檢查點，沒有時為起點"""
+        row = conn.execute(f'''
+            SELECT {', '.join(_STATE_COLUMNS)} FROM equity_checkpoints
+            WHERE result_timestamp < ? ORDER BY result_timestamp DESC, result_id DESC LIMIT 1
+        ''', (timestamp,)).fetchone()
+        return dict(zip(_STATE_COLUMNS, row)) if row else _empty_state()
+
+    @staticmethod
+    def _resume_from(state: Dict[str, Any]) -> Dict[str, Any]:
+        """結果讀取的起始位置參數"""
+        if state['result_timestamp'] is None:
+            return {'ts': -math.inf, 'id': -math.inf}
+        return {'ts': state['result_timestamp'], 'id': state['result_id']}
+
+    def sync(self) -> Optional[Dict[str, Any]]:
+        """
+        處理標記的變更：新結果接在末尾時直接累計，否則從受影響時間前的檢查點重放
+
+        Returns:
+            Optional[Dict]: 最新狀態，未初始化時返回None
+        """
+        with self._lock:
+            while True:
+                conn = sqlite3.connect(self.db_path, timeout=30)
+                try:
+                    state = self._read_state(conn)
+                    if state is None or state['dirty_from'] is None:
+                        return state
+                    appending = (state['result_timestamp'] is not None
+                                 and state['dirty_from'] > state['result_timestamp'])
+                    start = state if appending else self._checkpoint_before(conn, state['dirty_from'])
+                finally:
+                    conn.close()
+
+                with self._connect(start['result_timestamp']) as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        # 規劃後有其他寫入或同步：重新規劃
+                        if self._read_state(conn)['dirty_from'] != state['dirty_from']:
+                            conn.rollback()
+                            continue
+                        replayed = self._replay(conn, start, appending)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+
+                if not appending:
+                    logger.info(f"權益曲線已從第 {start['trades']} 筆起重放 {replayed} 筆結果")
+                return self._read_state_from_db()
+
+    def _replay(self, conn: sqlite3.Connection, start: Dict[str, Any], appending: bool) -> int:
+        """從 start 之後逐筆累計並保存檢查點與最新狀態，返回處理筆數"""
+        if not appending:
+            conn.execute("DELETE FROM equity_checkpoints WHERE trades > ?", (start['trades'],))
+
+        state = {column: start[column] for column in _STATE_COLUMNS}
+        checkpoints = []
+        replayed = 0
+        for result_id, result_timestamp, final_pnl in conn.execute(_RESULTS_AFTER, self._resume_from(state)):
+            _advance(state, result_id, result_timestamp, final_pnl)
+            replayed += 1
+            if state['trades'] % self.checkpoint_interval == 0:
+                checkpoints.append(tuple(state[column] for column in _STATE_COLUMNS))
+
+        conn.executemany(f'''
+            INSERT OR REPLACE INTO equity_checkpoints ({', '.join(_STATE_COLUMNS)})
+            VALUES ({', '.join('?' * len(_STATE_COLUMNS))})
+        ''', checkpoints)
+        conn.execute(f'''
+            UPDATE equity_curve_state
+            SET dirty_from = NULL, {', '.join(f'{column} = ?' for column in _STATE_COLUMNS)}
+            WHERE id = 1
+        ''', [state[column] for column in _STATE_COLUMNS])
+        return replayed
+
+    def _valid_checkpoint_before(self, conn: sqlite3.Connection, timestamp: float) -> Dict[str, Any]:
+        """時間早於 timestamp 且未受標記變更影響的最後一個檢查點"""
+        state = self._read_state(conn)
+        if state is not None and state['dirty_from'] is not None:
+            timestamp = min(timestamp, state['dirty_from'])
+        return self._checkpoint_before(conn, timestamp)
+
+    def _read_only_state(self) -> Optional[Dict[str, Any]]:
+        """
+        唯讀讀取最新狀態：有尚未處理的變更時從受影響時間前的檢查點在記憶體中重放
+        （結果按數據版本快取，快照不變時不重複重放）
+        """
+        with self._connect() as conn:
+            state = self._read_state(conn)
+            if state is None or state['dirty_from'] is None:
+                return state
+
+            data_version = get_data_version(conn)
+            cached_version, cached_state = self._replayed_state
+            if data_version is not None and data_version == cached_version:
+                return cached_state
+
+            appending = state['result_timestamp'] is not None and state['dirty_from'] > state['result_timestamp']
+            replayed = {column: value for column, value in
+                        (state if appending else self._checkpoint_before(conn, state['dirty_from'])).items()
+                        if column in _STATE_COLUMNS}
+            for result_id, result_timestamp, final_pnl in conn.execute(_RESULTS_AFTER, self._resume_from(replayed)):
+                _advance(replayed, result_id, result_timestamp, final_pnl)
+
+        self._replayed_state = (data_version, replayed)
+        return replayed
+
+    def _current_state(self) -> Optional[Dict[str, Any]]:
+        """最新狀態：唯讀模式不寫入數據庫，否則先處理標記的變更"""
+        return self._read_only_state() if self.connection_provider is not None else self.sync()
+
+    def _read_state_from_db(self) -> Optional[Dict[str, Any]]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            return self._read_state(conn)
+        finally:
+            conn.close()
+
+    def rebuild(self) -> Optional[Dict[str, Any]]:
+        """標記全部結果並從頭重放"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                conn.execute("UPDATE equity_curve_state SET dirty_from = -1e18 WHERE id = 1")
+        finally:
+            conn.close()
+        return self.sync()
+
+    def get_equity_summary(self) -> Dict[str, Any]:
+        """累計盈虧、峰值與回撤摘要"""
+        try:
+            state = self._current_state() or _empty_state()
+            return {
+                'total_trades': state['trades'],
+                'cumulative_pnl': round(state['cumulative_pnl'], 4),
+                'peak_pnl': round(state['peak_pnl'], 4),
+                'current_drawdown': round(state['peak_pnl'] - state['cumulative_pnl'], 4),
+                'max_drawdown': round(state['max_drawdown'], 4),
+                'max_drawdown_timestamp': state['max_drawdown_timestamp'],
+                'last_result_timestamp': state['result_timestamp']
+            }
+        except Exception as e:
+            logger.error(f"獲取權益摘要時出錯: {str(e)}")
+            return {}
+
+    def get_equity_curve(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+                         max_points: int = 500) -> Dict[str, Any]:
+        """
+        獲取降採樣的權益曲線（回撤相對全部歷史的峰值）
+
+        Args:
+            start_ts: 範圍起點（含），預設為第一筆結果
+            end_ts: 範圍終點（不含），預設為最新
+            max_points: 最多返回的點數
+
+        Returns:
+            Dict: points 為按時間排序的 timestamp / trades / cumulative_pnl / drawdown
+        """
+        try:
+            latest = self._current_state()
+            start = start_ts if start_ts is not None else -math.inf
+            end = end_ts if end_ts is not None else math.inf
+            with self._connect(start_ts, end_ts) as conn:
+                total = conn.execute(
+                    "SELECT COUNT(*) FROM trading_results WHERE result_timestamp >= ? AND result_timestamp < ?",
+                    (start, end)
+                ).fetchone()[0]
+
+                if total > RAW_CURVE_LIMIT:
+                    # 結果過多時以檢查點作為曲線（未處理變更之後的檢查點已失效，改以最新狀態作為終點）
+                    state = self._read_state(conn)
+                    valid_end = min(end, state['dirty_from']) if state and state['dirty_from'] is not None else end
+                    rows = conn.execute(f'''
+                        SELECT {', '.join(_STATE_COLUMNS)} FROM equity_checkpoints
+                        WHERE result_timestamp >= ? AND result_timestamp < ?
+                        ORDER BY trades
+                    ''', (start, valid_end)).fetchall()
+                    points = [_point(dict(zip(_STATE_COLUMNS, row))) for row in rows]
+                    if (valid_end < end and latest and latest['result_timestamp'] is not None
+                            and start <= latest['result_timestamp'] < end):
+                        points.append(_point(latest))
+                    points = _sample(points, max_points)
+                else:
+                    # 從範圍起點前的檢查點逐筆重放範圍內的結果
+                    state = self._valid_checkpoint_before(conn, start)
+                    points = []
+                    for result_id, result_timestamp, final_pnl in conn.execute(_RESULTS_AFTER, self._resume_from(state)):
+                        if result_timestamp >= end:
+                            break
+                        _advance(state, result_id, result_timestamp, final_pnl)
+                        if result_timestamp >= start:
+                            points.append(_point(state))
+                    points = _downsample(points, max_points)
+
+            return {
+                'points': points,
+                'total_trades': total,
+                'checkpoint_interval': self.checkpoint_interval
+            }
+        except Exception as e:
+            logger.error(f"獲取權益曲線時出錯: {str(e)}")
+            return {'points': [], 'total_trades': 0, 'checkpoint_interval': self.checkpoint_interval}
+
+def _sample(points: List[Dict], max_points: int) -> List[Dict]:
+    """等間隔取樣（含第一點與最後一點，不超過 max_points 點）"""
+    if len(points) <= max_points:
+        return points
+    if max_points < 2:
+        return points[-1:] if max_points == 1 else []
+    step = (len(points) - 1) / (max_points - 1)
+    return [points[round(index * step)] for index in range(max_points)]
+
+def _downsample(points: List[Dict], max_points: int) -> List[Dict]:
+    """分段保留每段累計盈虧的最低與最高點，降採樣後仍保留回撤低谷（含最後一點，不超過 max_points 點）"""
+    if len(points) <= max_points:
+        return points
+    # 每段至多兩點，並為最後一點保留位置
+    chunks = (max_points - 1) // 2
+    if chunks == 0:
+        return _sample(points, max_points)
+    size = math.ceil(len(points) / chunks)
+    sampled = []
+    for offset in range(0, len(points), size):
+        chunk = points[offset:offset + size]
+        low = min(chunk, key=lambda p: p['cumulative_pnl'])
+        high = max(chunk, key=lambda p: p['cumulative_pnl'])
+        sampled.extend(sorted({id(low): low, id(high): high}.values(), key=lambda p: p['trades']))
+    if sampled[-1] is not points[-1]:
+        sampled.append(points[-1])
+    return sampled
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    positional = [a for a in args if not a.startswith('--')]
+    db_path = positional[0] if positional else os.path.join('data', 'trading_signals.db')
+
+    if '--rebuild' in args:
+        with sqlite3.connect(db_path, timeout=30) as conn:
+            init_equity_curve(conn)
+        state = EquityCurveEngine(db_path).rebuild()
+        print(f"✅ 權益曲線已重建: {state['trades']} 筆，累計盈虧 {state['cumulative_pnl']:.4f}，"
+              f"最大回撤 {state['max_drawdown']:.4f}")
+    else:
+        print(__doc__)
+
+if __name__ == '__main__':
+    main()
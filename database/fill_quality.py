@@ -0,0 +1,108 @@
+"""
+成交品質欄位模組
+在寫入與同步時為訂單保存相對信號收盤價的價差、按方向調整的滑價，以及止盈/止損距離，
+成交品質統計直接讀取欄位與覆蓋索引，不需要在查詢時逐行計算
+=============================================================================
+"""
+import logging
+import sqlite3
+from typing import Dict
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# orders_executed 上的成交品質欄位（比例值，0.001 即 0.1%）
+FILL_QUALITY_COLUMNS = {
+    'price_gap': 'REAL',      # (訂單價格 - 信號收盤價) / 信號收盤價
+    'slippage': 'REAL',       # 按方向調整的價差：正值表示比信號收盤價更差的價格
+    'tp_distance': 'REAL',    # |止盈價 - 訂單價格| / 訂單價格
+    'sl_distance': 'REAL'     # |止損價 - 訂單價格| / 訂單價格
+}
+
+# 重新計算的來源欄位
+_ORDER_SOURCE_COLUMNS = 'signal_id, side, price, tp_price, sl_price'
+
+# 按分組讀取成交品質的覆蓋索引（延遲直接使用 execution_delay_ms）
+FILL_QUALITY_INDEXES = {
+    'idx_orders_fill_quality_symbol': 'orders_executed(symbol, slippage, price_gap, execution_delay_ms, '
+                                      'tp_distance, sl_distance)',
+    'idx_orders_fill_quality_signal': 'orders_executed(signal_id, slippage, price_gap, execution_delay_ms, '
+                                      'tp_distance, sl_distance)'
+}
+
+def fill_quality_sql(row: str) -> Dict[str, str]:
+    """各成交品質欄位的計算表達式（row 為 NEW 或 orders_executed；價格為0視為未知）"""
+    close_price = f"(SELECT close_price FROM signals_received WHERE id = {row}.signal_id)"
+    price = f"NULLIF({row}.price, 0)"
+    price_gap = f"(({price} - {close_price}) / {close_price})"
+    return {
+        'price_gap': price_gap,
+        'slippage': f"(CASE WHEN UPPER({row}.side) = 'SELL' THEN -1 ELSE 1 END * {price_gap})",
+        'tp_distance': f"(ABS({row}.tp_price - {price}) / {price})",
+        'sl_distance': f"(ABS({row}.sl_price - {price}) / {price})"
+    }
+
+def _assignments(row: str) -> str:
+    return ', '.join(f"{column} = {expression}" for column, expression in fill_quality_sql(row).items())
+
+# 訂單寫入、價格變更（含同步UPSERT）及信號收盤價寫入或變更後計算成交品質欄位
+FILL_QUALITY_TRIGGERS = {
+    'trg_fill_quality_order_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_fill_quality_order_insert
+        AFTER INSERT ON orders_executed
+        BEGIN
+            UPDATE orders_executed SET {_assignments('NEW')} WHERE id = NEW.id;
+        END
+    ''',
+    'trg_fill_quality_order_update': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_fill_quality_order_update
+        AFTER UPDATE OF {_ORDER_SOURCE_COLUMNS} ON orders_executed
+        BEGIN
+            UPDATE orders_executed SET {_assignments('NEW')} WHERE id = NEW.id;
+        END
+    ''',
+    'trg_fill_quality_signal_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_fill_quality_signal_insert
+        AFTER INSERT ON signals_received
+        BEGIN
+            UPDATE orders_executed SET {_assignments('orders_executed')} WHERE signal_id = NEW.id;
+        END
+    ''',
+    'trg_fill_quality_signal_update': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_fill_quality_signal_update
+        AFTER UPDATE OF close_price ON signals_received
+        BEGIN
+            UPDATE orders_executed SET {_assignments('orders_executed')} WHERE signal_id = NEW.id;
+        END
+    '''
+}
+
+def init_fill_quality(conn: sqlite3.Connection) -> bool:
+    """
+    建立成交品質欄位、覆蓋索引與觸發器；新增欄位時為全部訂單計算一次
+
+    Returns:
+        bool: 是否重新計算了全部訂單
+    """
+    cursor = conn.cursor()
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(orders_executed)")}
+    if not columns:
+        return False
+
+    columns_added = False
+    for column, column_type in FILL_QUALITY_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE orders_executed ADD COLUMN {column} {column_type}")
+            columns_added = True
+
+    for index_name, definition in FILL_QUALITY_INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {definition}")
+    for create_sql in FILL_QUALITY_TRIGGERS.values():
+        cursor.execute(create_sql)
+
+    if not columns_added:
+        return False
+
+    cursor.execute(f"UPDATE orders_executed SET {_assignments('orders_executed')}")
+    logger.info(f"訂單成交品質欄位已計算: {cursor.rowcount} 筆")
+    return True
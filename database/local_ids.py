@@ -0,0 +1,29 @@
+"""
+本地寫入ID分配模組
+多來源同步以 partition_slot * ID_PARTITION_SIZE 作為各交易主機的ID分區（見 sync/source_registry.py），
+監控主機本地寫入的記錄（交易數據、ML數據、寫後佇列）只使用第一個分區
+
+AUTOINCREMENT 以 sqlite_sequence 與 MAX(id) 的較大值加一分配ID，寫入其他分區的同步記錄後
+會跳到該分區並與其後續同步的ID衝突，因此本地寫入以 next_local_id_sql 顯式指定低於分區上限的ID
+=============================================================================
+"""
+import sqlite3
+
+# 每個來源佔用的ID分區大小，本地寫入的ID低於此值
+ID_PARTITION_SIZE = 1 << 40
+
+def next_local_id_sql(table_name: str) -> str:
+    """
+    本地分區下一個ID的子查詢（可用於 VALUES 或 SELECT）
+
+    兩個範圍查詢都只讀取主鍵索引的一端；sqlite_sequence 低於分區上限時仍計入，
+    寫後佇列已預留的ID區塊與已刪除記錄的ID不會被重用
+    """
+    return f"""(SELECT MAX(
+        COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{table_name}' AND seq < {ID_PARTITION_SIZE}), 0),
+        COALESCE((SELECT MAX(id) FROM {table_name} WHERE id < {ID_PARTITION_SIZE}), 0)
+    ) + 1)"""
+
+def next_local_id(conn: sqlite3.Connection, table_name: str) -> int:
+    """本地分區下一個ID"""
+    return conn.execute(f"SELECT {next_local_id_sql(table_name)}").fetchone()[0]
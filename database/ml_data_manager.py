@@ -7,6 +7,10 @@ import sqlite3
 import logging
 from datetime import datetime
 from typing import Dict, Any, Optional, List
+from .write_behind_queue import get_write_behind_queue
+from .local_ids import next_local_id_sql
+from .row_models import make_row_factory
+from .table_counts import get_row_counts, init_table_counts
 
 # 設置logger
 logger = logging.getLogger(__name__)
@@ -14,28 +18,23 @@ logger = logging.getLogger(__name__)
 class MLDataManager:
     """ML數據管理類 - 完整修復版"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, write_behind: bool = False):
         self.db_path = db_path
         # 初始化ML表格
         self._init_ml_tables()
+        # 寫後模式：record_* 放入共用佇列後立即返回，由寫入線程群組提交
+        self.write_queue = get_write_behind_queue(self.db_path) if write_behind else None
         logger.info(f"ML數據管理器已初始化，資料庫路徑: {self.db_path}")
     
     def _init_ml_tables(self):
-        """初始化ML相關表格 - 強制重建確保完整"""
+        """初始化ML相關表格 - 保留既有數據並補齊缺少的特徵欄位"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # 🔥 強制重建表格，確保包含所有36個特徵欄位
-                logger.info("正在重建ML表格，確保36個特徵欄位完整...")
-                
-                cursor.execute('DROP TABLE IF EXISTS ml_features_v2')
-                cursor.execute('DROP TABLE IF EXISTS ml_signal_quality') 
-                cursor.execute('DROP TABLE IF EXISTS ml_price_optimization')
-                
                 # 1. ML特徵表 (完整36個特徵)
                 cursor.execute('''
-                    CREATE TABLE ml_features_v2 (
+                    CREATE TABLE IF NOT EXISTS ml_features_v2 (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         session_id TEXT NOT NULL,
                         signal_id INTEGER,
@@ -89,7 +88,7 @@ class MLDataManager:
                 
                 # 2. 信號品質評估表
                 cursor.execute('''
-                    CREATE TABLE ml_signal_quality (
+                    CREATE TABLE IF NOT EXISTS ml_signal_quality (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         session_id TEXT NOT NULL,
                         signal_id INTEGER,
@@ -107,7 +106,7 @@ class MLDataManager:
                 
                 # 3. 價格優化表
                 cursor.execute('''
-                    CREATE TABLE ml_price_optimization (
+                    CREATE TABLE IF NOT EXISTS ml_price_optimization (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         session_id TEXT NOT NULL,
                         signal_id INTEGER,
@@ -122,68 +121,101 @@ class MLDataManager:
                     )
                 ''')
                 
+                # 🔥 舊版表格缺少的特徵欄位以新增欄位補齊，確保36個特徵欄位完整（不再刪表重建）
+                existing_columns = {row[1] for row in cursor.execute('PRAGMA table_info(ml_features_v2)')}
+                for column in self.FEATURE_COLUMNS[2:]:
+                    if column not in existing_columns:
+                        column_type = 'INTEGER DEFAULT 0' if column in self.INTEGER_FEATURES else 'REAL DEFAULT 0.0'
+                        cursor.execute(f'ALTER TABLE ml_features_v2 ADD COLUMN {column} {column_type}')
+                        logger.info(f"ml_features_v2 已補齊特徵欄位: {column}")
+                
                 # 創建索引
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_ml_features_signal_id ON ml_features_v2(signal_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_ml_features_session_id ON ml_features_v2(session_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_ml_quality_signal_id ON ml_signal_quality(signal_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_ml_price_signal_id ON ml_price_optimization(signal_id)')
                 
+                # 表格行數由觸發器維護，狀態計數不需逐行掃描
+                init_table_counts(conn)
+                
                 conn.commit()
-                logger.info("ML資料庫表格初始化完成 - 36特徵架構（完整重建版本）")
+                logger.info("ML資料庫表格初始化完成 - 36特徵架構")
                 
         except Exception as e:
             logger.error(f"初始化ML表格時出錯: {str(e)}")
             raise
     
+    # 36個特徵欄位列表（與表格結構完全一致）
+    FEATURE_COLUMNS = [
+        'session_id', 'signal_id',
+        # 信號品質核心特徵 (15個)
+        'strategy_win_rate_recent', 'strategy_win_rate_overall', 'strategy_market_fitness',
+        'volatility_match_score', 'time_slot_match_score', 'symbol_match_score',
+        'price_momentum_strength', 'atr_relative_position', 'risk_reward_ratio',
+        'execution_difficulty', 'consecutive_win_streak', 'consecutive_loss_streak',
+        'system_overall_performance', 'signal_confidence_score', 'market_condition_fitness',
+        # 價格關係特徵 (12個)
+        'price_deviation_percent', 'price_deviation_abs', 'atr_normalized_deviation',
+        'candle_direction', 'candle_body_size', 'candle_wick_ratio',
+        'price_position_in_range', 'upward_adjustment_space', 'downward_adjustment_space',
+        'historical_best_adjustment', 'price_reachability_score', 'entry_price_quality_score',
+        # 市場環境特徵 (9個)
+        'hour_of_day', 'trading_session', 'weekend_factor',
+        'symbol_category', 'current_positions', 'margin_ratio',
+        'atr_normalized', 'volatility_regime', 'market_trend_strength'
+    ]
+    
+    INTEGER_FEATURES = {
+        'consecutive_win_streak', 'consecutive_loss_streak', 'candle_direction',
+        'hour_of_day', 'trading_session', 'weekend_factor', 'symbol_category',
+        'current_positions', 'volatility_regime'
+    }
+    
+    def _build_features_row(self, session_id: str, signal_id: int, features: Dict[str, Any]) -> list:
+        """準備特徵數據值，確保完整性與數值類型正確"""
+        feature_values = [session_id, signal_id]
+        for col in self.FEATURE_COLUMNS[2:]:  # 跳過session_id和signal_id
+            value = features.get(col, 0.0)
+            if col in self.INTEGER_FEATURES:
+                feature_values.append(int(value) if value is not None else 0)
+            else:
+                feature_values.append(float(value) if value is not None else 0.0)
+        return feature_values
+    
+    def _write(self, sql: str, params, description: str):
+        """執行一筆寫入：寫後模式放入佇列，否則同步提交"""
+        if self.write_queue:
+            self.write_queue.submit(sql, params, description)
+            return
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(sql, params)
+            conn.commit()
+    
+    def flush_writes(self, timeout: Optional[float] = None) -> bool:
+        """寫後模式下等待已排入的寫入落盤，有寫入失敗時返回False（詳見 get_failed_writes()）"""
+        return self.write_queue.flush(timeout) if self.write_queue else True
+    
+    def get_write_metrics(self) -> Optional[Dict]:
+        """寫後佇列指標（佇列深度、提交延遲），非寫後模式返回None"""
+        return self.write_queue.get_metrics() if self.write_queue else None
+    
+    def get_failed_writes(self, clear: bool = False) -> List[Dict]:
+        """寫後模式下最近失敗的寫入（description、error、failed_at）"""
+        return self.write_queue.get_failed_writes(clear) if self.write_queue else []
+    
     def record_ml_features(self, session_id: str, signal_id: int, features: Dict[str, Any]) -> bool:
         """記錄ML特徵數據 - 36個特徵完整版本"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # 36個特徵欄位列表（與表格結構完全一致）
-                feature_columns = [
-                    'session_id', 'signal_id',
-                    # 信號品質核心特徵 (15個)
-                    'strategy_win_rate_recent', 'strategy_win_rate_overall', 'strategy_market_fitness',
-                    'volatility_match_score', 'time_slot_match_score', 'symbol_match_score',
-                    'price_momentum_strength', 'atr_relative_position', 'risk_reward_ratio',
-                    'execution_difficulty', 'consecutive_win_streak', 'consecutive_loss_streak',
-                    'system_overall_performance', 'signal_confidence_score', 'market_condition_fitness',
-                    # 價格關係特徵 (12個)
-                    'price_deviation_percent', 'price_deviation_abs', 'atr_normalized_deviation',
-                    'candle_direction', 'candle_body_size', 'candle_wick_ratio',
-                    'price_position_in_range', 'upward_adjustment_space', 'downward_adjustment_space',
-                    'historical_best_adjustment', 'price_reachability_score', 'entry_price_quality_score',
-                    # 市場環境特徵 (9個)
-                    'hour_of_day', 'trading_session', 'weekend_factor',
-                    'symbol_category', 'current_positions', 'margin_ratio',
-                    'atr_normalized', 'volatility_regime', 'market_trend_strength'
-                ]
-                
-                # 準備數據值，確保完整性
-                feature_values = [session_id, signal_id]
-                for col in feature_columns[2:]:  # 跳過session_id和signal_id
-                    value = features.get(col, 0.0)
-                    # 確保數值類型正確
-                    if col in ['consecutive_win_streak', 'consecutive_loss_streak', 'candle_direction', 
-                               'hour_of_day', 'trading_session', 'weekend_factor', 'symbol_category',
-                               'current_positions', 'volatility_regime']:
-                        feature_values.append(int(value) if value is not None else 0)
-                    else:
-                        feature_values.append(float(value) if value is not None else 0.0)
-                
-                # 生成SQL語句
-                placeholders = ','.join(['?'] * len(feature_columns))
-                columns_str = ','.join(feature_columns)
-                
-                cursor.execute(f'''
-                    INSERT INTO ml_features_v2 ({columns_str})
-                    VALUES ({placeholders})
-                ''', feature_values)
-                
-                conn.commit()
-                return True
+            # 生成SQL語句
+            placeholders = ','.join(['?'] * len(self.FEATURE_COLUMNS))
+            columns_str = ','.join(self.FEATURE_COLUMNS)
+            
+            self._write(f'''
+                INSERT INTO ml_features_v2 (id, {columns_str})
+                VALUES ({next_local_id_sql('ml_features_v2')}, {placeholders})
+            ''', self._build_features_row(session_id, signal_id, features), f"features {signal_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"記錄ML特徵時出錯: {str(e)}")
@@ -193,28 +225,23 @@ class MLDataManager:
                                        assessment: Dict[str, Any]) -> bool:
         """記錄信號品質評估結果 - 修正方法名稱"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO ml_signal_quality 
-                    (session_id, signal_id, decision_method, recommendation, confidence_score,
-                     execution_probability, reason, reasoning_details, model_version)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    session_id,
-                    signal_id,
-                    assessment.get('decision_method', 'RULE_BASED'),
-                    assessment.get('recommendation', 'EXECUTE'),
-                    assessment.get('confidence_score', 0.5),
-                    assessment.get('execution_probability', 0.5),
-                    assessment.get('reason', ''),
-                    assessment.get('reasoning_details', ''),
-                    assessment.get('model_version', 'v1.0')
-                ))
-                
-                conn.commit()
-                return True
+            self._write(f'''
+                INSERT INTO ml_signal_quality 
+                (id, session_id, signal_id, decision_method, recommendation, confidence_score,
+                 execution_probability, reason, reasoning_details, model_version)
+                VALUES ({next_local_id_sql('ml_signal_quality')}, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                session_id,
+                signal_id,
+                assessment.get('decision_method', 'RULE_BASED'),
+                assessment.get('recommendation', 'EXECUTE'),
+                assessment.get('confidence_score', 0.5),
+                assessment.get('execution_probability', 0.5),
+                assessment.get('reason', ''),
+                assessment.get('reasoning_details', ''),
+                assessment.get('model_version', 'v1.0')
+            ), f"signal quality {signal_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"記錄信號品質評估時出錯: {str(e)}")
@@ -224,37 +251,32 @@ class MLDataManager:
                                 optimization: Dict[str, Any]) -> bool:
         """記錄價格優化結果"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO ml_price_optimization 
-                    (session_id, signal_id, original_price, optimized_price, price_adjustment_percent,
-                     optimization_reason, expected_improvement, confidence_level)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    session_id,
-                    signal_id,
-                    optimization.get('original_price', 0.0),
-                    optimization.get('optimized_price', 0.0),
-                    optimization.get('price_adjustment_percent', 0.0),
-                    optimization.get('optimization_reason', ''),
-                    optimization.get('expected_improvement', 0.0),
-                    optimization.get('confidence_level', 0.0)
-                ))
-                
-                conn.commit()
-                return True
+            self._write(f'''
+                INSERT INTO ml_price_optimization 
+                (id, session_id, signal_id, original_price, optimized_price, price_adjustment_percent,
+                 optimization_reason, expected_improvement, confidence_level)
+                VALUES ({next_local_id_sql('ml_price_optimization')}, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                session_id,
+                signal_id,
+                optimization.get('original_price', 0.0),
+                optimization.get('optimized_price', 0.0),
+                optimization.get('price_adjustment_percent', 0.0),
+                optimization.get('optimization_reason', ''),
+                optimization.get('expected_improvement', 0.0),
+                optimization.get('confidence_level', 0.0)
+            ), f"price optimization {signal_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"記錄價格優化時出錯: {str(e)}")
             return False
     
-    def get_recent_signal_quality(self, limit: int = 10) -> List[Dict]:
-        """獲取最近的信號品質評估"""
+    def get_recent_signal_quality(self, limit: int = 10) -> List[tuple]:
+        """獲取最近的信號品質評估（SignalQualityRow）"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+                conn.row_factory = make_row_factory('SignalQualityRow')
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -263,62 +285,55 @@ class MLDataManager:
                     LIMIT ?
                 ''', (limit,))
                 
-                return [dict(row) for row in cursor.fetchall()]
+                return cursor.fetchall()
                 
         except Exception as e:
             logger.error(f"獲取信號品質評估時出錯: {str(e)}")
             return []
     
-    def get_ml_features_by_signal(self, signal_id: int) -> Optional[Dict]:
-        """根據信號ID獲取ML特徵"""
+    def get_ml_features_by_signal(self, signal_id: int) -> Optional[tuple]:
+        """根據信號ID獲取ML特徵（MLFeaturesRow）"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+                conn.row_factory = make_row_factory('MLFeaturesRow')
                 cursor = conn.cursor()
                 
                 cursor.execute('SELECT * FROM ml_features_v2 WHERE signal_id = ?', (signal_id,))
                 row = cursor.fetchone()
                 
-                return dict(row) if row else None
+                return row
                 
         except Exception as e:
             logger.error(f"獲取ML特徵時出錯: {str(e)}")
             return None
     
-    def get_price_optimization_by_signal(self, signal_id: int) -> Optional[Dict]:
-        """根據信號ID獲取價格優化結果"""
+    def get_price_optimization_by_signal(self, signal_id: int) -> Optional[tuple]:
+        """根據信號ID獲取價格優化結果（PriceOptimizationRow）"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+                conn.row_factory = make_row_factory('PriceOptimizationRow')
                 cursor = conn.cursor()
                 
                 cursor.execute('SELECT * FROM ml_price_optimization WHERE signal_id = ?', (signal_id,))
                 row = cursor.fetchone()
                 
-                return dict(row) if row else None
+                return row
                 
         except Exception as e:
             logger.error(f"獲取價格優化時出錯: {str(e)}")
             return None
     
-    def get_ml_table_stats(self) -> Dict[str, int]:
-        """獲取ML表格統計"""
+    def get_ml_table_stats(self, exact: bool = False) -> Dict[str, int]:
+        """獲取ML表格統計（讀取維護的表格計數，exact=True 時逐行計數）"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                stats = {}
-                
-                cursor.execute('SELECT COUNT(*) FROM ml_features_v2')
-                stats['total_ml_features'] = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(*) FROM ml_signal_quality')
-                stats['total_signal_quality'] = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(*) FROM ml_price_optimization')
-                stats['total_price_optimization'] = cursor.fetchone()[0]
-                
-                return stats
+                counts = get_row_counts(conn, ('ml_features_v2', 'ml_signal_quality', 'ml_price_optimization'),
+                                        exact=exact)
+                return {
+                    'total_ml_features': counts['ml_features_v2'],
+                    'total_signal_quality': counts['ml_signal_quality'],
+                    'total_price_optimization': counts['ml_price_optimization']
+                }
                 
         except Exception as e:
             logger.error(f"獲取ML表格統計時出錯: {str(e)}")
@@ -0,0 +1,204 @@
+"""
+分佈分位數草圖模組
+以對數分桶（DDSketch式，相對誤差 RELATIVE_ACCURACY）保存盈虧、盈虧百分比、持倉時間與執行延遲的分佈，
+按信號類型與交易對分組的桶計數由 analytics_aggregates 的觸發器增量維護；
+各組草圖可直接相加合併，分位數查詢只需累加少量桶計數，不需要排序原始數據
+=============================================================================
+"""
+import math
+import bisect
+import sqlite3
+from typing import Dict, Iterable, Optional
+
+# 相對誤差：分位數估計值與真實值相差不超過1%
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+# 絕對值小於 MIN_VALUE 的值歸入0桶，超過 MAX_VALUE 的值歸入最後一桶
+MIN_VALUE = 1e-4
+MAX_VALUE = 1e9
+BUCKET_COUNT = math.ceil(math.log(MAX_VALUE / MIN_VALUE) / math.log(GAMMA))
+
+# 指標 -> 來源表及欄位
+RESULT_METRICS = ('final_pnl', 'pnl_percentage', 'holding_time_minutes')
+ORDER_METRICS = ('execution_delay_ms',)
+METRICS = RESULT_METRICS + ORDER_METRICS
+
+# 分組維度：信號類型（經訂單關聯信號）與交易對（結果/訂單本身的symbol）
+DIMENSIONS = ('signal_type', 'symbol')
+
+DISTRIBUTION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS analytics_distribution_buckets (
+        metric TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        group_key TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (metric, dimension, group_key, bucket)
+    ) WITHOUT ROWID
+'''
+
+# 桶下界表：觸發器按主鍵查找值所在的桶（不依賴SQLite數學函數）
+BOUNDS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS analytics_sketch_bounds (
+        lower REAL PRIMARY KEY,
+        bucket INTEGER NOT NULL
+    ) WITHOUT ROWID
+'''
+
+def bucket_sql(value: str) -> str:
+    """值所在桶的SQL表達式：負值為負桶號，接近0的值為0桶"""
+    return (f"(CASE WHEN {value} < 0 THEN -1 ELSE 1 END * COALESCE("
+            f"(SELECT bucket FROM analytics_sketch_bounds WHERE lower <= ABS({value}) "
+            f"ORDER BY lower DESC LIMIT 1), 0))")
+
+def bucket_value(bucket: int) -> float:
+    """桶的代表值（相對誤差不超過 RELATIVE_ACCURACY）"""
+    if bucket == 0:
+        return 0.0
+    lower = MIN_VALUE * GAMMA ** (abs(bucket) - 1)
+    return math.copysign(lower * 2 * GAMMA / (GAMMA + 1), bucket)
+
+_RESULT_METRIC_VALUE = ('CASE m.metric ' + ' '.join(f"WHEN '{metric}' THEN r.{metric}" for metric in RESULT_METRICS)
+                        + ' END')
+_RESULT_METRIC_NAMES = ' UNION ALL '.join(f"SELECT '{metric}' AS metric" for metric in RESULT_METRICS)
+
+_UPSERT = '''
+    ON CONFLICT(metric, dimension, group_key, bucket) DO UPDATE SET count = count + excluded.count;
+'''
+
+# ----------------------------------------------------------------------
+# 桶計數貢獻：與 analytics_aggregates 的聚合貢獻使用相同的佔位符，
+# {signals}/{orders}/{results} 為各表的行來源，{sign} 為 1/-1
+# ----------------------------------------------------------------------
+
+SKETCH_CONTRIBUTIONS = (
+    # 信號類型維度：經訂單關聯信號
+    f'''
+    INSERT INTO analytics_distribution_buckets (metric, dimension, group_key, bucket, count)
+    SELECT metric, 'signal_type', signal_type, {bucket_sql('value')}, {{sign}} * COUNT(*)
+    FROM (
+        SELECT s.signal_type, m.metric, {_RESULT_METRIC_VALUE} AS value
+        FROM {{signals}} s
+        JOIN {{orders}} o ON o.signal_id = s.id
+        JOIN {{results}} r ON r.order_id = o.id
+        JOIN ({_RESULT_METRIC_NAMES}) m
+    )
+    WHERE value IS NOT NULL
+    GROUP BY 1, 3, 4
+    {_UPSERT}''',
+    f'''
+    INSERT INTO analytics_distribution_buckets (metric, dimension, group_key, bucket, count)
+    SELECT 'execution_delay_ms', 'signal_type', s.signal_type, {bucket_sql('o.execution_delay_ms')}, {{sign}} * COUNT(*)
+    FROM {{signals}} s
+    JOIN {{orders}} o ON o.signal_id = s.id
+    WHERE o.execution_delay_ms IS NOT NULL
+    GROUP BY 3, 4
+    {_UPSERT}''',
+    # 交易對維度：結果/訂單本身的symbol
+    f'''
+    INSERT INTO analytics_distribution_buckets (metric, dimension, group_key, bucket, count)
+    SELECT metric, 'symbol', symbol, {bucket_sql('value')}, {{sign}} * COUNT(*)
+    FROM (
+        SELECT r.symbol, m.metric, {_RESULT_METRIC_VALUE} AS value
+        FROM {{results}} r
+        JOIN ({_RESULT_METRIC_NAMES}) m
+    )
+    WHERE value IS NOT NULL AND symbol IS NOT NULL
+    GROUP BY 1, 3, 4
+    {_UPSERT}''',
+    f'''
+    INSERT INTO analytics_distribution_buckets (metric, dimension, group_key, bucket, count)
+    SELECT 'execution_delay_ms', 'symbol', o.symbol, {bucket_sql('o.execution_delay_ms')}, {{sign}} * COUNT(*)
+    FROM {{orders}} o
+    WHERE o.execution_delay_ms IS NOT NULL AND o.symbol IS NOT NULL
+    GROUP BY 3, 4
+    {_UPSERT}'''
+)
+
+def init_sketch_bounds(conn: sqlite3.Connection) -> bool:
+    """
+    建立桶下界表（分桶參數變更時重新生成）
+
+    Returns:
+        bool: 是否重新生成（桶計數需要重建）
+    """
+    cursor = conn.cursor()
+    cursor.execute(BOUNDS_TABLE)
+    row = cursor.execute("SELECT COUNT(*), MIN(lower) FROM analytics_sketch_bounds").fetchone()
+    if row[0] == BUCKET_COUNT and row[1] == MIN_VALUE:
+        return False
+
+    cursor.execute("DELETE FROM analytics_sketch_bounds")
+    cursor.executemany(
+        "INSERT INTO analytics_sketch_bounds (lower, bucket) VALUES (?, ?)",
+        ((MIN_VALUE * GAMMA ** (bucket - 1), bucket) for bucket in range(1, BUCKET_COUNT + 1))
+    )
+    return True
+
+class QuantileSketch:
+    """可合併的分位數草圖（桶號 -> 計數）"""
+
+    __slots__ = ('buckets', '_keys', '_cumulative')
+
+    def __init__(self, buckets: Optional[Dict[int, int]] = None):
+        self.buckets = {bucket: count for bucket, count in (buckets or {}).items() if count > 0}
+        self._keys = None
+        self._cumulative = None
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets.values())
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """合併為新的草圖（各桶計數相加）"""
+        merged = dict(self.buckets)
+        for bucket, count in other.buckets.items():
+            merged[bucket] = merged.get(bucket, 0) + count
+        return QuantileSketch(merged)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        分位數估計
+
+        Args:
+            q: 0 到 1 之間的分位點
+        """
+        if self._keys is None:
+            self._keys = sorted(self.buckets)
+            self._cumulative = []
+            total = 0
+            for bucket in self._keys:
+                total += self.buckets[bucket]
+                self._cumulative.append(total)
+        if not self._keys:
+            return None
+
+        rank = min(max(q, 0.0), 1.0) * (self._cumulative[-1] - 1)
+        return bucket_value(self._keys[bisect.bisect_right(self._cumulative, rank)])
+
+def load_sketches(conn: sqlite3.Connection, metric: str, dimension: str) -> Dict[str, QuantileSketch]:
+    """讀取某個指標與維度下各組的草圖"""
+    grouped: Dict[str, Dict[int, int]] = {}
+    for group_key, bucket, count in conn.execute('''
+        SELECT group_key, bucket, count FROM analytics_distribution_buckets
+        WHERE metric = ? AND dimension = ? AND count > 0
+    ''', (metric, dimension)):
+        grouped.setdefault(group_key, {})[bucket] = count
+    return {group_key: QuantileSketch(buckets) for group_key, buckets in grouped.items()}
+
+def summarize(sketch: QuantileSketch, percentiles: Iterable[float]) -> Dict[str, object]:
+    """草圖的樣本數與各百分位數"""
+    return {
+        'count': sketch.count,
+        'percentiles': {
+            f'p{percentile:g}': (round(value, 4) if value is not None else None)
+            for percentile, value in ((p, sketch.quantile(p / 100)) for p in percentiles)
+        }
+    }
+
+def merge_all(sketches: Iterable[QuantileSketch]) -> QuantileSketch:
+    merged = QuantileSketch()
+    for sketch in sketches:
+        merged = merged.merge(sketch)
+    return merged
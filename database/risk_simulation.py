@@ -0,0 +1,256 @@
+"""
+蒙地卡羅風險模擬模組
+以各策略組合實際的 trading_results.pnl_percentage 有放回抽樣生成交易序列（NumPy向量化），
+模擬分塊分派到進程池並行計算，返回最終報酬、最大回撤的百分位帶、權益路徑的信賴帶與破產機率；
+分塊大小固定，相同種子的結果與進程數無關，運算時間隨核心數線性縮短
+=============================================================================
+"""
+import os
+import sys
+import time
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+from .analytics_aggregates import NULL_OPPOSITE, get_data_version
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 每個策略的模擬路徑數與每條路徑的交易筆數
+SIMULATIONS = int(os.environ.get('MONITOR_RISK_SIMULATIONS', '10000'))
+HORIZON = int(os.environ.get('MONITOR_RISK_HORIZON', '100'))
+# 進程數（預設為CPU核心數）
+MAX_WORKERS = int(os.environ.get('MONITOR_RISK_WORKERS', '0')) or os.cpu_count() or 1
+
+# 權益跌至初始資金的 (1 - RUIN_LOSS) 以下視為破產
+RUIN_LOSS = 0.5
+# 樣本少於此筆數的策略不模擬
+MIN_TRADES = 30
+# 每個任務的路徑數（固定分塊讓結果與進程數無關）
+CHUNK_PATHS = 500
+# 權益信賴帶的最多點數
+BAND_POINTS = 50
+
+_SAMPLE_QUERY = f"""
+    SELECT s.signal_type, COALESCE(s.opposite, {NULL_OPPOSITE}), r.pnl_percentage
+    FROM trading_results r
+    JOIN orders_executed o ON o.id = r.order_id
+    JOIN signals_received s ON s.id = o.signal_id
+    WHERE r.pnl_percentage IS NOT NULL
+"""
+
+def _simulate_chunk(returns: 'np.ndarray', paths: int, horizon: int, position_fraction: float,
+                    ruin_equity: float, band_steps: 'np.ndarray', seed) -> Tuple:
+    """
+    模擬一塊路徑（進程池任務）
+
+    Returns:
+        Tuple: (最終權益, 最大回撤, 是否破產, 信賴帶步驟的權益)
+    """
+    rng = np.random.default_rng(seed)
+    draws = rng.choice(returns, size=(paths, horizon))
+    equity = np.cumprod(np.maximum(1.0 + position_fraction * draws / 100.0, 0.0), axis=1)
+    peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)
+    max_drawdown = (1.0 - equity / peak).max(axis=1)
+    ruined = equity.min(axis=1) <= ruin_equity
+    return equity[:, -1], max_drawdown, ruined, equity[:, band_steps]
+
+def _percentiles(values: 'np.ndarray', percentiles: Tuple[float, ...]) -> Dict[str, float]:
+    """百分位數（以百分比表示）"""
+    return {f'p{p:g}': round(float(v) * 100, 4) for p, v in zip(percentiles, np.percentile(values, percentiles))}
+
+class RiskSimulator:
+    """蒙地卡羅風險模擬"""
+
+    def __init__(self, connect: Callable, max_workers: int = MAX_WORKERS):
+        """
+        Args:
+            connect: 返回連接上下文管理器的函數（通常為 AnalyticsManager._connect）
+            max_workers: 進程池大小
+        """
+        self.connect = connect
+        self.max_workers = max_workers
+        self._cache_lock = threading.Lock()
+        self._cache_version = None
+        self._cache = {}
+
+    @staticmethod
+    def is_available() -> bool:
+        """NumPy是否可用"""
+        return np is not None
+
+    @staticmethod
+    def _load_samples(conn: sqlite3.Connection) -> Dict[Tuple[str, int], 'np.ndarray']:
+        """各策略組合的盈虧百分比樣本"""
+        grouped: Dict[Tuple[str, int], List[float]] = {}
+        for signal_type, opposite, pnl_percentage in conn.execute(_SAMPLE_QUERY):
+            grouped.setdefault((signal_type, opposite), []).append(pnl_percentage)
+        return {key: np.array(values, dtype=np.float64) for key, values in grouped.items()}
+
+    def simulate(self, simulations: int = SIMULATIONS, horizon: int = HORIZON, position_fraction: float = 1.0,
+                 ruin_loss: float = RUIN_LOSS, percentiles: Tuple[float, ...] = (5, 25, 50, 75, 95),
+                 min_trades: int = MIN_TRADES, seed: int = 0) -> Dict[str, Any]:
+        """
+        按策略組合及全部交易進行模擬
+
+        Args:
+            simulations: 每個策略的模擬路徑數
+            horizon: 每條路徑的交易筆數
+            position_fraction: 每筆交易的盈虧百分比作用於權益的比例（1 為全部權益複利）
+            ruin_loss: 權益虧損達此比例視為破產（0-1）
+            percentiles: 百分位帶（0-100）
+            min_trades: 策略的最少樣本數
+            seed: 隨機種子（相同數據與參數的結果可重現，並按數據版本快取）
+
+        Returns:
+            Dict: overall / strategies（最終報酬、最大回撤的百分位數與權益信賴帶，均為百分比）
+        """
+        if np is None:
+            raise RuntimeError('風險模擬需要 NumPy')
+        if simulations < 1 or horizon < 1:
+            raise ValueError('模擬路徑數與交易筆數必須為正數')
+        if not 0 < ruin_loss <= 1:
+            raise ValueError('破產虧損比例必須在 0 到 1 之間')
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise ValueError('百分位必須在 0 到 100 之間')
+
+        key = (simulations, horizon, position_fraction, ruin_loss, tuple(percentiles), min_trades, seed)
+        with self.connect() as conn:
+            version = get_data_version(conn)
+            with self._cache_lock:
+                if version is not None and version == self._cache_version and key in self._cache:
+                    return self._cache[key]
+            samples = self._load_samples(conn)
+
+        started = time.monotonic()
+        targets = {group: values for group, values in samples.items() if len(values) >= min_trades}
+        if samples:
+            all_values = np.concatenate(list(samples.values()))
+            if len(all_values) >= min_trades:
+                targets[None] = all_values
+
+        simulated, workers = self._run(targets, simulations, horizon, position_fraction, 1.0 - ruin_loss, seed)
+
+        band_steps = self._band_steps(horizon)
+        summaries = {
+            target: self._summarize(len(targets[target]), chunks, percentiles, band_steps)
+            for target, chunks in simulated.items()
+        }
+        strategies = []
+        for (signal_type, opposite), summary in ((t, s) for t, s in summaries.items() if t is not None):
+            opposite = None if opposite == NULL_OPPOSITE else opposite
+            strategies.append(dict({
+                'strategy_combo': f"{signal_type}_opposite_{opposite}",
+                'signal_type': signal_type,
+                'opposite': opposite
+            }, **summary))
+        strategies.sort(key=lambda strategy: -strategy['trades'])
+
+        result = {
+            'simulations': simulations,
+            'horizon': horizon,
+            'position_fraction': position_fraction,
+            'ruin_loss': ruin_loss,
+            'workers': workers,
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+            'overall': summaries.get(None),
+            'strategies': strategies,
+            'skipped_strategies': len(samples) - len(strategies)
+        }
+        with self._cache_lock:
+            if version != self._cache_version:
+                self._cache = {}
+                self._cache_version = version
+            if version is not None:
+                self._cache[key] = result
+        return result
+
+    @staticmethod
+    def _band_steps(horizon: int) -> 'np.ndarray':
+        return np.unique(np.linspace(0, horizon - 1, min(horizon, BAND_POINTS)).astype(np.int64))
+
+    def _run(self, targets: Dict, simulations: int, horizon: int, position_fraction: float,
+             ruin_equity: float, seed: int) -> Tuple[Dict[Any, List[Tuple]], int]:
+        """
+        將各策略的路徑按 CHUNK_PATHS 分塊，分派到進程池
+
+        Returns:
+            Tuple: (策略 -> 各塊結果, 使用的進程數)
+        """
+        band_steps = self._band_steps(horizon)
+        tasks = []
+        for index, (target, returns) in enumerate(sorted(targets.items(), key=lambda item: str(item[0]))):
+            sizes = [min(CHUNK_PATHS, simulations - start) for start in range(0, simulations, CHUNK_PATHS)]
+            seeds = np.random.SeedSequence([seed, index]).spawn(len(sizes))
+            tasks.extend((target, (returns, size, horizon, position_fraction, ruin_equity, band_steps, chunk_seed))
+                         for size, chunk_seed in zip(sizes, seeds))
+
+        results: Dict[Any, List[Tuple]] = {target: [] for target in targets}
+        workers = min(self.max_workers, len(tasks))
+        if workers <= 1:
+            for target, args in tasks:
+                results[target].append(_simulate_chunk(*args))
+            return results, 1
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(target, executor.submit(_simulate_chunk, *args)) for target, args in tasks]
+            for target, future in futures:
+                results[target].append(future.result())
+        return results, workers
+
+    @staticmethod
+    def _summarize(trades: int, chunks: List[Tuple], percentiles: Tuple[float, ...],
+                   band_steps: 'np.ndarray') -> Dict[str, Any]:
+        final_equity = np.concatenate([chunk[0] for chunk in chunks])
+        max_drawdown = np.concatenate([chunk[1] for chunk in chunks])
+        ruined = np.concatenate([chunk[2] for chunk in chunks])
+        band_equity = np.concatenate([chunk[3] for chunk in chunks])
+
+        band_values = np.percentile(band_equity - 1.0, percentiles, axis=0)
+        bands = [
+            dict({'trade': int(step) + 1},
+                 **{f'p{p:g}': round(float(band_values[i][j]) * 100, 4) for i, p in enumerate(percentiles)})
+            for j, step in enumerate(band_steps)
+        ]
+        return {
+            'trades': trades,
+            'risk_of_ruin': round(float(ruined.mean()), 6),
+            'final_return': _percentiles(final_equity - 1.0, percentiles),
+            'max_drawdown': _percentiles(max_drawdown, percentiles),
+            'equity_bands': bands
+        }
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    positional = [a for a in args if not a.startswith('--')]
+    db_path = positional[0] if positional else os.path.join('data', 'trading_signals.db')
+    options = dict(a[2:].split('=', 1) for a in args if a.startswith('--') and '=' in a)
+
+    if not os.path.exists(db_path):
+        print(f"❌ 資料庫不存在: {db_path}")
+        return
+
+    def connect():
+        return sqlite3.connect(db_path)
+
+    simulator = RiskSimulator(connect, max_workers=int(options.get('workers', MAX_WORKERS)))
+    result = simulator.simulate(simulations=int(options.get('simulations', SIMULATIONS)),
+                                horizon=int(options.get('horizon', HORIZON)),
+                                position_fraction=float(options.get('fraction', 1.0)))
+    print(f"✅ 模擬完成: {result['workers']} 進程，{result['elapsed_ms']} ms")
+    for strategy in ([dict(result['overall'], strategy_combo='全部')] if result['overall'] else []) + result['strategies']:
+        print(f"  {strategy['strategy_combo']}: {strategy['trades']} 筆樣本，破產機率 {strategy['risk_of_ruin']:.2%}，"
+              f"最終報酬 {strategy['final_return']}，最大回撤 {strategy['max_drawdown']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+滾動時間窗口統計模組
+在記憶體中為常用窗口（24小時、7天、30天）維護交易結果的勝率與盈虧累計值，
+新結果按來源分區的ID水位增量讀入，每筆結果的加入與過期都是O(1)
+=============================================================================
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+from .analytics_aggregates import get_data_version
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 支援的時間窗口（秒）
+ANALYTICS_WINDOWS = {
+    '24h': 86400,
+    '7d': 7 * 86400,
+    '30d': 30 * 86400
+}
+
+# 增量讀取只補入新結果，定期完整重載以反映既有結果的更新與刪除
+ROLLING_RELOAD_SECONDS = float(os.environ.get('MONITOR_ROLLING_RELOAD_SECONDS', '300'))
+
+# 來源分區ID：slot << 40 | 遠程ID（見 sync.source_registry）
+_ID_PARTITION_BITS = 40
+
+# 讀取交易結果及其信號類型（結果時間戳索引範圍掃描）
+_RESULT_QUERY = """
+    SELECT r.id, r.result_timestamp, s.signal_type, r.is_successful, r.final_pnl
+    FROM trading_results r
+    LEFT JOIN orders_executed o ON o.id = r.order_id
+    LEFT JOIN signals_received s ON s.id = o.signal_id
+"""
+
+class _WindowAccumulator:
+    """單一窗口：按結果時間排序的記錄及其累計值"""
+
+    def __init__(self, span: float):
+        self.span = span
+        self.entries = deque()
+        self.totals = [0, 0, 0.0, 0]    # 交易數、勝場、盈虧和、盈虧非NULL數
+        self.by_signal_type: Dict[str, list] = {}
+
+    def _apply(self, entry: tuple, sign: int):
+        _, signal_type, is_win, pnl = entry
+        targets = [self.totals]
+        if signal_type is not None:
+            targets.append(self.by_signal_type.setdefault(signal_type, [0, 0, 0.0, 0]))
+        for totals in targets:
+            totals[0] += sign
+            totals[1] += sign * is_win
+            if pnl is not None:
+                totals[2] += sign * pnl
+                totals[3] += sign
+
+    def add(self, entry: tuple):
+        # 結果大致按時間到達，亂序時才需要插入到中間
+        if self.entries and entry[0] < self.entries[-1][0]:
+            index = bisect.bisect_right([e[0] for e in self.entries], entry[0])
+            self.entries.insert(index, entry)
+        else:
+            self.entries.append(entry)
+        self._apply(entry, 1)
+
+    def expire(self, now: float):
+        cutoff = now - self.span
+        while self.entries and self.entries[0][0] < cutoff:
+            self._apply(self.entries.popleft(), -1)
+
+class RollingWindowStats:
+    """常用時間窗口的滾動勝率統計"""
+
+    def __init__(self, connect: Callable, reload_seconds: float = ROLLING_RELOAD_SECONDS):
+        """
+        Args:
+            connect: 返回連接上下文管理器的函數（通常為 AnalyticsManager._connect）
+            reload_seconds: 完整重載間隔
+        """
+        self.connect = connect
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._windows: Optional[Dict[str, _WindowAccumulator]] = None
+        self._watermarks: Dict[int, int] = {}
+        self._data_version = None
+        self._loaded_at = 0.0
+
+    @staticmethod
+    def _slots(conn):
+        """以主鍵跳躍查找現有的來源分區（每個分區一次索引查找）"""
+        slots = []
+        next_id = 0
+        while True:
+            row = conn.execute("SELECT MIN(id) FROM trading_results WHERE id >= ?", (next_id,)).fetchone()
+            if row[0] is None:
+                return slots
+            slot = row[0] >> _ID_PARTITION_BITS
+            slots.append(slot)
+            next_id = (slot + 1) << _ID_PARTITION_BITS
+
+    def _reload(self, conn, now: float):
+        """從結果時間戳索引讀取最長窗口內的結果"""
+        self._windows = {name: _WindowAccumulator(span) for name, span in ANALYTICS_WINDOWS.items()}
+
+        # 先取水位再讀取：讀取期間新寫入的結果留給下次增量讀取
+        self._watermarks = {
+            slot: conn.execute(
+                "SELECT MAX(id) FROM trading_results WHERE id >= ? AND id < ?",
+                (slot << _ID_PARTITION_BITS, (slot + 1) << _ID_PARTITION_BITS)
+            ).fetchone()[0]
+            for slot in self._slots(conn)
+        }
+        rows = conn.execute(
+            _RESULT_QUERY + " WHERE r.result_timestamp >= ? ORDER BY r.result_timestamp",
+            (now - max(ANALYTICS_WINDOWS.values()),)
+        ).fetchall()
+        self._add_rows([
+            row for row in rows
+            if row[0] <= self._watermarks.get(row[0] >> _ID_PARTITION_BITS, -1)
+        ], now)
+        self._loaded_at = now
+
+    def _add_rows(self, rows, now: float):
+        for result_id, result_timestamp, signal_type, is_successful, final_pnl in rows:
+            if result_timestamp is None:
+                continue
+            entry = (result_timestamp, signal_type, 1 if is_successful == 1 else 0, final_pnl)
+            for window in self._windows.values():
+                if result_timestamp >= now - window.span:
+                    window.add(entry)
+
+    def _refresh(self, conn, now: float):
+        """按各分區ID水位讀入新結果（主鍵範圍掃描）"""
+        rows = []
+        for slot in self._slots(conn):
+            watermark = self._watermarks.get(slot, (slot << _ID_PARTITION_BITS) - 1)
+            slot_rows = conn.execute(
+                _RESULT_QUERY + " WHERE r.id > ? AND r.id < ?",
+                (watermark, (slot + 1) << _ID_PARTITION_BITS)
+            ).fetchall()
+            if slot_rows:
+                self._watermarks[slot] = max(row[0] for row in slot_rows)
+                rows.extend(slot_rows)
+        rows.sort(key=lambda row: row[1] if row[1] is not None else 0)
+        self._add_rows(rows, now)
+
+    def _sync(self, now: float):
+        with self.connect() as conn:
+            data_version = get_data_version(conn)
+            if (self._windows is None or data_version is None
+                    or now - self._loaded_at >= self.reload_seconds):
+                self._reload(conn, now)
+            elif data_version != self._data_version:
+                self._refresh(conn, now)
+            self._data_version = data_version
+
+        for window in self._windows.values():
+            window.expire(now)
+
+    def get_win_rate_stats(self, window: str) -> Dict[str, Any]:
+        """
+        窗口內的勝率統計（格式同 AnalyticsManager.get_win_rate_stats）
+
+        Args:
+            window: ANALYTICS_WINDOWS 中的窗口名稱
+        """
+        now = time.time()
+        with self._lock:
+            self._sync(now)
+            accumulator = self._windows[window]
+            total, wins, pnl_sum, pnl_count = accumulator.totals
+            by_signal_type = [(signal_type, list(totals)) for signal_type, totals in accumulator.by_signal_type.items()
+                              if totals[0] > 0]
+
+        signal_stats = []
+        for signal_type, (type_total, type_wins, type_pnl, type_pnl_count) in sorted(
+                by_signal_type, key=lambda item: -item[1][1]):
+            signal_stats.append({
+                'signal_type': signal_type,
+                'total': type_total,
+                'wins': type_wins,
+                'win_rate': round(type_wins / type_total * 100, 1),
+                'total_pnl': round(type_pnl if type_pnl_count else 0, 4),
+                'avg_pnl': round(type_pnl / type_pnl_count if type_pnl_count else 0, 4)
+            })
+
+        return {
+            'overall_win_rate': round((wins / total * 100) if total > 0 else 0, 1),
+            'total_trades': total,
+            'successful_trades': wins if total else None,
+            'total_pnl': round(pnl_sum if pnl_count else 0, 4),
+            'by_signal_type': signal_stats
+        }
+
+def resolve_time_range(window: Optional[str] = None, start_ts: Optional[float] = None,
+                       end_ts: Optional[float] = None) -> Optional[Tuple[float, float]]:
+    """
+    將窗口名稱或明確範圍轉為 [start, end) 時間戳範圍
+
+    Returns:
+        Optional[Tuple]: 未指定窗口與範圍時返回None（全部時間）
+    """
+    if window is None and start_ts is None and end_ts is None:
+        return None
+    if window is not None:
+        if window not in ANALYTICS_WINDOWS:
+            raise ValueError(f'不支援的時間窗口: {window}（可用: {", ".join(ANALYTICS_WINDOWS)}）')
+        end = end_ts if end_ts is not None else time.time()
+        return end - ANALYTICS_WINDOWS[window], end
+    return (start_ts if start_ts is not None else float('-inf'),
+            end_ts if end_ts is not None else float('inf'))
@@ -0,0 +1,139 @@
+"""
+輕量行模型模組
+查詢結果直接構造為按欄位生成的 namedtuple（無實例字典），
+並可不經 dict 直接序列化為JSON
+=============================================================================
+"""
+import json
+import sqlite3
+import threading
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+from .signal_payload import LazySignalPayload
+
+# (類型名, 欄位) -> 行類型
+_row_types: Dict[Tuple[str, Tuple[str, ...]], type] = {}
+_row_types_lock = threading.Lock()
+
+# 逐行序列化時的值分隔符：JSON編碼會轉義所有控制字元，編碼後的值不可能包含它
+_VALUE_SEPARATOR = '\x00'
+
+def _json_default(value: Any) -> Any:
+    """json.dumps 的default鉤子"""
+    if isinstance(value, LazySignalPayload):
+        return value.text
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f'無法序列化的值類型: {type(value).__name__}')
+
+def get_row_type(type_name: str, columns: Sequence[str]) -> type:
+    """
+    獲取（必要時生成）欄位對應的行類型
+
+    行類型是帶 __slots__ = () 的 namedtuple，支援屬性存取、
+    按位置索引，以及兼容舊有dict用法的 row['欄位'] / row.get('欄位')
+    """
+    columns = tuple(columns)
+    key = (type_name, columns)
+    row_type = _row_types.get(key)
+    if row_type is not None:
+        return row_type
+
+    with _row_types_lock:
+        row_type = _row_types.get(key)
+        if row_type is None:
+            # 非法識別字的欄位名（如 COUNT(*)）以位置名代替，原欄位名保存在 _columns
+            base = namedtuple(type_name, columns, rename=True)
+            row_type = type(type_name, (base,), {
+                '__slots__': (),
+                '_columns': columns,
+                '_json_template': '{' + ','.join(json.dumps(c).replace('%', '%%') + ':%s' for c in columns) + '}',
+                '_index': {c: i for i, c in enumerate(columns)},
+                '__getitem__': _getitem,
+                'get': _get,
+                'keys': _keys,
+                'to_dict': _to_dict
+            })
+            _row_types[key] = row_type
+    return row_type
+
+def _getitem(self, key):
+    if isinstance(key, str):
+        try:
+            key = self._index[key]
+        except KeyError:
+            raise KeyError(key) from None
+    return tuple.__getitem__(self, key)
+
+def _get(self, key: str, default: Any = None) -> Any:
+    index = self._index.get(key)
+    return default if index is None else tuple.__getitem__(self, index)
+
+def _keys(self) -> Tuple[str, ...]:
+    return self._columns
+
+def _to_dict(self) -> Dict[str, Any]:
+    return dict(zip(self._columns, self))
+
+def make_row_factory(type_name: str,
+                     converters: Optional[Dict[str, Callable[[Any], Any]]] = None) -> Callable:
+    """
+    生成 sqlite3 row_factory：按查詢欄位生成行類型，只在欄位變化時重新查找
+
+    工廠會記住最近一次查詢的欄位，每個連接使用各自的工廠
+
+    Args:
+        type_name: 行類型名稱
+        converters: 欄位 -> 轉換函數（如延遲解碼的信號原始數據）
+    """
+    state = {'description': None}
+
+    def factory(cursor: sqlite3.Cursor, row: tuple):
+        if cursor.description is not state['description']:
+            columns = tuple(d[0] for d in cursor.description)
+            state['description'] = cursor.description
+            state['row_type'] = get_row_type(type_name, columns)
+            state['converters'] = [
+                (i, converters[c]) for i, c in enumerate(columns) if c in converters
+            ] if converters else []
+
+        if state['converters']:
+            row = list(row)
+            for index, converter in state['converters']:
+                if row[index] is not None:
+                    row[index] = converter(row[index])
+        return tuple.__new__(state['row_type'], row)
+
+    return factory
+
+def rows_to_json(rows: Iterable[tuple]) -> str:
+    """
+    將行模型列表序列化為JSON物件陣列
+
+    以單次 json.dumps 編碼全部值（C實現），再按行類型的欄位模板拼接，
+    不為每行構造dict
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    if not rows:
+        return '[]'
+
+    row_type = type(rows[0])
+    if not hasattr(row_type, '_json_template') or any(type(row) is not row_type for row in rows):
+        return json.dumps([row.to_dict() if hasattr(row, 'to_dict') else row for row in rows],
+                          ensure_ascii=False, default=_json_default)
+
+    template = row_type._json_template
+    encoded = json.dumps(rows, separators=(_VALUE_SEPARATOR, ':'), default=_json_default)
+    # encoded 形如 [[v1\0v2]\0[v1\0v2]]，值中的控制字元都已轉義
+    row_separator = ']' + _VALUE_SEPARATOR + '['
+    return '[' + ','.join([
+        template % tuple(values.split(_VALUE_SEPARATOR))
+        for values in encoded[2:-2].split(row_separator)
+    ]) + ']'
+
+def row_to_json(row: Optional[tuple]) -> str:
+    """將單個行模型序列化為JSON物件"""
+    return rows_to_json([row])[1:-1] if row is not None else 'null'
+
+# 信號原始數據延遲解碼
+SIGNAL_CONVERTERS = {'signal_data_json': LazySignalPayload}
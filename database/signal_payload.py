@@ -0,0 +1,198 @@
+"""
+信號原始數據編碼模組
+signal_data_json 以帶格式標記的二進制BLOB保存（預設字典壓縮的deflate），
+讀取時按需解碼；舊有的JSON文本記錄可直接讀取，並可用遷移工具批量轉換
+=============================================================================
+用法:
+    python -m database.signal_payload --migrate [資料庫路徑] [--batch-size N] [--vacuum]
+    python -m database.signal_payload --stats [資料庫路徑]
+"""
+import os
+import sys
+import json
+import zlib
+import sqlite3
+import logging
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Union
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 格式標記（BLOB首字節）
+FORMAT_JSON = 0x00          # 未壓縮的UTF-8 JSON（壓縮無收益的極短數據）
+FORMAT_DEFLATE_V1 = 0x01    # 以 PAYLOAD_ZDICT_V1 為預設字典的raw deflate
+
+# 以二進制編碼保存的欄位
+PAYLOAD_COLUMNS = {
+    'signals_received': ('signal_data_json',)
+}
+
+# 預設字典：信號JSON的常見鍵名，單筆數據只有數百字節，字典讓短數據也能有效壓縮
+# 字典內容與格式標記綁定，修改時必須新增格式標記
+PAYLOAD_ZDICT_V1 = (
+    b'"BUY", "SELL", "LIMIT", "MARKET", "CROSSED", "ISOLATED", '
+    b'{"signal_type": "", "symbol": "USDT", "side": "", "open": "", "close": "", '
+    b'"prev_close": "", "prev_open": "", "ATR": "", "opposite": 0, "strategy_name": "", '
+    b'"quantity": "", "order_type": "", "margin_type": "", "precision": , "tp_multiplier": '
+)
+
+def encode_signal_payload(value: Union[Dict[str, Any], str, bytes, None]) -> Optional[bytes]:
+    """
+    編碼信號原始數據
+
+    Args:
+        value: 信號字典、JSON文本或已編碼的BLOB（原樣返回）
+
+    Returns:
+        bytes: 帶格式標記的BLOB
+    """
+    if value is None or isinstance(value, bytes):
+        return value
+    if isinstance(value, LazySignalPayload):
+        return value.raw if isinstance(value.raw, bytes) else encode_signal_payload(value.raw)
+
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    data = text.encode('utf-8')
+
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=PAYLOAD_ZDICT_V1)
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) < len(data):
+        return bytes((FORMAT_DEFLATE_V1,)) + compressed
+    return bytes((FORMAT_JSON,)) + data
+
+def decode_signal_payload_text(value: Union[str, bytes, None]) -> Optional[str]:
+    """解碼為JSON文本（兼容未遷移的文本記錄）"""
+    if value is None or isinstance(value, str):
+        return value
+
+    tag, body = value[0], value[1:]
+    if tag == FORMAT_DEFLATE_V1:
+        decompressor = zlib.decompressobj(-15, zdict=PAYLOAD_ZDICT_V1)
+        return (decompressor.decompress(body) + decompressor.flush()).decode('utf-8')
+    if tag == FORMAT_JSON:
+        return body.decode('utf-8')
+    raise ValueError(f'未知的信號數據格式標記: {tag}')
+
+def decode_signal_payload(value: Union[str, bytes, None]) -> Optional[Dict[str, Any]]:
+    """解碼為信號字典"""
+    text = decode_signal_payload_text(value)
+    return json.loads(text) if text is not None else None
+
+class LazySignalPayload(Mapping):
+    """延遲解碼的信號原始數據，首次存取鍵值時才解壓與解析"""
+
+    __slots__ = ('raw', '_data')
+
+    def __init__(self, raw: Union[str, bytes, None]):
+        self.raw = raw
+        self._data = None
+
+    def _decoded(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = decode_signal_payload(self.raw) or {}
+        return self._data
+
+    @property
+    def text(self) -> Optional[str]:
+        """JSON文本"""
+        return decode_signal_payload_text(self.raw)
+
+    def __getitem__(self, key: str) -> Any:
+        return self._decoded()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._decoded())
+
+    def __len__(self) -> int:
+        return len(self._decoded())
+
+    def __repr__(self) -> str:
+        state = 'decoded' if self._data is not None else f'{len(self.raw or "")} bytes'
+        return f'LazySignalPayload({state})'
+
+def get_payload_stats(db_path: str) -> Dict[str, int]:
+    """統計各編碼格式的記錄數與字節數"""
+    with sqlite3.connect(db_path) as conn:
+        stats = {}
+        for typename, count, total_bytes in conn.execute("""
+            SELECT typeof(signal_data_json), COUNT(*), COALESCE(SUM(length(CAST(signal_data_json AS BLOB))), 0)
+            FROM signals_received GROUP BY 1
+        """):
+            stats[f'{typename}_rows'] = count
+            stats[f'{typename}_bytes'] = total_bytes
+        return stats
+
+def migrate_signal_payloads(db_path: str, batch_size: int = 1000, vacuum: bool = False) -> Dict[str, int]:
+    """
+    將既有的JSON文本記錄轉換為二進制編碼
+
+    按ID分批轉換，每批一個事務，可隨時中斷後重新執行
+
+    Returns:
+        Dict: 轉換的記錄數及轉換前後的字節數
+    """
+    result = {'rows_migrated': 0, 'bytes_before': 0, 'bytes_after': 0, 'rows_failed': 0}
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        last_id = 0
+        while True:
+            rows = conn.execute("""
+                SELECT id, signal_data_json FROM signals_received
+                WHERE id > ? AND typeof(signal_data_json) = 'text'
+                ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for signal_id, text in rows:
+                try:
+                    json.loads(text)
+                except ValueError:
+                    # 非JSON內容保留原樣
+                    result['rows_failed'] += 1
+                    continue
+                encoded = encode_signal_payload(text)
+                updates.append((encoded, signal_id))
+                result['bytes_before'] += len(text.encode('utf-8'))
+                result['bytes_after'] += len(encoded)
+
+            with conn:
+                conn.executemany("UPDATE signals_received SET signal_data_json = ? WHERE id = ?", updates)
+            result['rows_migrated'] += len(updates)
+            logger.info(f"已轉換信號數據至ID {last_id}，累計 {result['rows_migrated']} 筆")
+
+        if vacuum and result['rows_migrated']:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    return result
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    positional = [a for i, a in enumerate(args) if not a.startswith('--') and (i == 0 or args[i - 1] != '--batch-size')]
+    db_path = positional[0] if positional else os.path.join('data', 'trading_signals.db')
+
+    if '--migrate' in args:
+        batch_size = int(args[args.index('--batch-size') + 1]) if '--batch-size' in args else 1000
+        result = migrate_signal_payloads(db_path, batch_size, vacuum='--vacuum' in args)
+        ratio = result['bytes_after'] / result['bytes_before'] if result['bytes_before'] else 1
+        print(f"✅ 已轉換 {result['rows_migrated']} 筆信號數據: "
+              f"{result['bytes_before']} -> {result['bytes_after']} 字節 ({ratio:.0%})")
+        if result['rows_failed']:
+            print(f"⚠️ {result['rows_failed']} 筆非JSON內容保留原樣")
+    elif '--stats' in args:
+        for key, value in get_payload_stats(db_path).items():
+            print(f"{key}: {value}")
+    else:
+        print(__doc__)
+
+if __name__ == '__main__':
+    main()
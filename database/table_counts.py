@@ -0,0 +1,171 @@
+"""
+表格計數模組
+以觸發器在寫入、更新與刪除時維護各表行數（及交易結果的勝/負數），
+狀態計數只需讀取 table_row_counts 的少量行，不隨表格大小增長；需要逐行核對時可用 exact 模式
+=============================================================================
+"""
+import os
+import sys
+import logging
+import sqlite3
+from typing import Dict, Iterable, Optional
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 計數名稱 -> (表格, 欄位, 條件)；欄位為 None 時計算全部行
+COUNTERS = {
+    'signals_received': ('signals_received', None, None),
+    'orders_executed': ('orders_executed', None, None),
+    'trading_results': ('trading_results', None, None),
+    'successful_trades': ('trading_results', 'is_successful', '= 1'),
+    'failed_trades': ('trading_results', 'is_successful', '= 0'),
+    'ml_features_v2': ('ml_features_v2', None, None),
+    'ml_signal_quality': ('ml_signal_quality', None, None),
+    'ml_price_optimization': ('ml_price_optimization', None, None)
+}
+
+TABLE_COUNTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS table_row_counts (
+        name TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+def _where(column: Optional[str], condition: Optional[str]) -> str:
+    return f"WHERE {column} {condition}" if column is not None else ''
+
+def _counter_updates(table_name: str, row: str, sign: str, conditional_only: bool = False) -> str:
+    """表格各計數按 NEW/OLD 行增減的語句"""
+    statements = []
+    for name, (table, column, condition) in COUNTERS.items():
+        if table != table_name or (conditional_only and column is None):
+            continue
+        delta = '1' if column is None else f"(CASE WHEN {row}.{column} {condition} THEN 1 ELSE 0 END)"
+        statements.append(f'''
+                UPDATE table_row_counts SET row_count = row_count {sign} {delta} WHERE name = '{name}';''')
+    return ''.join(statements)
+
+def _build_triggers() -> Dict[str, Dict[str, str]]:
+    """生成計數觸發器：表格 -> {名稱: CREATE TRIGGER}"""
+    triggers = {}
+    for table_name in dict.fromkeys(table for table, _, _ in COUNTERS.values()):
+        table_triggers = {
+            f'trg_row_count_{table_name}_insert': f'''
+            CREATE TRIGGER IF NOT EXISTS trg_row_count_{table_name}_insert
+            AFTER INSERT ON {table_name}
+            BEGIN{_counter_updates(table_name, 'NEW', '+')}
+            END
+        ''',
+            f'trg_row_count_{table_name}_delete': f'''
+            CREATE TRIGGER IF NOT EXISTS trg_row_count_{table_name}_delete
+            AFTER DELETE ON {table_name}
+            BEGIN{_counter_updates(table_name, 'OLD', '-')}
+            END
+        '''
+        }
+        # 條件計數在條件欄位更新時重新判斷（如同步UPSERT修正勝負）
+        columns = sorted({column for table, column, _ in COUNTERS.values() if table == table_name and column})
+        if columns:
+            table_triggers[f'trg_row_count_{table_name}_update'] = f'''
+            CREATE TRIGGER IF NOT EXISTS trg_row_count_{table_name}_update
+            AFTER UPDATE OF {', '.join(columns)} ON {table_name}
+            BEGIN{_counter_updates(table_name, 'OLD', '-', conditional_only=True)}{_counter_updates(table_name, 'NEW', '+', conditional_only=True)}
+            END
+        '''
+        triggers[table_name] = table_triggers
+    return triggers
+
+TABLE_COUNT_TRIGGERS = _build_triggers()
+
+def _exact_count(conn: sqlite3.Connection, name: str) -> int:
+    table, column, condition = COUNTERS[name]
+    return conn.execute(f"SELECT COUNT(*) FROM {table} {_where(column, condition)}").fetchone()[0]
+
+def init_table_counts(conn: sqlite3.Connection) -> int:
+    """
+    為已存在的表格建立計數觸發器，尚無計數的表格先逐行計數一次
+
+    觸發器與初始計數在同一交易中建立，之後的寫入不會遺漏
+
+    Returns:
+        int: 新建立的計數數量
+    """
+    cursor = conn.cursor()
+    cursor.execute(TABLE_COUNTS_TABLE)
+    existing_tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    counted = {row[0] for row in cursor.execute("SELECT name FROM table_row_counts")}
+
+    created = 0
+    for table_name, table_triggers in TABLE_COUNT_TRIGGERS.items():
+        if table_name not in existing_tables:
+            continue
+        for create_sql in table_triggers.values():
+            cursor.execute(create_sql)
+        for name, (table, _, _) in COUNTERS.items():
+            if table == table_name and name not in counted:
+                cursor.execute("INSERT INTO table_row_counts (name, row_count) VALUES (?, ?)",
+                               (name, _exact_count(conn, name)))
+                created += 1
+    if created:
+        logger.info(f"表格計數已建立: {created} 項")
+    return created
+
+def get_row_counts(conn: sqlite3.Connection, names: Iterable[str], exact: bool = False) -> Dict[str, int]:
+    """
+    讀取計數
+
+    Args:
+        names: COUNTERS 中的計數名稱
+        exact: True 時逐行計數（O(n)，用於核對）；否則讀取維護的計數，
+            未建立計數的數據庫（如舊快照）自動改為逐行計數
+
+    Returns:
+        Dict: 名稱 -> 行數
+    """
+    names = list(names)
+    counts = {}
+    if not exact:
+        try:
+            placeholders = ', '.join('?' for _ in names)
+            counts = dict(conn.execute(
+                f"SELECT name, row_count FROM table_row_counts WHERE name IN ({placeholders})", names
+            ).fetchall())
+        except sqlite3.OperationalError:
+            counts = {}
+    for name in names:
+        if name not in counts:
+            counts[name] = _exact_count(conn, name)
+    return counts
+
+def rebuild_table_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    """以逐行計數重設全部計數（修正手動改表造成的偏差）"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM table_row_counts")
+    init_table_counts(conn)
+    return dict(cursor.execute("SELECT name, row_count FROM table_row_counts").fetchall())
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    positional = [a for a in args if not a.startswith('--')]
+    db_path = positional[0] if positional else os.path.join('data', 'trading_signals.db')
+
+    with sqlite3.connect(db_path, timeout=30) as conn:
+        if '--rebuild' in args:
+            counts = rebuild_table_counts(conn)
+            print(f"✅ 表格計數已重建: {counts}")
+        elif '--verify' in args:
+            init_table_counts(conn)
+            names = [row[0] for row in conn.execute("SELECT name FROM table_row_counts")]
+            maintained = get_row_counts(conn, names)
+            exact = get_row_counts(conn, names, exact=True)
+            drift = {name: (maintained[name], exact[name]) for name in names if maintained[name] != exact[name]}
+            print(f"❌ 計數偏差: {drift}" if drift else "✅ 表格計數與逐行計數一致")
+        else:
+            print(__doc__)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+信號時段分桶模組
+按交易時區（MONITOR_TIMEZONE，預設 Asia/Taipei）在寫入時為信號保存小時、星期與交易日期欄位並建立索引，
+時段統計直接按欄位分組；時區偏移（含夏令時轉換）取自 pytz 的轉換表，保存於 time_bucket_offsets 供觸發器按索引查找
+=============================================================================
+"""
+import os
+import calendar
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Tuple
+import pytz
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 時段統計使用的時區
+TIMEZONE = os.environ.get('MONITOR_TIMEZONE', 'Asia/Taipei')
+
+# signals_received 上的分桶欄位
+BUCKET_COLUMNS = {
+    'bucket_hour': 'INTEGER',
+    'bucket_weekday': 'INTEGER',
+    'trading_date': 'TEXT'
+}
+
+# 轉換表第一段的起點（早於任何時間戳）
+_EARLIEST_TS = -1e18
+
+TIME_BUCKET_TABLES = {
+    'time_bucket_offsets': '''
+        CREATE TABLE IF NOT EXISTS time_bucket_offsets (
+            utc_start REAL PRIMARY KEY,
+            utc_offset INTEGER NOT NULL
+        )
+    ''',
+    'time_bucket_config': '''
+        CREATE TABLE IF NOT EXISTS time_bucket_config (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            timezone TEXT NOT NULL
+        )
+    '''
+}
+
+def timezone_offsets(tz_name: str = TIMEZONE) -> List[Tuple[float, int]]:
+    """
+    時區的UTC偏移轉換表
+
+    Returns:
+        List[Tuple]: 按時間排序的 (生效起點UTC時間戳, 偏移秒數)
+    """
+    tz = pytz.timezone(tz_name)
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        # 固定偏移時區（UTC、Etc/GMT-8 等）
+        return [(_EARLIEST_TS, int(tz.utcoffset(datetime(2000, 1, 1)).total_seconds()))]
+
+    offsets = []
+    for moment, (utcoffset, _, _) in zip(transitions, tz._transition_info):
+        start = _EARLIEST_TS if moment == datetime.min else float(calendar.timegm(moment.timetuple()))
+        offsets.append((start, int(utcoffset.total_seconds())))
+    return offsets
+
+def local_timestamp_sql(ts: str) -> str:
+    """將時間戳表達式轉為交易時區本地時間戳的SQL（偏移以主鍵查找）"""
+    return (f"({ts} + COALESCE((SELECT utc_offset FROM time_bucket_offsets "
+            f"WHERE utc_start <= {ts} ORDER BY utc_start DESC LIMIT 1), 0))")
+
+def bucket_sql(ts: str) -> Dict[str, str]:
+    """各分桶欄位的計算表達式"""
+    local_ts = local_timestamp_sql(ts)
+    return {
+        'bucket_hour': f"CAST(strftime('%H', {local_ts}, 'unixepoch') AS INTEGER)",
+        'bucket_weekday': f"CAST(strftime('%w', {local_ts}, 'unixepoch') AS INTEGER)",
+        'trading_date': f"date({local_ts}, 'unixepoch')"
+    }
+
+def _assignments(ts: str) -> str:
+    return ', '.join(f"{column} = {expression}" for column, expression in bucket_sql(ts).items())
+
+# 插入及時間戳變更（含同步UPSERT）後計算分桶欄位
+TIME_BUCKET_TRIGGERS = {
+    'trg_time_bucket_signal_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_time_bucket_signal_insert
+        AFTER INSERT ON signals_received
+        BEGIN
+            UPDATE signals_received SET {_assignments('NEW.timestamp')} WHERE id = NEW.id;
+        END
+    ''',
+    'trg_time_bucket_signal_update': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_time_bucket_signal_update
+        AFTER UPDATE OF timestamp ON signals_received
+        BEGIN
+            UPDATE signals_received SET {_assignments('NEW.timestamp')} WHERE id = NEW.id;
+        END
+    '''
+}
+
+def init_time_buckets(conn: sqlite3.Connection, tz_name: str = TIMEZONE) -> bool:
+    """
+    建立分桶欄位、索引與觸發器；新增欄位或時區變更時重新計算全部信號
+
+    Returns:
+        bool: 是否重新計算了分桶（依賴分桶的聚合需要重建）
+    """
+    cursor = conn.cursor()
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(signals_received)")}
+    if not columns:
+        return False
+
+    for create_sql in TIME_BUCKET_TABLES.values():
+        cursor.execute(create_sql)
+
+    columns_added = False
+    for column, column_type in BUCKET_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE signals_received ADD COLUMN {column} {column_type}")
+            columns_added = True
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_signals_time_bucket ON signals_received(bucket_weekday, bucket_hour)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_signals_trading_date ON signals_received(trading_date)')
+    for create_sql in TIME_BUCKET_TRIGGERS.values():
+        cursor.execute(create_sql)
+
+    row = cursor.execute("SELECT timezone FROM time_bucket_config WHERE id = 1").fetchone()
+    if row is not None and row[0] == tz_name and not columns_added:
+        return False
+
+    cursor.execute("DELETE FROM time_bucket_offsets")
+    cursor.executemany("INSERT INTO time_bucket_offsets (utc_start, utc_offset) VALUES (?, ?)",
+                       timezone_offsets(tz_name))
+    cursor.execute("INSERT OR REPLACE INTO time_bucket_config (id, timezone) VALUES (1, ?)", (tz_name,))
+    cursor.execute(f"UPDATE signals_received SET {_assignments('timestamp')}")
+    logger.info(f"信號時段分桶已按 {tz_name} 重新計算: {cursor.rowcount} 筆")
+    return True
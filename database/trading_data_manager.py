@@ -5,20 +5,259 @@
 """
 import sqlite3
 import os
-import json
 import time
 import logging
-from datetime import datetime, timezone
-from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterable, Tuple
 from config.settings_monitor import LOG_DIRECTORY
+from .write_behind_queue import get_write_behind_queue
+from .local_ids import next_local_id, next_local_id_sql
+from .signal_payload import encode_signal_payload
+from .row_models import make_row_factory, SIGNAL_CONVERTERS
+from .analytics_aggregates import create_triggers, init_analytics_aggregates
+from .equity_curve import init_equity_curve
+from .fill_quality import init_fill_quality
+from .table_counts import init_table_counts
 
 # 設置logger
 logger = logging.getLogger(__name__)
 
+# 每日統計中由交易結果計算的欄位：觸發器與重新計算共用同一組表達式，兩者結果一致
+# {start}/{end} 為UTC日期的半開時間戳區間 [start, end)
+DAILY_RESULT_STATS = {
+    'successful_trades': "COALESCE(SUM(CASE WHEN is_successful = 1 THEN 1 ELSE 0 END), 0)",
+    'failed_trades': "COUNT(*) - COALESCE(SUM(CASE WHEN is_successful = 1 THEN 1 ELSE 0 END), 0)",
+    'win_rate': "CASE WHEN COUNT(*) > 0 "
+                "THEN ROUND(SUM(CASE WHEN is_successful = 1 THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) ELSE 0 END",
+    'total_pnl': "COALESCE(SUM(final_pnl), 0)",
+    'best_trade': "COALESCE(MAX(final_pnl), 0)",
+    'worst_trade': "COALESCE(MIN(final_pnl), 0)",
+    'avg_holding_time': "COALESCE(AVG(holding_time_minutes), 0)",
+    'signal_type_stats': """(
+        SELECT COALESCE(json_group_object(signal_type, trades), '{{}}') FROM (
+            SELECT COALESCE(s.signal_type, 'null') AS signal_type, COUNT(*) AS trades
+            FROM trading_results r
+            JOIN orders_executed o ON o.id = r.order_id
+            JOIN signals_received s ON s.id = o.signal_id
+            WHERE r.result_timestamp >= {start} AND r.result_timestamp < {end}
+            GROUP BY s.signal_type
+        )
+    )"""
+}
+
+def _daily_result_stats_select(start: str, end: str) -> str:
+    """單日交易結果統計的查詢語句"""
+    columns = ',\n'.join(f"{expression.format(start=start, end=end)} AS {column}"
+                          for column, expression in DAILY_RESULT_STATS.items())
+    return f"""
+        SELECT {columns}
+        FROM trading_results
+        WHERE result_timestamp >= {start} AND result_timestamp < {end}
+    """
+
+def _daily_result_stats_refresh(date_sql: str) -> str:
+    """觸發器語句：以與重新計算相同的查詢刷新某日（UTC）的交易結果統計"""
+    start = f"CAST(strftime('%s', {date_sql}) AS INTEGER)"
+    return f"""
+                INSERT INTO daily_stats (date, {', '.join(DAILY_RESULT_STATS)})
+                SELECT {date_sql}, * FROM ({_daily_result_stats_select(start, f'({start} + 86400)')})
+                WHERE {date_sql} IS NOT NULL
+                ON CONFLICT(date) DO UPDATE SET
+                    {', '.join(f'{column} = excluded.{column}' for column in DAILY_RESULT_STATS)},
+                    updated_at = CURRENT_TIMESTAMP;"""
+
+def _daily_signal_type_stats_refresh(days_sql: str) -> str:
+    """觸發器語句：刷新指定日期（子查詢）的信號類型分佈"""
+    start = "CAST(strftime('%s', daily_stats.date) AS INTEGER)"
+    stats_sql = DAILY_RESULT_STATS['signal_type_stats'].format(start=start, end=f'({start} + 86400)')
+    return f"""
+                UPDATE daily_stats SET signal_type_stats = {stats_sql}, updated_at = CURRENT_TIMESTAMP
+                WHERE date IN ({days_sql});"""
+
+def _daily_count_triggers(table_name: str, short_name: str, timestamp_column: str, count_column: str) -> Dict[str, str]:
+    """信號數、訂單數為可加欄位：插入、刪除與時間戳變更時按日增減"""
+    increment = f"""
+                INSERT INTO daily_stats (date, {count_column}, signal_type_stats)
+                SELECT date(NEW.{timestamp_column}, 'unixepoch'), 1, '{{}}' WHERE NEW.{timestamp_column} IS NOT NULL
+                ON CONFLICT(date) DO UPDATE SET
+                    {count_column} = {count_column} + 1,
+                    updated_at = CURRENT_TIMESTAMP;"""
+    decrement = f"""
+                UPDATE daily_stats SET {count_column} = {count_column} - 1, updated_at = CURRENT_TIMESTAMP
+                WHERE OLD.{timestamp_column} IS NOT NULL AND date = date(OLD.{timestamp_column}, 'unixepoch');"""
+    return {
+        f'trg_daily_stats_{short_name}_insert': f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_{short_name}_insert
+            AFTER INSERT ON {table_name}
+            BEGIN{increment}
+            END
+        """,
+        f'trg_daily_stats_{short_name}_delete': f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_{short_name}_delete
+            AFTER DELETE ON {table_name}
+            BEGIN{decrement}
+            END
+        """,
+        f'trg_daily_stats_{short_name}_update': f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_{short_name}_update
+            AFTER UPDATE OF {timestamp_column} ON {table_name}
+            WHEN OLD.{timestamp_column} IS NOT NEW.{timestamp_column}
+            BEGIN{decrement}{increment}
+            END
+        """
+    }
+
+_RESULT_DAY = "date({row}.result_timestamp, 'unixepoch')"
+
+# 每日統計觸發器：計數欄位增量維護；交易結果欄位（含平均、最大/最小）在結果變更時按日重新計算，
+# 信號類型分佈另在關聯的訂單或信號寫入、刪除或變更時刷新，與 _compute_daily_stats 的結果一致
+DAILY_STATS_TRIGGERS = dict(
+    **_daily_count_triggers('signals_received', 'signal', 'timestamp', 'total_signals'),
+    **_daily_count_triggers('orders_executed', 'order', 'execution_timestamp', 'total_orders'),
+    trg_daily_stats_result_insert=f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_result_insert
+            AFTER INSERT ON trading_results
+            BEGIN{_daily_result_stats_refresh(_RESULT_DAY.format(row='NEW'))}
+            END
+        """,
+    trg_daily_stats_result_update=f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_result_update
+            AFTER UPDATE OF order_id, final_pnl, result_timestamp, is_successful, holding_time_minutes
+            ON trading_results
+            BEGIN{_daily_result_stats_refresh(_RESULT_DAY.format(row='OLD'))}{_daily_result_stats_refresh(_RESULT_DAY.format(row='NEW'))}
+            END
+        """,
+    trg_daily_stats_result_delete=f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_result_delete
+            AFTER DELETE ON trading_results
+            BEGIN{_daily_result_stats_refresh(_RESULT_DAY.format(row='OLD'))}
+            END
+        """,
+    **{
+        f'trg_daily_stats_{short_name}_link_{event.split()[0].lower()}': f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_{short_name}_link_{event.split()[0].lower()}
+            AFTER {event} ON {table_name}
+            BEGIN{_daily_signal_type_stats_refresh(linked_days.format(row='OLD' if event == 'DELETE' else 'NEW'))}
+            END
+        """
+        for table_name, short_name, link_column, linked_days in (
+            ('orders_executed', 'order', 'signal_id',
+             "SELECT date(result_timestamp, 'unixepoch') FROM trading_results WHERE order_id = {row}.id"),
+            ('signals_received', 'signal', 'signal_type',
+             "SELECT date(r.result_timestamp, 'unixepoch') FROM orders_executed o "
+             "JOIN trading_results r ON r.order_id = o.id WHERE o.signal_id = {row}.id")
+        )
+        for event in ('INSERT', 'DELETE', f'UPDATE OF {link_column}')
+    }
+)
+
+# 舊版以累加維護交易結果欄位的觸發器（NULL盈虧與刪除時與重新計算不一致）
+_LEGACY_DAILY_STATS_TRIGGERS = ('trg_daily_stats_signal', 'trg_daily_stats_order', 'trg_daily_stats_result')
+
+# 基礎表格：既有表（如從交易主機複製的數據庫）缺少的欄位在初始化時補齊
+BASE_TABLES = {
+    # 信號接收記錄表
+    'signals_received': '''
+        CREATE TABLE IF NOT EXISTS signals_received (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp REAL NOT NULL,
+            signal_type TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            side TEXT NOT NULL,
+            open_price REAL,
+            close_price REAL,
+            prev_close REAL,
+            prev_open REAL,
+            atr_value REAL,
+            opposite INTEGER,
+            strategy_name TEXT,
+            quantity TEXT,
+            order_type TEXT,
+            margin_type TEXT,
+            precision INTEGER,
+            tp_multiplier REAL,
+            signal_data_json TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    # 訂單執行記錄表
+    'orders_executed': '''
+        CREATE TABLE IF NOT EXISTS orders_executed (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            signal_id INTEGER,
+            client_order_id TEXT UNIQUE NOT NULL,
+            symbol TEXT NOT NULL,
+            side TEXT NOT NULL,
+            order_type TEXT,
+            quantity REAL,
+            price REAL,
+            leverage INTEGER,
+            execution_timestamp REAL,
+            execution_delay_ms INTEGER,
+            binance_order_id TEXT,
+            status TEXT DEFAULT 'NEW',
+            is_add_position BOOLEAN DEFAULT 0,
+            tp_client_id TEXT,
+            sl_client_id TEXT,
+            tp_price REAL,
+            sl_price REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (signal_id) REFERENCES signals_received (id)
+        )
+    ''',
+    # 交易結果記錄表
+    'trading_results': '''
+        CREATE TABLE IF NOT EXISTS trading_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER,
+            client_order_id TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            final_pnl REAL,
+            pnl_percentage REAL,
+            holding_time_minutes INTEGER,
+            exit_method TEXT,
+            max_drawdown REAL,
+            max_profit REAL,
+            entry_price REAL,
+            exit_price REAL,
+            total_quantity REAL,
+            result_timestamp REAL,
+            is_successful BOOLEAN,
+            trade_quality_score REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders_executed (id)
+        )
+    ''',
+    # 每日統計摘要表
+    'daily_stats': '''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT UNIQUE NOT NULL,
+            total_signals INTEGER DEFAULT 0,
+            total_orders INTEGER DEFAULT 0,
+            successful_trades INTEGER DEFAULT 0,
+            failed_trades INTEGER DEFAULT 0,
+            win_rate REAL DEFAULT 0,
+            total_pnl REAL DEFAULT 0,
+            best_trade REAL DEFAULT 0,
+            worst_trade REAL DEFAULT 0,
+            avg_holding_time REAL DEFAULT 0,
+            signal_type_stats TEXT,
+            symbol_stats TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    '''
+}
+
 class TradingDataManager:
     """交易數據管理類 - 核心功能"""
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, write_behind: bool = False):
         # 設定資料庫路徑
         if db_path is None:
             # 在專案根目錄建立data資料夾
@@ -31,6 +270,14 @@ class TradingDataManager:
             
         # 初始化資料庫
         self._init_database()
+        
+        # client_order_id -> order_id 的LRU快取，命中時交易結果只需一條語句
+        self._order_id_cache = OrderedDict()
+        self._order_id_cache_lock = threading.Lock()
+        self.order_id_cache_size = 10000
+        
+        # 寫後模式：record_* 放入共用佇列後立即返回，由寫入線程群組提交
+        self.write_queue = get_write_behind_queue(self.db_path) if write_behind else None
         logger.info(f"交易數據管理器已初始化，資料庫路徑: {self.db_path}")
     
     def _init_database(self):
@@ -38,102 +285,11 @@ class TradingDataManager:
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                
-                # 1. 信號接收記錄表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS signals_received (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp REAL NOT NULL,
-                        signal_type TEXT NOT NULL,
-                        symbol TEXT NOT NULL,
-                        side TEXT NOT NULL,
-                        open_price REAL,
-                        close_price REAL,
-                        prev_close REAL,
-                        prev_open REAL,
-                        atr_value REAL,
-                        opposite INTEGER,
-                        strategy_name TEXT,
-                        quantity TEXT,
-                        order_type TEXT,
-                        margin_type TEXT,
-                        precision INTEGER,
-                        tp_multiplier REAL,
-                        signal_data_json TEXT,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # 2. 訂單執行記錄表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS orders_executed (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        signal_id INTEGER,
-                        client_order_id TEXT UNIQUE NOT NULL,
-                        symbol TEXT NOT NULL,
-                        side TEXT NOT NULL,
-                        order_type TEXT,
-                        quantity REAL,
-                        price REAL,
-                        leverage INTEGER,
-                        execution_timestamp REAL,
-                        execution_delay_ms INTEGER,
-                        binance_order_id TEXT,
-                        status TEXT DEFAULT 'NEW',
-                        is_add_position BOOLEAN DEFAULT 0,
-                        tp_client_id TEXT,
-                        sl_client_id TEXT,
-                        tp_price REAL,
-                        sl_price REAL,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (signal_id) REFERENCES signals_received (id)
-                    )
-                ''')
-                
-                # 3. 交易結果記錄表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS trading_results (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        order_id INTEGER,
-                        client_order_id TEXT NOT NULL,
-                        symbol TEXT NOT NULL,
-                        final_pnl REAL,
-                        pnl_percentage REAL,
-                        holding_time_minutes INTEGER,
-                        exit_method TEXT,
-                        max_drawdown REAL,
-                        max_profit REAL,
-                        entry_price REAL,
-                        exit_price REAL,
-                        total_quantity REAL,
-                        result_timestamp REAL,
-                        is_successful BOOLEAN,
-                        trade_quality_score REAL,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (order_id) REFERENCES orders_executed (id)
-                    )
-                ''')
-                
-                # 4. 每日統計摘要表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS daily_stats (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        date TEXT UNIQUE NOT NULL,
-                        total_signals INTEGER DEFAULT 0,
-                        total_orders INTEGER DEFAULT 0,
-                        successful_trades INTEGER DEFAULT 0,
-                        failed_trades INTEGER DEFAULT 0,
-                        win_rate REAL DEFAULT 0,
-                        total_pnl REAL DEFAULT 0,
-                        best_trade REAL DEFAULT 0,
-                        worst_trade REAL DEFAULT 0,
-                        avg_holding_time REAL DEFAULT 0,
-                        signal_type_stats TEXT,
-                        symbol_stats TEXT,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
+
+                # 信號、訂單、交易結果與每日統計表
+                for table_name, create_sql in BASE_TABLES.items():
+                    cursor.execute(create_sql)
+                    self._add_missing_columns(cursor, table_name, create_sql)
                 
                 # 建立基礎索引
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_signals_timestamp ON signals_received(timestamp)')
@@ -143,6 +299,35 @@ class TradingDataManager:
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_timestamp ON trading_results(result_timestamp)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_stats_date ON daily_stats(date)')
                 
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_execution_timestamp ON orders_executed(execution_timestamp)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_signal_id ON orders_executed(signal_id)')
+                
+                # 每日統計隨寫入增量維護（涵蓋直接寫入、批量寫入、同步與推送）
+                self._init_daily_stats_triggers(cursor)
+                
+                # 每筆訂單只有一筆交易結果：唯一索引讓結果寫入可用 ON CONFLICT DO NOTHING 冪等完成
+                try:
+                    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_results_order_id_unique ON trading_results(order_id)')
+                    self.results_order_unique = True
+                except sqlite3.IntegrityError:
+                    # 既有數據已有重複結果，退回普通索引，寫入語句以 NOT EXISTS 檢查
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_order_id ON trading_results(order_id)')
+                    self.results_order_unique = False
+                    logger.warning("trading_results 存在同一訂單的重複結果，無法建立唯一索引，寫入時以 NOT EXISTS 檢查")
+                
+                # 統計分析聚合表由觸發器增量維護（首次建立時從現有數據重建）
+                if init_analytics_aggregates(conn):
+                    logger.info("統計聚合表已從現有數據建立")
+                
+                # 權益曲線檢查點（結果變更由觸發器標記，讀取時增量計算）
+                init_equity_curve(conn)
+                
+                # 訂單成交品質欄位在寫入時計算
+                init_fill_quality(conn)
+                
+                # 表格行數由觸發器維護，狀態計數不需逐行掃描
+                init_table_counts(conn)
+                
                 conn.commit()
                 logger.info("基礎資料庫表格初始化完成")
                 
@@ -150,6 +335,137 @@ class TradingDataManager:
             logger.error(f"初始化資料庫時出錯: {str(e)}")
             raise
     
+    @staticmethod
+    def _add_missing_columns(cursor: sqlite3.Cursor, table_name: str, create_sql: str):
+        """
+        既有表缺少的欄位以可空欄位補齊，聚合、每日統計與成交品質觸發器讀取的欄位因此都存在
+
+        期望的欄位由同一建表語句在臨時表中建立後讀取
+        """
+        existing = {row[1] for row in cursor.execute(f"PRAGMA main.table_info({table_name})")}
+        expected_table = f"_expected_{table_name}"
+        cursor.execute(create_sql.replace(f"IF NOT EXISTS {table_name}", f"temp.{expected_table}", 1))
+        try:
+            expected = cursor.execute(f"PRAGMA temp.table_info({expected_table})").fetchall()
+        finally:
+            cursor.execute(f"DROP TABLE temp.{expected_table}")
+
+        for _, name, column_type, _, default, _ in expected:
+            if name in existing:
+                continue
+            # ALTER TABLE ADD COLUMN 只接受常量預設值
+            definition = f"{name} {column_type}"
+            if default is not None and not default.upper().startswith('CURRENT_'):
+                definition += f" DEFAULT {default}"
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {definition}")
+            logger.info(f"{table_name} 已補齊欄位: {name}")
+
+    def _init_daily_stats_triggers(self, cursor: sqlite3.Cursor):
+        """
+        建立每日統計的增量維護觸發器（日期以UTC計算）
+        
+        從舊版累加觸發器升級時，按現有日期重新計算交易結果欄位
+        """
+        existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        legacy = [name for name in _LEGACY_DAILY_STATS_TRIGGERS if name in existing]
+        for name in legacy:
+            cursor.execute(f"DROP TRIGGER {name}")
+        replaced = create_triggers(cursor, DAILY_STATS_TRIGGERS)
+        
+        if legacy or replaced:
+            dates = [row[0] for row in cursor.execute("SELECT date FROM daily_stats")]
+            for date_str in dates:
+                self._write_daily_stats(cursor, self._compute_daily_stats(cursor, date_str))
+            logger.info(f"每日統計觸發器已更新，重新計算 {len(dates)} 天")
+    
+    # 各表寫入欄位（順序與 _build_*_row 返回的值一致）
+    SIGNAL_COLUMNS = (
+        'timestamp', 'signal_type', 'symbol', 'side', 'open_price', 'close_price',
+        'prev_close', 'prev_open', 'atr_value', 'opposite', 'strategy_name',
+        'quantity', 'order_type', 'margin_type', 'precision', 'tp_multiplier',
+        'signal_data_json'
+    )
+    ORDER_COLUMNS = (
+        'signal_id', 'client_order_id', 'symbol', 'side', 'order_type',
+        'quantity', 'price', 'leverage', 'execution_timestamp', 'execution_delay_ms',
+        'binance_order_id', 'status', 'is_add_position', 'tp_client_id', 'sl_client_id',
+        'tp_price', 'sl_price'
+    )
+    RESULT_COLUMNS = (
+        'order_id', 'client_order_id', 'symbol', 'final_pnl', 'pnl_percentage',
+        'exit_method', 'entry_price', 'exit_price', 'total_quantity',
+        'result_timestamp', 'is_successful', 'holding_time_minutes'
+    )
+    
+    @staticmethod
+    def _insert_sql(table_name: str, columns: Tuple[str, ...]) -> str:
+        """構建INSERT語句（未指定ID時在本地分區內分配）"""
+        if 'id' in columns:
+            return f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+        return (f"INSERT INTO {table_name} (id, {', '.join(columns)}) "
+                f"VALUES ({next_local_id_sql(table_name)}, {', '.join(['?'] * len(columns))})")
+    
+    def _build_signal_row(self, signal_data: Dict[str, Any], timestamp: float) -> tuple:
+        """信號數據轉換為 signals_received 寫入值"""
+        return (
+            timestamp,
+            signal_data.get('signal_type'),
+            signal_data.get('symbol'),
+            signal_data.get('side'),
+            float(signal_data.get('open', 0)) if signal_data.get('open') else None,
+            float(signal_data.get('close', 0)) if signal_data.get('close') else None,
+            float(signal_data.get('prev_close', 0)) if signal_data.get('prev_close') else None,
+            float(signal_data.get('prev_open', 0)) if signal_data.get('prev_open') else None,
+            float(signal_data.get('ATR', 0)) if signal_data.get('ATR') else None,
+            int(signal_data.get('opposite', 0)),
+            signal_data.get('strategy_name'),
+            signal_data.get('quantity'),
+            signal_data.get('order_type'),
+            signal_data.get('margin_type'),
+            signal_data.get('precision'),
+            signal_data.get('tp_multiplier'),
+            encode_signal_payload(signal_data)  # 保存完整的原始數據（壓縮編碼）
+        )
+    
+    def _build_order_row(self, signal_id: int, order_data: Dict[str, Any], execution_timestamp: float) -> tuple:
+        """訂單數據轉換為 orders_executed 寫入值"""
+        return (
+            signal_id,
+            order_data.get('client_order_id'),
+            order_data.get('symbol'),
+            order_data.get('side'),
+            order_data.get('order_type'),
+            float(order_data.get('quantity', 0)),
+            float(order_data.get('price', 0)) if order_data.get('price') else None,
+            int(order_data.get('leverage', 30)),
+            execution_timestamp,
+            order_data.get('execution_delay_ms'),
+            order_data.get('binance_order_id'),
+            order_data.get('status', 'NEW'),
+            bool(order_data.get('is_add_position', False)),
+            order_data.get('tp_client_id'),
+            order_data.get('sl_client_id'),
+            float(order_data.get('tp_price', 0)) if order_data.get('tp_price') else None,
+            float(order_data.get('sl_price', 0)) if order_data.get('sl_price') else None
+        )
+    
+    def _build_result_row(self, order_id: int, result_data: Dict[str, Any]) -> tuple:
+        """交易結果數據轉換為 trading_results 寫入值"""
+        return (
+            order_id,
+            result_data['client_order_id'],
+            result_data['symbol'],
+            result_data['final_pnl'],
+            result_data.get('pnl_percentage', 0),
+            result_data['exit_method'],
+            result_data['entry_price'],
+            result_data['exit_price'],
+            result_data['total_quantity'],
+            result_data['result_timestamp'],
+            result_data['is_successful'],
+            result_data['holding_time_minutes']
+        )
+    
     def record_signal_received(self, signal_data: Dict[str, Any]) -> int:
         """
         記錄接收到的交易信號
@@ -163,35 +479,22 @@ class TradingDataManager:
         try:
             timestamp = time.time()
             
+            if self.write_queue:
+                # 預分配ID，寫入落盤前即可返回
+                signal_id = self.write_queue.allocate_id('signals_received')
+                self.write_queue.submit(
+                    self._insert_sql('signals_received', ('id',) + self.SIGNAL_COLUMNS),
+                    (signal_id,) + self._build_signal_row(signal_data, timestamp),
+                    f"signal {signal_id}"
+                )
+                logger.info(f"已排入信號: ID={signal_id}, {signal_data.get('symbol')} {signal_data.get('side')} {signal_data.get('signal_type')}")
+                return signal_id
+            
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    INSERT INTO signals_received (
-                        timestamp, signal_type, symbol, side, open_price, close_price,
-                        prev_close, prev_open, atr_value, opposite, strategy_name,
-                        quantity, order_type, margin_type, precision, tp_multiplier,
-                        signal_data_json
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    timestamp,
-                    signal_data.get('signal_type'),
-                    signal_data.get('symbol'),
-                    signal_data.get('side'),
-                    float(signal_data.get('open', 0)) if signal_data.get('open') else None,
-                    float(signal_data.get('close', 0)) if signal_data.get('close') else None,
-                    float(signal_data.get('prev_close', 0)) if signal_data.get('prev_close') else None,
-                    float(signal_data.get('prev_open', 0)) if signal_data.get('prev_open') else None,
-                    float(signal_data.get('ATR', 0)) if signal_data.get('ATR') else None,
-                    int(signal_data.get('opposite', 0)),
-                    signal_data.get('strategy_name'),
-                    signal_data.get('quantity'),
-                    signal_data.get('order_type'),
-                    signal_data.get('margin_type'),
-                    signal_data.get('precision'),
-                    signal_data.get('tp_multiplier'),
-                    json.dumps(signal_data)  # 保存完整的原始數據
-                ))
+                cursor.execute(self._insert_sql('signals_received', self.SIGNAL_COLUMNS),
+                               self._build_signal_row(signal_data, timestamp))
                 
                 signal_id = cursor.lastrowid
                 conn.commit()
@@ -217,35 +520,20 @@ class TradingDataManager:
         try:
             execution_timestamp = time.time()
             
+            if self.write_queue:
+                self.write_queue.submit(
+                    self._insert_sql('orders_executed', self.ORDER_COLUMNS),
+                    self._build_order_row(signal_id, order_data, execution_timestamp),
+                    f"order {order_data.get('client_order_id')}"
+                )
+                return True
+            
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    INSERT INTO orders_executed (
-                        signal_id, client_order_id, symbol, side, order_type,
-                        quantity, price, leverage, execution_timestamp, execution_delay_ms,
-                        binance_order_id, status, is_add_position, tp_client_id, sl_client_id,
-                        tp_price, sl_price
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    signal_id,
-                    order_data.get('client_order_id'),
-                    order_data.get('symbol'),
-                    order_data.get('side'),
-                    order_data.get('order_type'),
-                    float(order_data.get('quantity', 0)),
-                    float(order_data.get('price', 0)) if order_data.get('price') else None,
-                    int(order_data.get('leverage', 30)),
-                    execution_timestamp,
-                    order_data.get('execution_delay_ms'),
-                    order_data.get('binance_order_id'),
-                    order_data.get('status', 'NEW'),
-                    bool(order_data.get('is_add_position', False)),
-                    order_data.get('tp_client_id'),
-                    order_data.get('sl_client_id'),
-                    float(order_data.get('tp_price', 0)) if order_data.get('tp_price') else None,
-                    float(order_data.get('sl_price', 0)) if order_data.get('sl_price') else None
-                ))
+                cursor.execute(self._insert_sql('orders_executed', self.ORDER_COLUMNS),
+                               self._build_order_row(signal_id, order_data, execution_timestamp))
+                self._cache_order_id(order_data.get('client_order_id'), cursor.lastrowid)
                 
                 conn.commit()
                 logger.info(f"已記錄訂單執行: {order_data.get('client_order_id')}")
@@ -267,51 +555,49 @@ class TradingDataManager:
             bool: 是否記錄成功
         """
         try:
+            order_id = self._get_cached_order_id(client_order_id)
+            
+            if self.write_queue:
+                if order_id is not None:
+                    self.write_queue.submit(self._result_upsert_sql(), self._build_result_row(order_id, result_data),
+                                            f"result {client_order_id}")
+                    return True
+                # 訂單可能仍在佇列中，提交時才以 INSERT ... SELECT 解析訂單ID並跳過已存在的結果
+                self.write_queue.submit(f"""
+                    INSERT INTO trading_results (id, {', '.join(self.RESULT_COLUMNS)})
+                    SELECT {next_local_id_sql('trading_results')}, o.id, {', '.join(['?'] * (len(self.RESULT_COLUMNS) - 1))}
+                    FROM orders_executed o
+                    WHERE o.client_order_id = ?
+                      AND NOT EXISTS (SELECT 1 FROM trading_results r WHERE r.order_id = o.id)
+                """, self._build_result_row(None, result_data)[1:] + (client_order_id,), f"result {client_order_id}")
+                return True
+            
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # 查找對應的訂單記錄
-                cursor.execute("""
-                    SELECT id FROM orders_executed 
-                    WHERE client_order_id = ?
-                """, (client_order_id,))
-                
-                order_record = cursor.fetchone()
-                if not order_record:
-                    logger.error(f"未找到訂單記錄: {client_order_id}")
-                    return False
+                # 查找對應的訂單記錄（快取未命中時）
+                if order_id is None:
+                    cursor.execute("""
+                        SELECT id FROM orders_executed 
+                        WHERE client_order_id = ?
+                    """, (client_order_id,))
+                    
+                    order_record = cursor.fetchone()
+                    if not order_record:
+                        logger.error(f"未找到訂單記錄: {client_order_id}")
+                        return False
+                    
+                    order_id = order_record[0]
+                    self._cache_order_id(client_order_id, order_id)
                 
-                order_id = order_record[0]
+                # 插入交易結果記錄 - 已存在時不寫入
+                cursor.execute(self._result_upsert_sql(), self._build_result_row(order_id, result_data))
+                conn.commit()
                 
-                # 檢查是否已存在交易結果
-                cursor.execute("SELECT id FROM trading_results WHERE order_id = ?", (order_id,))
-                if cursor.fetchone():
+                if cursor.rowcount == 0:
                     logger.info(f"訂單 {client_order_id} 交易結果已存在，跳過重複記錄")
                     return True
                 
-                # 插入交易結果記錄
-                cursor.execute("""
-                    INSERT INTO trading_results (
-                        order_id, client_order_id, symbol, final_pnl, pnl_percentage,
-                        exit_method, entry_price, exit_price, total_quantity,
-                        result_timestamp, is_successful, holding_time_minutes
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    order_id,
-                    result_data['client_order_id'],
-                    result_data['symbol'],
-                    result_data['final_pnl'],
-                    result_data.get('pnl_percentage', 0),
-                    result_data['exit_method'],
-                    result_data['entry_price'],
-                    result_data['exit_price'],
-                    result_data['total_quantity'],
-                    result_data['result_timestamp'],
-                    result_data['is_successful'],
-                    result_data['holding_time_minutes']
-                ))
-                
-                conn.commit()
                 logger.info(f"✅ 交易結果已記錄: {client_order_id}, 盈虧: {result_data['final_pnl']}")
                 return True
                 
@@ -319,11 +605,280 @@ class TradingDataManager:
             logger.error(f"記錄交易結果失敗: {str(e)}")
             return False
     
-    def get_recent_signals(self, limit: int = 10) -> List[Dict]:
-        """獲取最近的信號記錄"""
+    def _result_upsert_sql(self) -> str:
+        """
+        交易結果冪等寫入語句：同一訂單已有結果時不寫入
+        （無唯一索引時在同一語句內以 NOT EXISTS 檢查，寫後佇列提交時同樣生效）
+        """
+        if self.results_order_unique:
+            return self._insert_sql('trading_results', self.RESULT_COLUMNS) + " ON CONFLICT(order_id) DO NOTHING"
+        # 編號參數：?1 為 order_id（RESULT_COLUMNS 首欄），參數與 _build_result_row 相同
+        placeholders = ', '.join(f'?{index}' for index in range(1, len(self.RESULT_COLUMNS) + 1))
+        return (f"INSERT INTO trading_results (id, {', '.join(self.RESULT_COLUMNS)}) "
+                f"SELECT {next_local_id_sql('trading_results')}, {placeholders} "
+                f"WHERE NOT EXISTS (SELECT 1 FROM trading_results WHERE order_id = ?1)")
+    
+    def _get_cached_order_id(self, client_order_id: str) -> Optional[int]:
+        """從LRU快取查找訂單ID"""
+        with self._order_id_cache_lock:
+            order_id = self._order_id_cache.get(client_order_id)
+            if order_id is not None:
+                self._order_id_cache.move_to_end(client_order_id)
+            return order_id
+    
+    def _cache_order_id(self, client_order_id: Optional[str], order_id: Optional[int]):
+        """記錄 client_order_id -> order_id，超出容量時淘汰最久未使用的項目"""
+        if client_order_id is None or order_id is None:
+            return
+        with self._order_id_cache_lock:
+            self._order_id_cache[client_order_id] = order_id
+            self._order_id_cache.move_to_end(client_order_id)
+            while len(self._order_id_cache) > self.order_id_cache_size:
+                self._order_id_cache.popitem(last=False)
+    
+    def flush_writes(self, timeout: Optional[float] = None) -> bool:
+        """寫後模式下等待已排入的寫入落盤，有寫入失敗時返回False（詳見 get_failed_writes()）"""
+        return self.write_queue.flush(timeout) if self.write_queue else True
+    
+    def get_write_metrics(self) -> Optional[Dict]:
+        """寫後佇列指標（佇列深度、提交延遲），非寫後模式返回None"""
+        return self.write_queue.get_metrics() if self.write_queue else None
+    
+    def get_failed_writes(self, clear: bool = False) -> List[Dict]:
+        """寫後模式下最近失敗的寫入（description、error、failed_at）"""
+        return self.write_queue.get_failed_writes(clear) if self.write_queue else []
+    
+    @contextmanager
+    def _batch_transaction(self):
+        """批量寫入事務：BEGIN IMMEDIATE 取得寫鎖，整批只提交一次"""
+        # 先讓佇列中的寫入落盤，保持寫入順序
+        self.flush_writes()
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+    
+    def _insert_rows_batch(self, conn: sqlite3.Connection, table_name: str, columns: Tuple[str, ...],
+                           indexed_rows: List[Tuple[int, tuple]], errors: List[Dict]) -> Dict[int, int]:
+        """
+        在批量事務中插入記錄並顯式分配ID
+        
+        持有寫鎖時取得本地分區的下一個ID，整批以 executemany 寫入；
+        若有約束衝突則回滾該批次並逐行寫入，定位出錯的行
+        
+        Returns:
+            Dict[int, int]: 輸入序號 -> 分配的ID
+        """
+        if not indexed_rows:
+            return {}
+        
+        # 寫後佇列預留的ID區塊已寫入 sqlite_sequence，此處取得的ID不會與其衝突
+        cursor = conn.cursor()
+        next_id = next_local_id(conn, table_name)
+        
+        sql = self._insert_sql(table_name, ('id',) + columns)
+        assigned = {index: next_id + offset for offset, (index, _) in enumerate(indexed_rows)}
+        
+        cursor.execute("SAVEPOINT batch_insert")
+        try:
+            cursor.executemany(sql, [(assigned[index],) + row for index, row in indexed_rows])
+            cursor.execute("RELEASE SAVEPOINT batch_insert")
+            return assigned
+        except sqlite3.IntegrityError:
+            cursor.execute("ROLLBACK TO SAVEPOINT batch_insert")
+            cursor.execute("RELEASE SAVEPOINT batch_insert")
+        
+        # 逐行寫入：違反約束的語句只回滾該行
+        assigned = {}
+        for index, row in indexed_rows:
+            try:
+                cursor.execute(sql, (next_id,) + row)
+                assigned[index] = next_id
+                next_id += 1
+            except sqlite3.IntegrityError as e:
+                errors.append({'index': index, 'error': str(e)})
+        return assigned
+    
+    @staticmethod
+    def _new_batch_result(count: int) -> Dict:
+        return {
+            'success': True,
+            'ids': [None] * count,
+            'inserted': 0,
+            'skipped': 0,
+            'errors': []
+        }
+    
+    @staticmethod
+    def _finish_batch_result(result: Dict, assigned: Dict[int, int]) -> Dict:
+        for index, row_id in assigned.items():
+            result['ids'][index] = row_id
+        result['inserted'] = len(assigned)
+        result['errors'].sort(key=lambda error: error['index'])
+        result['success'] = not result['errors']
+        return result
+    
+    def record_signals_batch(self, signals: Iterable[Dict[str, Any]]) -> Dict:
+        """
+        批量記錄交易信號（單一事務）
+        
+        Args:
+            signals: 信號數據字典序列
+            
+        Returns:
+            Dict: {'success', 'ids'（與輸入順序對應，失敗為None）, 'inserted', 'skipped', 'errors': [{'index', 'error'}]}
+        """
+        signals = list(signals)
+        result = self._new_batch_result(len(signals))
+        if not signals:
+            return result
+        
+        rows = []
+        for index, signal_data in enumerate(signals):
+            try:
+                rows.append((index, self._build_signal_row(signal_data, time.time())))
+            except (TypeError, ValueError, AttributeError) as e:
+                result['errors'].append({'index': index, 'error': str(e)})
+        
+        try:
+            with self._batch_transaction() as conn:
+                assigned = self._insert_rows_batch(conn, 'signals_received', self.SIGNAL_COLUMNS, rows, result['errors'])
+        except Exception as e:
+            logger.error(f"批量記錄信號時出錯: {str(e)}")
+            return dict(result, success=False, error=str(e))
+        
+        logger.info(f"已批量記錄信號: {len(assigned)}/{len(signals)} 筆")
+        return self._finish_batch_result(result, assigned)
+    
+    def record_orders_batch(self, orders: Iterable[Tuple[int, Dict[str, Any]]]) -> Dict:
+        """
+        批量記錄訂單執行信息（單一事務）
+        
+        Args:
+            orders: (signal_id, order_data) 序列
+            
+        Returns:
+            Dict: 同 record_signals_batch
+        """
+        orders = list(orders)
+        result = self._new_batch_result(len(orders))
+        if not orders:
+            return result
+        
+        rows = []
+        for index, (signal_id, order_data) in enumerate(orders):
+            try:
+                rows.append((index, self._build_order_row(signal_id, order_data, time.time())))
+            except (TypeError, ValueError, AttributeError) as e:
+                result['errors'].append({'index': index, 'error': str(e)})
+        
+        try:
+            with self._batch_transaction() as conn:
+                assigned = self._insert_rows_batch(conn, 'orders_executed', self.ORDER_COLUMNS, rows, result['errors'])
+        except Exception as e:
+            logger.error(f"批量記錄訂單執行時出錯: {str(e)}")
+            return dict(result, success=False, error=str(e))
+        
+        for index, order_id in assigned.items():
+            self._cache_order_id(orders[index][1].get('client_order_id'), order_id)
+        
+        logger.info(f"已批量記錄訂單執行: {len(assigned)}/{len(orders)} 筆")
+        return self._finish_batch_result(result, assigned)
+    
+    def record_results_batch(self, results: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict:
+        """
+        批量根據客戶訂單ID記錄交易結果（單一事務）
+        
+        已存在交易結果的訂單跳過並返回既有ID，與 record_trading_result_by_client_id 一致
+        
+        Args:
+            results: (client_order_id, result_data) 序列
+            
+        Returns:
+            Dict: 同 record_signals_batch
+        """
+        results = list(results)
+        result = self._new_batch_result(len(results))
+        if not results:
+            return result
+        
+        try:
+            with self._batch_transaction() as conn:
+                cursor = conn.cursor()
+                
+                # 批量查找訂單（優先使用快取）與既有交易結果
+                order_ids = {}
+                client_ids = []
+                for client_order_id in {client_order_id for client_order_id, _ in results}:
+                    cached_order_id = self._get_cached_order_id(client_order_id)
+                    if cached_order_id is None:
+                        client_ids.append(client_order_id)
+                    else:
+                        order_ids[client_order_id] = cached_order_id
+                for start in range(0, len(client_ids), 500):
+                    chunk = client_ids[start:start + 500]
+                    cursor.execute(f"""
+                        SELECT client_order_id, id FROM orders_executed
+                        WHERE client_order_id IN ({','.join(['?'] * len(chunk))})
+                    """, chunk)
+                    for client_order_id, order_id in cursor.fetchall():
+                        order_ids[client_order_id] = order_id
+                        self._cache_order_id(client_order_id, order_id)
+                
+                existing_results = {}
+                found_order_ids = list(set(order_ids.values()))
+                for start in range(0, len(found_order_ids), 500):
+                    chunk = found_order_ids[start:start + 500]
+                    cursor.execute(f"""
+                        SELECT order_id, MIN(id) FROM trading_results
+                        WHERE order_id IN ({','.join(['?'] * len(chunk))})
+                        GROUP BY order_id
+                    """, chunk)
+                    existing_results.update(cursor.fetchall())
+                
+                rows = []
+                batch_order_index = {}
+                duplicates = []
+                for index, (client_order_id, result_data) in enumerate(results):
+                    order_id = order_ids.get(client_order_id)
+                    if order_id is None:
+                        result['errors'].append({'index': index, 'error': f'未找到訂單記錄: {client_order_id}'})
+                    elif order_id in existing_results:
+                        result['ids'][index] = existing_results[order_id]
+                        result['skipped'] += 1
+                    elif order_id in batch_order_index:
+                        duplicates.append((index, batch_order_index[order_id]))
+                    else:
+                        try:
+                            rows.append((index, self._build_result_row(order_id, result_data)))
+                            batch_order_index[order_id] = index
+                        except (KeyError, TypeError, ValueError) as e:
+                            result['errors'].append({'index': index, 'error': f'缺少或無效的欄位: {str(e)}'})
+                
+                assigned = self._insert_rows_batch(conn, 'trading_results', self.RESULT_COLUMNS, rows, result['errors'])
+        except Exception as e:
+            logger.error(f"批量記錄交易結果失敗: {str(e)}")
+            return dict(result, success=False, error=str(e))
+        
+        # 同一批次內重複的訂單跳過，返回首筆寫入的ID
+        for index, first_index in duplicates:
+            result['ids'][index] = assigned.get(first_index)
+            result['skipped'] += 1
+        
+        logger.info(f"✅ 已批量記錄交易結果: {len(assigned)}/{len(results)} 筆")
+        return self._finish_batch_result(result, assigned)
+    
+    def get_recent_signals(self, limit: int = 10) -> List[tuple]:
+        """獲取最近的信號記錄（SignalRow，signal_data_json 延遲解碼）"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+                conn.row_factory = make_row_factory('SignalRow', SIGNAL_CONVERTERS)
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -332,17 +887,17 @@ class TradingDataManager:
                     LIMIT ?
                 ''', (limit,))
                 
-                return [dict(row) for row in cursor.fetchall()]
+                return cursor.fetchall()
                 
         except Exception as e:
             logger.error(f"獲取最近信號時出錯: {str(e)}")
             return []
     
-    def get_recent_trading_results(self, limit: int = 10) -> List[Dict]:
-        """獲取最近的交易結果"""
+    def get_recent_trading_results(self, limit: int = 10) -> List[tuple]:
+        """獲取最近的交易結果（TradingResultRow）"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+                conn.row_factory = make_row_factory('TradingResultRow')
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -358,86 +913,135 @@ class TradingDataManager:
                     LIMIT ?
                 """, (limit,))
                 
-                return [dict(row) for row in cursor.fetchall()]
+                return cursor.fetchall()
                 
         except Exception as e:
             logger.error(f"獲取交易結果時出錯: {str(e)}")
             return []
     
-    def _update_daily_stats(self):
-        """更新每日統計數據"""
+    @staticmethod
+    def _day_bounds(date_str: str) -> Tuple[float, float]:
+        """日期（UTC）對應的半開時間戳區間 [start, end)，可直接使用時間戳索引"""
+        day_start = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        return day_start.timestamp(), day_start.timestamp() + 86400
+    
+    def _compute_daily_stats(self, cursor: sqlite3.Cursor, date_str: str) -> Dict[str, Any]:
+        """以時間戳範圍查詢計算單日統計"""
+        start_ts, end_ts = self._day_bounds(date_str)
+        
+        cursor.execute("""
+            SELECT COUNT(*) FROM signals_received 
+            WHERE timestamp >= ? AND timestamp < ?
+        """, (start_ts, end_ts))
+        total_signals = cursor.fetchone()[0]
+        
+        cursor.execute("""
+            SELECT COUNT(*) FROM orders_executed 
+            WHERE execution_timestamp >= ? AND execution_timestamp < ?
+        """, (start_ts, end_ts))
+        total_orders = cursor.fetchone()[0]
+        
+        # 交易結果欄位（含信號類型統計）與觸發器使用相同的查詢
+        cursor.execute(_daily_result_stats_select(':start_ts', ':end_ts'), {'start_ts': start_ts, 'end_ts': end_ts})
+        result_stats = dict(zip(DAILY_RESULT_STATS, cursor.fetchone()))
+        
+        return dict({
+            'date': date_str,
+            'total_signals': total_signals,
+            'total_orders': total_orders
+        }, **result_stats)
+    
+    def _write_daily_stats(self, cursor: sqlite3.Cursor, stats: Dict[str, Any]):
+        """寫入或覆蓋單日統計"""
+        cursor.execute("""
+            INSERT INTO daily_stats (
+                date, total_signals, total_orders, successful_trades, failed_trades,
+                win_rate, total_pnl, best_trade, worst_trade, avg_holding_time,
+                signal_type_stats, updated_at
+            ) VALUES (
+                :date, :total_signals, :total_orders, :successful_trades, :failed_trades,
+                :win_rate, :total_pnl, :best_trade, :worst_trade, :avg_holding_time,
+                :signal_type_stats, CURRENT_TIMESTAMP
+            )
+            ON CONFLICT(date) DO UPDATE SET
+                total_signals = excluded.total_signals,
+                total_orders = excluded.total_orders,
+                successful_trades = excluded.successful_trades,
+                failed_trades = excluded.failed_trades,
+                win_rate = excluded.win_rate,
+                total_pnl = excluded.total_pnl,
+                best_trade = excluded.best_trade,
+                worst_trade = excluded.worst_trade,
+                avg_holding_time = excluded.avg_holding_time,
+                signal_type_stats = excluded.signal_type_stats,
+                updated_at = CURRENT_TIMESTAMP
+        """, stats)
+    
+    def _update_daily_stats(self, date_str: Optional[str] = None):
+        """重新計算並更新某日（預設為今日，UTC）的統計數據"""
         try:
-            today = datetime.now().strftime('%Y-%m-%d')
+            date_str = date_str or datetime.now(timezone.utc).strftime('%Y-%m-%d')
             
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                
-                # 計算今日統計
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_signals
-                    FROM signals_received 
-                    WHERE DATE(datetime(timestamp, 'unixepoch')) = ?
-                """, (today,))
-                total_signals = cursor.fetchone()[0]
-                
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_orders
-                    FROM orders_executed 
-                    WHERE DATE(datetime(execution_timestamp, 'unixepoch')) = ?
-                """, (today,))
-                total_orders = cursor.fetchone()[0]
-                
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_trades,
-                        SUM(CASE WHEN is_successful = 1 THEN 1 ELSE 0 END) as successful_trades,
-                        SUM(final_pnl) as total_pnl,
-                        MAX(final_pnl) as best_trade,
-                        MIN(final_pnl) as worst_trade,
-                        AVG(holding_time_minutes) as avg_holding_time
-                    FROM trading_results 
-                    WHERE DATE(datetime(result_timestamp, 'unixepoch')) = ?
-                """, (today,))
-                
-                trade_stats = cursor.fetchone()
-                total_trades, successful_trades, total_pnl, best_trade, worst_trade, avg_holding_time = trade_stats
-                
-                # 計算勝率
-                win_rate = (successful_trades / total_trades * 100) if total_trades > 0 else 0
-                
-                # 計算信號類型統計
-                cursor.execute("""
-                    SELECT s.signal_type, COUNT(*) 
-                    FROM signals_received s
-                    JOIN orders_executed o ON s.id = o.signal_id
-                    JOIN trading_results r ON o.id = r.order_id
-                    WHERE DATE(datetime(r.result_timestamp, 'unixepoch')) = ?
-                    GROUP BY s.signal_type
-                """, (today,))
-                
-                signal_type_stats = dict(cursor.fetchall())
-                
-                # 更新或插入每日統計
-                cursor.execute("""
-                    INSERT OR REPLACE INTO daily_stats (
-                        date, total_signals, total_orders, successful_trades, failed_trades,
-                        win_rate, total_pnl, best_trade, worst_trade, avg_holding_time,
-                        signal_type_stats, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (
-                    today, total_signals, total_orders, successful_trades or 0, 
-                    (total_trades - successful_trades) if total_trades and successful_trades else 0,
-                    round(win_rate, 2), total_pnl or 0, best_trade or 0, worst_trade or 0,
-                    avg_holding_time or 0, json.dumps(signal_type_stats)
-                ))
-                
+                stats = self._compute_daily_stats(cursor, date_str)
+                self._write_daily_stats(cursor, stats)
                 conn.commit()
-                logger.info(f"已更新每日統計: {today}, 勝率: {win_rate:.1f}%")
+                logger.info(f"已更新每日統計: {date_str}, 勝率: {stats['win_rate']:.1f}%")
                 
         except Exception as e:
             logger.error(f"更新每日統計時出錯: {str(e)}")
-
-# 創建全局數據管理器實例
-trading_data_manager = TradingDataManager()
\ No newline at end of file
+    
+    def _compute_daily_stats_range(self, dates: List[str]) -> List[Dict[str, Any]]:
+        """在獨立的唯讀連接中計算一組日期的統計（供並行回填使用）"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30)
+        try:
+            cursor = conn.cursor()
+            return [self._compute_daily_stats(cursor, date_str) for date_str in dates]
+        finally:
+            conn.close()
+    
+    def backfill_daily_stats(self, start_date: str, end_date: str, max_workers: int = 4) -> Dict:
+        """
+        並行重建日期範圍內的每日統計
+        
+        Args:
+            start_date: 開始日期 YYYY-MM-DD（含）
+            end_date: 結束日期 YYYY-MM-DD（含）
+            max_workers: 並行計算的線程數
+            
+        Returns:
+            Dict: 回填結果
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        if end < start:
+            raise ValueError(f'結束日期 {end_date} 早於開始日期 {start_date}')
+        
+        dates = [(start + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range((end - start).days + 1)]
+        
+        # 按日期切分給各線程，sqlite3 查詢期間釋放GIL，可並行掃描索引範圍
+        chunk_size = max(1, -(-len(dates) // max(1, max_workers)))
+        chunks = [dates[i:i + chunk_size] for i in range(0, len(dates), chunk_size)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            day_stats = [stats for chunk_stats in executor.map(self._compute_daily_stats_range, chunks)
+                         for stats in chunk_stats]
+        
+        active_days = [stats for stats in day_stats
+                       if stats['total_signals'] or stats['total_orders']
+                       or stats['successful_trades'] or stats['failed_trades']]
+        
+        # 範圍內無活動的日期刪除，其餘覆蓋寫入，單一事務提交
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM daily_stats WHERE date >= ? AND date <= ?", (start_date, end_date))
+            for stats in active_days:
+                self._write_daily_stats(cursor, stats)
+            conn.commit()
+        
+        logger.info(f"已回填每日統計: {start_date} ~ {end_date}, {len(active_days)}/{len(dates)} 天有數據")
+        return {
+            'success': True,
+            'days_processed': len(dates),
+            'days_written': len(active_days)
+        }
@@ -0,0 +1,349 @@
+"""
+寫後佇列 - 群組提交
+record_* 調用只將寫入放入有界佇列後立即返回，由背景寫入線程每N筆或T毫秒合併為一次事務提交
+=============================================================================
+"""
+import atexit
+import collections
+import queue
+import sqlite3
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .local_ids import next_local_id
+
+# 設置logger
+logger = logging.getLogger(__name__)
+
+# 每次在數據庫中預留的ID數量
+ID_BLOCK_SIZE = 100
+# 整批提交失敗（如寫鎖逾時）的重試次數與初始退避秒數
+COMMIT_RETRIES = 3
+COMMIT_RETRY_BACKOFF = 0.5
+# 保留的失敗寫入記錄數
+MAX_FAILED_WRITES = 1000
+
+class _FlushMarker:
+    """佇列中的刷新標記，寫入線程提交其之前的所有寫入後通知等待者"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class WriteBehindQueue:
+    """寫後佇列 - 每個資料庫路徑共用一個寫入線程"""
+
+    def __init__(self, db_path: str, max_batch_rows: int = 500, max_delay_ms: float = 50,
+                 max_queue_size: int = 10000):
+        self.db_path = db_path
+        self.max_batch_rows = max_batch_rows
+        self.max_delay_seconds = max_delay_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+
+        # 預分配ID：寫入尚未落盤時也能立即返回記錄ID；表格 -> [下一個ID, 區塊結束ID)
+        self._id_lock = threading.Lock()
+        self._id_blocks = {}
+
+        # 失敗的寫入（調用者已返回，以 flush() 返回值與 get_failed_writes() 反映）
+        self._failed_writes = collections.deque(maxlen=MAX_FAILED_WRITES)
+        self._failed_total = 0
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'rows_submitted': 0,
+            'rows_committed': 0,
+            'rows_failed': 0,
+            'commits': 0,
+            'max_queue_depth': 0,
+            'backpressure_waits': 0,
+            'last_commit_latency_ms': 0.0,
+            'max_commit_latency_ms': 0.0,
+            'total_commit_latency_ms': 0.0,
+            'last_batch_rows': 0,
+            'commit_retries': 0,
+            'last_error': None
+        }
+
+        self._thread = threading.Thread(target=self._run, name=f"write-behind:{db_path}", daemon=True)
+        self._thread.start()
+
+    def allocate_id(self, table_name: str) -> int:
+        """為即將寫入的記錄預分配本地分區內的ID"""
+        return self.reserve_ids(table_name, 1)
+
+    def reserve_ids(self, table_name: str, count: int) -> int:
+        """
+        預留連續的ID區間
+
+        區塊在寫鎖下於本地ID分區內取得並寫回 sqlite_sequence，
+        其他寫入者（批量寫入、同步、其他進程）的 AUTOINCREMENT 會跳過已預留的區塊；
+        未用完的區塊只留下ID空缺
+
+        Returns:
+            int: 區間的第一個ID
+        """
+        with self._id_lock:
+            next_id, end_id = self._id_blocks.get(table_name, (0, 0))
+            if end_id - next_id < count:
+                next_id, end_id = self._reserve_block(table_name, max(count, ID_BLOCK_SIZE))
+            self._id_blocks[table_name] = (next_id + count, end_id)
+            return next_id
+
+    def _reserve_block(self, table_name: str, size: int) -> Tuple[int, int]:
+        """在數據庫中預留ID區塊，返回 [開始ID, 結束ID)"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            seq_row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table_name,)).fetchone()
+            start_id = next_local_id(conn, table_name)
+            if seq_row:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (start_id + size - 1, table_name))
+            else:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table_name, start_id + size - 1))
+            conn.execute("COMMIT")
+            return start_id, start_id + size
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def submit(self, sql: str, params: Sequence[Any], description: str = '',
+               timeout: Optional[float] = None):
+        """
+        提交一筆寫入
+
+        佇列已滿時阻塞調用者（背壓），直到寫入線程騰出空間或超時
+
+        Raises:
+            queue.Full: 超時仍無空間
+            RuntimeError: 佇列已關閉
+        """
+        if self._closed:
+            raise RuntimeError('寫後佇列已關閉')
+
+        item = (sql, tuple(params), description)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._metrics_lock:
+                self._metrics['backpressure_waits'] += 1
+            self._queue.put(item, timeout=timeout)
+
+        with self._metrics_lock:
+            self._metrics['rows_submitted'] += 1
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], self._queue.qsize())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待目前已提交的所有寫入落盤
+
+        Returns:
+            bool: 全部寫入成功落盤；逾時或期間有寫入失敗時返回False（詳見 get_failed_writes()）
+        """
+        failed_before = self._failed_total
+        if not self._thread.is_alive():
+            return self._queue.empty() and self._failed_total == failed_before
+        marker = _FlushMarker()
+        self._queue.put(marker, timeout=timeout)
+        return marker.done.wait(timeout) and self._failed_total == failed_before
+
+    def get_failed_writes(self, clear: bool = False) -> List[Dict]:
+        """最近失敗的寫入（description、error、failed_at）"""
+        with self._metrics_lock:
+            failed_writes = list(self._failed_writes)
+            if clear:
+                self._failed_writes.clear()
+        return failed_writes
+
+    def _record_failures(self, descriptions: Sequence[str], error: Exception):
+        """記錄失敗的寫入，調用者可經 flush() 與 get_failed_writes() 得知"""
+        failed_at = time.time()
+        with self._metrics_lock:
+            for description in descriptions:
+                self._failed_writes.append({
+                    'description': description,
+                    'error': str(error),
+                    'failed_at': failed_at
+                })
+            self._failed_total += len(descriptions)
+            self._metrics['last_error'] = str(error)
+
+    def close(self, timeout: Optional[float] = 30):
+        """停止接收新寫入，刷新剩餘寫入"""
+        if self._closed:
+            return
+        self._closed = True
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def get_metrics(self) -> Dict:
+        """獲取佇列深度與提交延遲指標"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        total_latency_ms = metrics.pop('total_commit_latency_ms')
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['avg_commit_latency_ms'] = round(total_latency_ms / metrics['commits'], 3) if metrics['commits'] else 0.0
+        return metrics
+
+    def _run(self):
+        """寫入線程：收集一批寫入後群組提交"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+
+                batch, markers = [], []
+                deadline = time.monotonic() + self.max_delay_seconds
+                stop = False
+                while True:
+                    if isinstance(item, _FlushMarker):
+                        markers.append(item)
+                    elif item is None:
+                        stop = True
+                        break
+                    else:
+                        batch.append(item)
+
+                    if len(batch) >= self.max_batch_rows or markers:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+
+                if batch:
+                    self._commit_batch(conn, batch)
+                for marker in markers:
+                    marker.done.set()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[Tuple[str, tuple, str]]):
+        """
+        一次事務寫入整批；相鄰的相同語句以 executemany 執行
+
+        出錯的寫入（如違反約束）逐筆記錄為失敗；整批提交失敗（如寫鎖逾時）時退避重試，
+        重試仍失敗才將整批記錄為失敗
+        """
+        started = time.monotonic()
+
+        groups = []
+        for sql, params, description in batch:
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(params)
+                groups[-1][2].append(description)
+            else:
+                groups.append((sql, [params], [description]))
+
+        for attempt in range(COMMIT_RETRIES + 1):
+            try:
+                failures = self._write_groups(conn, groups)
+                break
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if attempt == COMMIT_RETRIES:
+                    logger.error(f"寫後佇列提交失敗 {COMMIT_RETRIES + 1} 次，{len(batch)} 筆寫入未落盤: {str(e)}")
+                    failures = [([description for _, _, description in batch], e)]
+                    break
+                delay = COMMIT_RETRY_BACKOFF * (2 ** attempt)
+                logger.warning(f"寫後佇列提交失敗，{delay:.1f} 秒後重試: {str(e)}")
+                with self._metrics_lock:
+                    self._metrics['commit_retries'] += 1
+                time.sleep(delay)
+
+        failed = 0
+        for descriptions, error in failures:
+            self._record_failures(descriptions, error)
+            failed += len(descriptions)
+
+        latency_ms = (time.monotonic() - started) * 1000
+        with self._metrics_lock:
+            self._metrics['rows_committed'] += len(batch) - failed
+            self._metrics['rows_failed'] += failed
+            self._metrics['last_batch_rows'] = len(batch)
+            if failed < len(batch):
+                self._metrics['commits'] += 1
+                self._metrics['last_commit_latency_ms'] = round(latency_ms, 3)
+                self._metrics['max_commit_latency_ms'] = max(self._metrics['max_commit_latency_ms'], round(latency_ms, 3))
+                self._metrics['total_commit_latency_ms'] += latency_ms
+
+    @staticmethod
+    def _write_groups(conn: sqlite3.Connection, groups: List[Tuple[str, list, list]]) -> List[Tuple[List[str], Exception]]:
+        """
+        在一個事務中寫入各組語句
+
+        Returns:
+            List: 出錯的寫入 [(描述列表, 錯誤)]
+
+        Raises:
+            sqlite3.Error: 無法開始或提交事務（已回滾）
+        """
+        failures = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, params_list, descriptions in groups:
+                conn.execute("SAVEPOINT write_group")
+                try:
+                    cursor = conn.executemany(sql, params_list)
+                    if cursor.rowcount < len(params_list):
+                        logger.warning(f"寫後佇列: {len(params_list) - cursor.rowcount} 筆寫入未產生記錄 ({descriptions[0]})")
+                    conn.execute("RELEASE SAVEPOINT write_group")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK TO SAVEPOINT write_group")
+                    conn.execute("RELEASE SAVEPOINT write_group")
+                    # 逐筆重試，只有出錯的寫入失敗
+                    for params, description in zip(params_list, descriptions):
+                        try:
+                            conn.execute(sql, params)
+                        except sqlite3.Error as e:
+                            failures.append(([description], e))
+                            logger.error(f"寫後佇列寫入失敗 ({description}): {str(e)}")
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return failures
+
+# 每個資料庫路徑共用一個寫入線程，避免多個寫入者互相等待寫鎖
+_queues: Dict[str, WriteBehindQueue] = {}
+_queues_lock = threading.Lock()
+
+def get_write_behind_queue(db_path: str, **options) -> WriteBehindQueue:
+    """獲取資料庫路徑對應的共用寫後佇列"""
+    with _queues_lock:
+        write_queue = _queues.get(db_path)
+        if write_queue is None or write_queue._closed:
+            write_queue = WriteBehindQueue(db_path, **options)
+            _queues[db_path] = write_queue
+        return write_queue
+
+def flush_all_queues(timeout: Optional[float] = 30):
+    """刷新所有寫後佇列"""
+    with _queues_lock:
+        queues = list(_queues.values())
+    for write_queue in queues:
+        write_queue.flush(timeout)
+
+@atexit.register
+def _close_all_queues():
+    """程序退出前刷新並關閉所有寫後佇列"""
+    with _queues_lock:
+        queues = list(_queues.values())
+    for write_queue in queues:
+        try:
+            write_queue.close()
+        except Exception as e:
+            logger.error(f"關閉寫後佇列時出錯: {str(e)}")
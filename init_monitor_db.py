@@ -249,6 +249,7 @@ def init_database():
                 'CREATE INDEX IF NOT EXISTS idx_signals_type_symbol ON signals_received(signal_type, symbol)',
                 'CREATE INDEX IF NOT EXISTS idx_orders_client_id ON orders_executed(client_order_id)',
                 'CREATE INDEX IF NOT EXISTS idx_orders_symbol ON orders_executed(symbol)',
+                'CREATE INDEX IF NOT EXISTS idx_orders_signal_id ON orders_executed(signal_id)',
                 'CREATE INDEX IF NOT EXISTS idx_results_timestamp ON trading_results(result_timestamp)',
                 'CREATE INDEX IF NOT EXISTS idx_daily_stats_date ON daily_stats(date)',
                 'CREATE INDEX IF NOT EXISTS idx_ml_features_signal_id ON ml_features_v2(signal_id)',
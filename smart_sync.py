@@ -6,7 +6,7 @@ import os
 import subprocess
 import sqlite3
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 
 # 設置日誌
@@ -64,13 +64,22 @@ def get_remote_db_info():
 
 def sync_from_remote():
     """
-    🔥 主要同步函數 - v3.2.1 修復版本 (時間戳容忍度調整)
-    從遠程同步數據庫到本地
+    🔥 全量複製 - v3.2.1 修復版本 (時間戳容忍度調整)
+    以主來源的數據庫替換本地數據庫（用於首次部署或重建），
+    其他來源的分區會被覆蓋，因此註冊多個來源時拒絕執行；日常同步使用 sync_all_sources
     """
     try:
         # 確保本地目錄存在
         os.makedirs(os.path.dirname(LOCAL_DB_PATH), exist_ok=True)
         
+        from sync.source_registry import source_registry
+        if len(source_registry.get_enabled_sources()) > 1:
+            return {
+                'success': False,
+                'message': '已註冊多個同步來源，全量複製會覆蓋其他來源的記錄，請使用合併同步',
+                'error': 'Multiple sources registered'
+            }
+        
         # 檢查遠程數據庫
         if not check_remote_db_exists():
             return {
@@ -87,7 +96,9 @@ def sync_from_remote():
         need_sync = True
         sync_reason = "初始同步"
         
-        if os.path.exists(SYNC_STATE_FILE):
+        if os.path.exists(SYNC_STATE_FILE) and not os.path.exists(LOCAL_DB_PATH):
+            sync_reason = "本地數據庫不存在"
+        elif os.path.exists(SYNC_STATE_FILE):
             try:
                 with open(SYNC_STATE_FILE, 'r') as f:
                     sync_state = json.load(f)
@@ -142,31 +153,50 @@ def sync_from_remote():
             except Exception as e:
                 logger.warning(f"備份失敗: {str(e)}")
         
-        # 執行SCP同步
+        # 執行SCP同步 - 按遠程影響預算限制頻寬 (scp -l 單位為 Kbit/s)
+        budget = source_registry.get_default_source().impact_budget
+        bandwidth_args = ['-l', str(max(1, int(budget.max_bytes_per_second * 8 / 1000)))] if budget.max_bytes_per_second else []
+        
+        # 先下載到臨時文件再原子替換，讀取者不會看到寫了一半的數據庫
+        download_path = f"{LOCAL_DB_PATH}.download"
         sync_cmd = [
             'scp', '-i', SSH_KEY_PATH,
+            *bandwidth_args,
             '-o', 'ConnectTimeout=10',
             '-o', 'StrictHostKeyChecking=no',
             f'{REMOTE_USER}@{REMOTE_HOST}:{REMOTE_DB_PATH}',
-            LOCAL_DB_PATH
+            download_path
         ]
         
         logger.info("📡 執行SCP同步...")
-        result = subprocess.run(sync_cmd, capture_output=True, text=True, timeout=30)
+        # 限速後傳輸時間隨文件大小增長，超時按預算頻寬估算
+        scp_timeout = 30
+        if budget.max_bytes_per_second:
+            scp_timeout = max(30, int(remote_size / budget.max_bytes_per_second * 2) + 30)
+        result = subprocess.run(sync_cmd, capture_output=True, text=True, timeout=scp_timeout)
         
         if result.returncode == 0:
-            # 🔥 更新同步狀態
-            sync_state = {
+            # 交易主機的數據庫沒有監控端的聚合表、觸發器與檢查點，替換前在下載文件上建立
+            try:
+                _prepare_monitor_schema(download_path)
+            except Exception:
+                os.remove(download_path)
+                raise
+            os.replace(download_path, LOCAL_DB_PATH)
+            
+            # 🔥 更新同步狀態 - 與增量同步共用狀態文件，保留其水位並以本地最大ID重設
+            from sync.sync_state_manager import sync_state_manager
+            sync_state = sync_state_manager.state_data
+            sync_state.update({
                 'last_sync_time': datetime.now().isoformat(),
                 'last_size': remote_size,
                 'last_mtime': remote_mtime,
-                'sync_count': sync_state.get('sync_count', 0) + 1 if 'sync_state' in locals() else 1,
+                'sync_count': sync_state.get('sync_count', 0) + 1,
                 'sync_reason': sync_reason,
                 'version': 'v3.2.1'  # 版本標記
-            }
-            
-            with open(SYNC_STATE_FILE, 'w') as f:
-                json.dump(sync_state, f, indent=2)
+            })
+            _reset_incremental_watermarks(sync_state_manager)
+            sync_state_manager._save_state()
             
             # 驗證同步結果
             local_size = os.path.getsize(LOCAL_DB_PATH)
@@ -175,7 +205,7 @@ def sync_from_remote():
             # 快速檢查數據
             record_count = check_database_records()
             
-            return {
+            return _publish_snapshot({
                 'success': True,
                 'message': f'同步成功，數據庫大小: {local_size} bytes，記錄數: {record_count}',
                 'sync_performed': True,
@@ -183,8 +213,10 @@ def sync_from_remote():
                 'size_bytes': local_size,
                 'sync_time': sync_state['last_sync_time'],
                 'sync_reason': sync_reason
-            }
+            })
         else:
+            if os.path.exists(download_path):
+                os.remove(download_path)
             logger.error(f"❌ SCP同步失敗: {result.stderr}")
             return {
                 'success': False,
@@ -207,9 +239,122 @@ def sync_from_remote():
             'error': str(e)
         }
 
+def sync_incremental():
+    """
+    增量同步主來源 - 只拉取水位之後的新記錄，遠程新增欄位自動加入本地
+
+    只按 id 水位讀取新記錄，既有記錄的後續變更（訂單狀態、交易結果、ML更新）
+    不會同步，需要由全量同步或 Merkle 校對補齊，因此不作為預設同步方式
+    """
+    try:
+        from sync.incremental_sync_engine import incremental_sync_engine
+        result = incremental_sync_engine.sync_all_tables()
+        return {
+            'success': result['success'],
+            'message': f"增量同步{'成功' if result['success'] else '失敗'}: {result['total_records_synced']} 筆記錄",
+            'sync_performed': result['total_records_synced'] > 0,
+            'records': result['total_records_synced'],
+            'sync_time': result['sync_time'],
+            'sync_reason': '增量同步',
+            'table_results': result['table_results'],
+            'error': '; '.join(result['errors'])
+        }
+    except Exception as e:
+        logger.error(f"增量同步出錯: {str(e)}")
+        return {
+            'success': False,
+            'message': f'增量同步異常: {str(e)}',
+            'error': str(e)
+        }
+
+def _init_monitor_schema(db_path):
+    """建立或升級監控端表格（已初始化的數據庫只檢查結構），返回交易數據管理器"""
+    from database import TradingDataManager, MLDataManager
+    trading_manager = TradingDataManager(db_path)
+    MLDataManager(db_path)
+    return trading_manager
+
+def _prepare_monitor_schema(db_path):
+    """
+    在複製來的數據庫上執行監控端初始化：補齊基礎表欄位，建立並從現有數據重建
+    統計聚合、每日統計、權益曲線、成交品質與表格行數
+    """
+    trading_manager = _init_monitor_schema(db_path)
+    
+    # 交易主機的每日統計不一定完整，按數據涵蓋的日期（UTC）重新計算
+    with sqlite3.connect(db_path) as conn:
+        first_ts, last_ts = conn.execute("""
+            SELECT MIN(first_ts), MAX(last_ts) FROM (
+                SELECT MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts FROM signals_received
+                UNION ALL
+                SELECT MIN(execution_timestamp), MAX(execution_timestamp) FROM orders_executed
+                UNION ALL
+                SELECT MIN(result_timestamp), MAX(result_timestamp) FROM trading_results
+            )
+        """).fetchone()
+    if first_ts is not None:
+        trading_manager.backfill_daily_stats(
+            datetime.fromtimestamp(first_ts, timezone.utc).strftime('%Y-%m-%d'),
+            datetime.fromtimestamp(last_ts, timezone.utc).strftime('%Y-%m-%d')
+        )
+    logger.info(f"監控端表格已在下載的數據庫上初始化: {db_path}")
+
+def _reset_incremental_watermarks(state_manager):
+    """全量複製後本地與遠程一致，將增量同步水位設為本地各表最大ID"""
+    try:
+        with sqlite3.connect(LOCAL_DB_PATH) as conn:
+            for table_name, table_state in state_manager.state_data.get('table_sync_state', {}).items():
+                if 'last_id' not in table_state:
+                    continue
+                try:
+                    max_id = conn.execute(f"SELECT MAX(id) FROM {table_name}").fetchone()[0] or 0
+                except sqlite3.OperationalError:
+                    continue
+                table_state.update({
+                    'last_id': max_id,
+                    'last_timestamp': datetime.now().timestamp(),
+                    'last_sync': datetime.now().isoformat()
+                })
+    except Exception as e:
+        logger.warning(f"重設增量同步水位失敗: {str(e)}")
+
+def _publish_snapshot(result):
+    """同步寫入新數據後發布唯讀快照，Web讀取切換到新快照"""
+    from sync.snapshot_manager import snapshot_manager
+    if result.get('sync_performed') or snapshot_manager.get_current_path() is None:
+        result['snapshot'] = snapshot_manager.publish()
+    return result
+
+def sync_all_sources():
+    """
+    合併同步（預設）- 所有啟用的交易主機並行同步到同一監控數據庫
+    每個來源以 source_id 分區並保存獨立水位：按水位拉取新記錄，再以Merkle校對取得
+    既有記錄的更新與刪除；其他來源及推送接收的記錄保持不變
+    """
+    try:
+        from sync.multi_source_sync import multi_source_sync
+        # 本地數據庫先具備監控端表格，同步寫入由觸發器維護聚合
+        os.makedirs(os.path.dirname(LOCAL_DB_PATH), exist_ok=True)
+        _init_monitor_schema(LOCAL_DB_PATH)
+        result = multi_source_sync.sync_all_sources()
+        result['message'] = (
+            f"合併同步{'成功' if result['success'] else '部分失敗'}: "
+            f"{result['sources_processed']} 個來源，{result['total_records_synced']} 筆記錄"
+        )
+        result['records'] = result['total_records_synced']
+        result['sync_performed'] = result['total_records_synced'] > 0
+        return _publish_snapshot(result)
+    except Exception as e:
+        logger.error(f"合併同步出錯: {str(e)}")
+        return {
+            'success': False,
+            'message': f'合併同步異常: {str(e)}',
+            'error': str(e)
+        }
+
 def sync_database():
     """同步數據庫 - 向後相容函數"""
-    result = sync_from_remote()
+    result = sync_all_sources()
     
     # 轉換為舊格式
     if result['success']:
@@ -262,6 +407,7 @@ def get_sync_status():
                 'last_sync_time': sync_state.get('last_sync_time', '無'),
                 'sync_count': sync_state.get('sync_count', 0),
                 'last_size': sync_state.get('last_size', 0),
+                'throttle': sync_state.get('sync_statistics', {}).get('last_throttle'),
                 'status': 'ok'
             }
         else:
@@ -300,18 +446,28 @@ def main():
                 print("🌐 遠程數據庫: 不存在或無法訪問")
             return
             
-        elif sys.argv[1] == '--force':
-            # 強制同步
-            if os.path.exists(SYNC_STATE_FILE):
+        elif sys.argv[1] == '--incremental':
+            # 只拉取新記錄（不包含既有記錄的更新）
+            result = _publish_snapshot(sync_incremental())
+            print(f"📊 同步結果: {result['message']}")
+            return
+            
+        elif sys.argv[1] in ('--full', '--force'):
+            # 全量複製主來源（--force 忽略容忍度判斷）
+            if sys.argv[1] == '--force' and os.path.exists(SYNC_STATE_FILE):
                 os.remove(SYNC_STATE_FILE)
-            print("🔄 強制同步模式")
+                print("🔄 強制同步模式")
+            result = sync_from_remote()
+            print(f"📊 同步結果: {result['message']}")
+            if result['success']:
+                print(f"✅ 同步完成，共 {result.get('records', 0)} 筆記錄")
+            return
     
-    # 執行同步
-    result = sync_from_remote()
+    # 合併同步所有來源（--all-sources 相同）
+    result = sync_all_sources()
     print(f"📊 同步結果: {result['message']}")
-    
-    if result['success']:
-        print(f"✅ 同步完成，共 {result.get('records', 0)} 筆記錄")
+    for error in result.get('errors', []):
+        print(f"❌ {error}")
 
 if __name__ == '__main__':
     main()
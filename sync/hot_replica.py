@@ -0,0 +1,266 @@
+"""
+近期數據記憶體副本
+只將監控數據庫最近N天的交易鏈及小型聚合表複製到記憶體（記憶體與載入時間隨窗口而非數據庫大小增長），
+每次發布新快照（或數據庫變更）後增量補入新記錄，儀表板查詢不再讀取磁碟；
+需要窗口以外記錄的查詢改用唯讀快照
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from urllib.request import pathname2url
+from sync.snapshot_manager import snapshot_manager as default_snapshot_manager, SnapshotManager
+
+logger = logging.getLogger(__name__)
+
+# MONITOR_HOT_REPLICA=1 時啟用
+HOT_REPLICA_ENABLED = os.environ.get('MONITOR_HOT_REPLICA', '0') == '1'
+# 保留最近幾天的數據
+HOT_WINDOW_DAYS = float(os.environ.get('MONITOR_HOT_WINDOW_DAYS', '7'))
+# 增量刷新只補入新記錄，定期完整重載以反映原有記錄的更新
+HOT_RELOAD_SECONDS = float(os.environ.get('MONITOR_HOT_REPLICA_RELOAD_SECONDS', '3600'))
+
+# 窗口內保留的記錄：以信號時間為準保留完整交易鏈（順序即刷新順序）
+WINDOW_FILTERS = [
+    ('signals_received', "timestamp >= :cutoff"),
+    ('orders_executed', "execution_timestamp >= :cutoff OR signal_id IN (SELECT id FROM main.signals_received)"),
+    ('trading_results', "order_id IN (SELECT id FROM main.orders_executed)"),
+    ('ml_features_v2', "signal_id IN (SELECT id FROM main.signals_received)"),
+    ('ml_signal_quality', "signal_id IN (SELECT id FROM main.signals_received)"),
+    ('ml_price_optimization', "signal_id IN (SELECT id FROM main.signals_received)")
+]
+
+# 整表複製的小表（統計聚合表為全部數據的彙總，與快照一致）；其餘表在副本中只建立結構
+FULL_COPY_TABLES = [
+    'daily_stats',
+    'time_bucket_offsets',
+    'time_bucket_config',
+    'analytics_sketch_bounds',
+    'equity_curve_state',
+    'equity_checkpoints',
+    'analytics_signal_type_stats',
+    'analytics_strategy_stats',
+    'analytics_time_stats',
+    'analytics_symbol_stats',
+    'analytics_order_stats',
+    'analytics_distribution_buckets',
+    'table_row_counts',
+    'analytics_data_version'
+]
+
+class HotReplica:
+    """近期數據記憶體副本"""
+
+    def __init__(self, snapshot_manager: Optional[SnapshotManager] = None,
+                 window_days: float = HOT_WINDOW_DAYS, reload_seconds: float = HOT_RELOAD_SECONDS,
+                 enabled: bool = HOT_REPLICA_ENABLED):
+        self.snapshot_manager = snapshot_manager or default_snapshot_manager
+        self.window_days = window_days
+        self.reload_seconds = reload_seconds
+        self.enabled = enabled
+
+        # 所有線程共用一個記憶體連接，查詢與刷新以鎖串行（查詢為亞毫秒級）
+        self._lock = threading.RLock()
+        self._conn = None
+        self._source_key = None
+        self._source_schema = None
+        self._loaded_at = 0.0
+        self._metrics = {
+            'full_loads': 0,
+            'refreshes': 0,
+            'last_refresh_ms': 0.0,
+            'last_rows_added': 0
+        }
+
+    def _source(self) -> Tuple[Optional[str], Optional[tuple]]:
+        """數據來源的URI及變更標識：優先使用當前快照，否則唯讀打開監控數據庫"""
+        snapshot_path = self.snapshot_manager.get_current_path()
+        if snapshot_path is not None:
+            uri = f"file:{pathname2url(os.path.abspath(snapshot_path))}?mode=ro&immutable=1"
+            return uri, ('snapshot', snapshot_path)
+
+        db_path = self.snapshot_manager.db_path
+        try:
+            stat = os.stat(db_path)
+        except FileNotFoundError:
+            return None, None
+        return f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", ('db', stat.st_mtime_ns, stat.st_size)
+
+    def _cutoff(self) -> float:
+        return time.time() - self.window_days * 86400
+
+    def covers(self, time_range: Optional[Tuple[float, float]]) -> bool:
+        """
+        副本是否包含時間範圍內的全部記錄
+
+        time_range 為None表示只讀取聚合表或最近記錄；範圍開始早於窗口（含全部時間）時不包含
+        """
+        return time_range is None or time_range[0] >= self._cutoff()
+
+    @staticmethod
+    def _schema_signature(conn: sqlite3.Connection, schema: str) -> tuple:
+        """
+        表結構簽名
+
+        不使用 PRAGMA schema_version：備份API會改寫目標文件的結構版本，不同快照的值無法比較
+        """
+        return tuple(conn.execute(
+            f"SELECT name, sql FROM {schema}.sqlite_master WHERE type = 'table' ORDER BY name"
+        ).fetchall())
+
+    def _load(self, source_uri: str) -> Tuple[sqlite3.Connection, tuple]:
+        """
+        ATTACH 來源後按結構建表，只複製窗口內的記錄與整表複製的小表；
+        返回副本連接及來源的表結構簽名
+
+        副本只讀取，不建立觸發器（刷新時整表複製聚合表）；索引在寫入數據後建立
+        """
+        conn = sqlite3.connect('file::memory:', uri=True, check_same_thread=False)
+        conn.execute("ATTACH DATABASE ? AS src", (source_uri,))
+        try:
+            schema_signature = self._schema_signature(conn, 'src')
+            schema = conn.execute("""
+                SELECT type, name, sql FROM src.sqlite_master
+                WHERE type IN ('table', 'index', 'view') AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+            """).fetchall()
+
+            with conn:
+                for object_type, _, create_sql in schema:
+                    if object_type == 'table':
+                        conn.execute(create_sql)
+
+                existing = self._tables(conn, 'main')
+                cutoff = self._cutoff()
+                for table_name, condition in WINDOW_FILTERS:
+                    if table_name in existing:
+                        conn.execute(f"INSERT INTO main.{table_name} SELECT * FROM src.{table_name} WHERE {condition}",
+                                     {'cutoff': cutoff})
+                for table_name in FULL_COPY_TABLES:
+                    if table_name in existing:
+                        conn.execute(f"INSERT INTO main.{table_name} SELECT * FROM src.{table_name}")
+
+                for object_type, _, create_sql in schema:
+                    if object_type != 'table':
+                        conn.execute(create_sql)
+        finally:
+            conn.execute("DETACH DATABASE src")
+        return conn, schema_signature
+
+    @staticmethod
+    def _tables(conn: sqlite3.Connection, schema: str) -> set:
+        return {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+
+    def _refresh(self, source_uri: str) -> Optional[int]:
+        """
+        增量刷新：補入窗口內的新記錄並移除滑出窗口的記錄
+
+        Returns:
+            Optional[int]: 新增記錄數，表結構變化時返回None（需要完整重載）
+        """
+        conn = self._conn
+        conn.execute("ATTACH DATABASE ? AS src", (source_uri,))
+        try:
+            if self._schema_signature(conn, 'src') != self._source_schema:
+                return None
+
+            existing = self._tables(conn, 'main') & self._tables(conn, 'src')
+            cutoff = self._cutoff()
+            rows_added = 0
+            with conn:
+                for table_name, condition in WINDOW_FILTERS:
+                    if table_name not in existing:
+                        continue
+                    conn.execute(f"DELETE FROM main.{table_name} WHERE NOT ({condition})", {'cutoff': cutoff})
+                    cursor = conn.execute(f"""
+                        INSERT INTO main.{table_name}
+                        SELECT * FROM src.{table_name}
+                        WHERE ({condition}) AND id NOT IN (SELECT id FROM main.{table_name})
+                    """, {'cutoff': cutoff})
+                    rows_added += cursor.rowcount
+
+                for table_name in FULL_COPY_TABLES:
+                    if table_name in existing:
+                        conn.execute(f"DELETE FROM main.{table_name}")
+                        conn.execute(f"INSERT INTO main.{table_name} SELECT * FROM src.{table_name}")
+            return rows_added
+        finally:
+            conn.execute("DETACH DATABASE src")
+
+    def refresh_if_changed(self, force_reload: bool = False) -> bool:
+        """
+        來源變更時刷新副本
+
+        Returns:
+            bool: 副本是否可用
+        """
+        source_uri, source_key = self._source()
+        if source_uri is None:
+            return False
+
+        with self._lock:
+            if self._conn is not None and not force_reload and source_key == self._source_key:
+                return True
+
+            started = time.monotonic()
+            try:
+                rows_added = None
+                if (self._conn is not None and not force_reload
+                        and time.time() - self._loaded_at < self.reload_seconds):
+                    rows_added = self._refresh(source_uri)
+                    if rows_added is not None:
+                        self._metrics['refreshes'] += 1
+
+                if rows_added is None:
+                    conn, source_schema = self._load(source_uri)
+                    if self._conn is not None:
+                        self._conn.close()
+                    self._conn = conn
+                    self._source_schema = source_schema
+                    self._loaded_at = time.time()
+                    self._metrics['full_loads'] += 1
+                    rows_added = conn.execute("SELECT COUNT(*) FROM signals_received").fetchone()[0] \
+                        if 'signals_received' in self._tables(conn, 'main') else 0
+
+                self._source_key = source_key
+                self._metrics['last_rows_added'] = rows_added
+                self._metrics['last_refresh_ms'] = round((time.monotonic() - started) * 1000, 3)
+                return True
+            except Exception as e:
+                logger.error(f"刷新記憶體副本失敗: {str(e)}")
+                return self._conn is not None
+
+    @contextmanager
+    def connect(self, time_range: Optional[Tuple[float, float]] = None):
+        """
+        獲取副本連接（首次使用或來源變更時先刷新）
+
+        Args:
+            time_range: 查詢需要的記錄時間範圍 (start_ts, end_ts)，(-inf, inf) 為全部記錄；
+                副本只包含最近 window_days 天的交易鏈，範圍超出窗口或副本不可用時改用唯讀快照
+        """
+        if not self.covers(time_range) or not self.refresh_if_changed():
+            with self.snapshot_manager.connect() as conn:
+                yield conn
+            return
+
+        with self._lock:
+            yield self._conn
+
+    def get_metrics(self) -> Dict:
+        """副本狀態與刷新指標"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics.update({
+                'enabled': self.enabled,
+                'loaded': self._conn is not None,
+                'window_days': self.window_days,
+                'memory_bytes': (self._conn.execute("PRAGMA page_count").fetchone()[0] *
+                                 self._conn.execute("PRAGMA page_size").fetchone()[0]) if self._conn else 0
+            })
+        return metrics
+
+# 創建全局實例
+hot_replica = HotReplica()
@@ -2,23 +2,35 @@
 增量同步引擎
 只同步變更的數據，大幅提升效率
 """
-import os
-import sqlite3
-import subprocess
+import json
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional
-from sync.sync_state_manager import sync_state_manager
+from sync.sync_state_manager import get_state_manager_for_source
 from sync.remote_change_detector import create_remote_detector
+from sync.source_registry import SyncSource, source_registry
+from sync.local_row_writer import LocalRowWriter
+from sync.remote_impact_budget import RemoteImpactThrottler
+from database.signal_payload import PAYLOAD_COLUMNS
+
+# 二進制欄位在sqlite3 -json輸出中無法還原，改以十六進制附加欄位傳輸
+BLOB_HEX_SUFFIX = '__hex'
 
 logger = logging.getLogger(__name__)
 
 class IncrementalSyncEngine:
     """增量同步引擎"""
     
-    def __init__(self, local_db_path: str = "data/trading_signals.db"):
+    def __init__(self, local_db_path: str = "data/trading_signals.db", source: Optional[SyncSource] = None):
         self.local_db_path = local_db_path
-        self.remote_detector = create_remote_detector()
+        self.source = source or source_registry.get_default_source()
+        self.remote_detector = create_remote_detector(self.source)
+        self.state_manager = get_state_manager_for_source(self.source)
+        self.row_writer = LocalRowWriter(local_db_path)
+        self._remote_columns = {}
+        self.throttler = RemoteImpactThrottler(self.source.impact_budget)
+        # Merkle校對器（同步時要求校對才建立）
+        self.reconciler = None
         self.sync_stats = {
             'total_records_synced': 0,
             'tables_synced': 0,
@@ -38,7 +50,7 @@ class IncrementalSyncEngine:
             Dict: 同步結果
         """
         try:
-            print(f"🔄 開始同步表 {table_name}...")
+            print(f"🔄 [{self.source.source_id}] 開始同步表 {table_name}...")
             
             # 檢查是否有變更
             change_info = self.remote_detector.check_table_changes(table_name, last_id, 0)
@@ -52,38 +64,69 @@ class IncrementalSyncEngine:
                     'message': '無變更'
                 }
             
-            # 獲取新記錄
-            new_records = self._fetch_new_records(table_name, last_id)
-            
-            if not new_records['success']:
-                return {
-                    'success': False,
-                    'table_name': table_name,
-                    'error': new_records['error']
-                }
+            # 按欄位名對齊遠程表結構，結構變更不需要全量重新同步
+            schema_changes = self._sync_table_schema(table_name)
             
-            # 插入到本地資料庫
-            insert_result = self._insert_records_to_local(table_name, new_records['data'])
+            # 分頁獲取新記錄，每頁後推進水位並按遠程影響預算限速
+            records_synced = 0
+            latest_id = last_id
+            page_size = self.source.impact_budget.page_size
             
-            if insert_result['success']:
-                # 更新同步狀態
-                latest_id = int(change_info.get('latest_value', last_id))
-                sync_state_manager.update_table_sync_state(table_name, latest_id, datetime.now().timestamp())
+            while True:
+                if not self.throttler.wait_for_remote_load(self.remote_detector):
+                    print(f"⏸️ {table_name} 遠程負載過高，剩餘記錄延後到下次同步")
+                    return {
+                        'success': True,
+                        'table_name': table_name,
+                        'records_synced': records_synced,
+                        'latest_id': latest_id,
+                        'deferred': True,
+                        'message': '遠程負載過高，延後同步'
+                    }
                 
-                print(f"✅ {table_name} 同步完成: {insert_result['records_inserted']} 筆記錄")
+                new_records = self._fetch_new_records(table_name, latest_id, page_size)
                 
-                return {
-                    'success': True,
-                    'table_name': table_name,
-                    'records_synced': insert_result['records_inserted'],
-                    'latest_id': latest_id
-                }
-            else:
-                return {
-                    'success': False,
-                    'table_name': table_name,
-                    'error': insert_result['error']
-                }
+                if not new_records['success']:
+                    return {
+                        'success': False,
+                        'table_name': table_name,
+                        'records_synced': records_synced,
+                        'error': new_records['error']
+                    }
+                
+                if not new_records['data']:
+                    break
+                
+                # 插入到本地資料庫
+                insert_result = self._insert_records_to_local(table_name, new_records['data'])
+                
+                if not insert_result['success']:
+                    return {
+                        'success': False,
+                        'table_name': table_name,
+                        'records_synced': records_synced,
+                        'error': insert_result['error']
+                    }
+                
+                # 更新同步狀態 - 以實際寫入的最大遠程ID作為水位
+                latest_id = insert_result.get('max_remote_id') or latest_id
+                self.state_manager.update_table_sync_state(table_name, latest_id, datetime.now().timestamp())
+                records_synced += insert_result['records_inserted']
+                
+                self.throttler.throttle(new_records['record_count'], new_records['bytes'])
+                
+                if new_records['record_count'] < page_size:
+                    break
+            
+            print(f"✅ {table_name} 同步完成: {records_synced} 筆記錄")
+            
+            return {
+                'success': True,
+                'table_name': table_name,
+                'records_synced': records_synced,
+                'latest_id': latest_id,
+                'schema_changes': schema_changes
+            }
                 
         except Exception as e:
             logger.error(f"同步表 {table_name} 時出錯: {str(e)}")
@@ -93,13 +136,33 @@ class IncrementalSyncEngine:
                 'error': str(e)
             }
     
-    def _fetch_new_records(self, table_name: str, last_id: int) -> Dict:
+    def _sync_table_schema(self, table_name: str) -> Optional[Dict]:
+        """
+        比較遠程與本地表結構並自動補齊本地欄位
+        
+        Returns:
+            Optional[Dict]: 結構變更，獲取遠程結構失敗時返回None（寫入時仍按欄位名對齊）
         """
-        從遠程獲取新記錄
+        schema = self.remote_detector.get_table_schema(table_name)
+        if not schema['success'] or not schema['exists']:
+            logger.warning(f"無法獲取遠程 {table_name} 表結構: {schema.get('error', '表不存在')}")
+            return None
+        
+        self._remote_columns[table_name] = [column['name'] for column in schema['columns']]
+        changes = self.row_writer.sync_schema(table_name, schema['columns'], schema['create_sql'])
+        if changes['table_created'] or changes['added_columns']:
+            print(f"🧩 {table_name} 表結構已對齊: 新增欄位 {changes['added_columns']}"
+                  f"{'，已創建本地表' if changes['table_created'] else ''}")
+        return changes
+    
+    def _fetch_new_records(self, table_name: str, last_id: int, limit: int) -> Dict:
+        """
+        從遠程獲取一頁新記錄
         
         Args:
             table_name: 表名
             last_id: 最後同步的ID
+            limit: 每頁行數
             
         Returns:
             Dict: 獲取結果
@@ -111,10 +174,11 @@ class IncrementalSyncEngine:
                 sql_query = f"SELECT * FROM {table_name} ORDER BY date DESC LIMIT 10;"
             else:
                 # 其他表使用ID查詢
-                sql_query = f"SELECT * FROM {table_name} WHERE id > {last_id} ORDER BY id;"
+                sql_query = (f"SELECT {self._select_columns(table_name)} FROM {table_name} "
+                             f"WHERE id > {int(last_id)} ORDER BY id LIMIT {int(limit)};")
             
-            # 執行遠程查詢
-            result = self.remote_detector._execute_remote_sql(sql_query)
+            # 執行遠程查詢 - JSON輸出保留欄位名稱與類型
+            result = self.remote_detector._execute_remote_sql(sql_query, json_output=True)
             
             if not result['success']:
                 return {
@@ -128,20 +192,19 @@ class IncrementalSyncEngine:
                 return {
                     'success': True,
                     'data': [],
-                    'record_count': 0
+                    'record_count': 0,
+                    'bytes': 0
                 }
             
             # 將輸出轉換為記錄列表
-            records = []
-            for line in output.split('\n'):
-                if line.strip():
-                    # 簡單的分割處理，實際可能需要更複雜的解析
-                    records.append(line.strip())
+            records = json.loads(output)
+            self._restore_blob_columns(table_name, records)
             
             return {
                 'success': True,
                 'data': records,
-                'record_count': len(records)
+                'record_count': len(records),
+                'bytes': len(output)
             }
             
         except Exception as e:
@@ -150,7 +213,33 @@ class IncrementalSyncEngine:
                 'error': str(e)
             }
     
-    def _insert_records_to_local(self, table_name: str, records: List[str]) -> Dict:
+    def _select_columns(self, table_name: str) -> str:
+        """查詢欄位：二進制欄位的BLOB值改以十六進制附加欄位返回，避免重複傳輸"""
+        payload_columns = PAYLOAD_COLUMNS.get(table_name, ())
+        if not payload_columns:
+            return '*'
+        
+        columns = self._remote_columns.get(table_name)
+        selects = [
+            f"CASE WHEN typeof({c}) = 'blob' THEN NULL ELSE {c} END AS {c}" if c in payload_columns else c
+            for c in columns
+        ] if columns else ['*']
+        selects.extend(
+            f"CASE WHEN typeof({c}) = 'blob' THEN hex({c}) END AS {c}{BLOB_HEX_SUFFIX}"
+            for c in payload_columns if not columns or c in columns
+        )
+        return ', '.join(selects)
+    
+    def _restore_blob_columns(self, table_name: str, records: List[Dict]):
+        """將十六進制附加欄位還原為BLOB"""
+        for column in PAYLOAD_COLUMNS.get(table_name, ()):
+            hex_column = column + BLOB_HEX_SUFFIX
+            for record in records:
+                hex_value = record.pop(hex_column, None)
+                if hex_value is not None:
+                    record[column] = bytes.fromhex(hex_value)
+    
+    def _insert_records_to_local(self, table_name: str, records: List[Dict]) -> Dict:
         """
         將記錄插入本地資料庫
         
@@ -161,40 +250,41 @@ class IncrementalSyncEngine:
         Returns:
             Dict: 插入結果
         """
-        try:
-            if not records:
-                return {
-                    'success': True,
-                    'records_inserted': 0
-                }
-            
-            # 暫時先記錄到日誌，實際插入邏輯後續完善
+        if records:
             print(f"📊 準備插入 {len(records)} 筆記錄到 {table_name}")
-            for i, record in enumerate(records[:3]):  # 只顯示前3筆
-                print(f"   記錄 {i+1}: {record[:100]}...")
-            
-            # TODO: 實際的插入邏輯
-            # 這裡先返回成功，後續會實現真正的插入
-            
-            return {
-                'success': True,
-                'records_inserted': len(records)
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+        
+        # 批量UPSERT並套用來源分區
+        return self.row_writer.apply_rows(table_name, records, self.source)
+    
+    def _reconcile_table(self, table_name: str, table_result: Dict) -> Dict:
+        """校對已同步的記錄，修復與刪除的筆數計入同步結果"""
+        if self.reconciler is None:
+            from sync.merkle_reconciler import MerkleReconciler
+            self.reconciler = MerkleReconciler(self.local_db_path, self.source)
+        
+        reconcile_result = self.reconciler.reconcile_table(table_name)
+        table_result = dict(table_result, reconcile=reconcile_result)
+        if not reconcile_result['success']:
+            table_result.update(success=False, error=f"校對失敗: {reconcile_result.get('error')}")
+            return table_result
+        
+        table_result['records_synced'] = (table_result.get('records_synced', 0)
+                                          + reconcile_result['rows_repaired'] + reconcile_result['rows_deleted'])
+        return table_result
     
-    def sync_all_tables(self) -> Dict:
+    def sync_all_tables(self, reconcile: bool = False) -> Dict:
         """
         同步所有表
         
+        Args:
+            reconcile: 拉取新記錄後以Merkle校對找出並重新抓取已同步記錄的變更與刪除
+                （訂單狀態、交易結果、ML更新），只有不一致的區間需要傳輸
+        
         Returns:
             Dict: 同步摘要
         """
         sync_start_time = datetime.now()
+        self.throttler.reset()
         
         # 需要同步的表
         tables_to_sync = [
@@ -216,11 +306,14 @@ class IncrementalSyncEngine:
         
         for table_name in tables_to_sync:
             # 獲取最後同步狀態
-            last_sync_info = sync_state_manager.get_last_sync_info(table_name)
+            last_sync_info = self.state_manager.get_last_sync_info(table_name)
             last_id = last_sync_info.get('last_id', 0)
             
             # 同步表
             table_result = self.sync_table_incremental(table_name, last_id)
+            # 新記錄延後時不校對（校對會把未拉取的新記錄當作缺失一併抓取）
+            if reconcile and table_result['success'] and not table_result.get('deferred'):
+                table_result = self._reconcile_table(table_name, table_result)
             sync_results['table_results'][table_name] = table_result
             
             if table_result['success']:
@@ -234,10 +327,16 @@ class IncrementalSyncEngine:
         sync_duration = (datetime.now() - sync_start_time).total_seconds()
         sync_results['sync_duration_seconds'] = sync_duration
         
-        print(f"\n🎯 同步完成摘要:")
+        sync_results['source_id'] = self.source.source_id
+        sync_results['throttle_metrics'] = self.throttler.get_metrics()
+        self.state_manager.record_throttle_metrics(sync_results['throttle_metrics'])
+        
+        print(f"\n🎯 [{self.source.source_id}] 同步完成摘要:")
         print(f"   處理表數: {sync_results['tables_processed']}/{len(tables_to_sync)}")
         print(f"   同步記錄: {sync_results['total_records_synced']} 筆")
         print(f"   耗時: {sync_duration:.2f} 秒")
+        print(f"   限速休眠: {sync_results['throttle_metrics']['throttle_sleep_seconds']:.2f} 秒, "
+              f"負載暫停: {sync_results['throttle_metrics']['load_pauses']} 次")
         
         return sync_results
 
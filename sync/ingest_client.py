@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+推送式數據上傳客戶端 - 運行於交易主機
+定期讀取本地交易數據庫的新記錄，壓縮後批量推送到監控主機的 /api/ingest；
+已推送的記錄按ID區塊保存雜湊，區塊內容改變時（訂單狀態、交易結果、ML更新）重新推送該區塊
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+from typing import Dict, List, Tuple
+import requests
+from sync.ingest_handler import TABLE_APPLY_ORDER, encode_batch
+from sync.merkle_reconciler import hash_ranges
+from database.signal_payload import PAYLOAD_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+PUSH_STATE_FILE = "data/ingest_push_state.json"
+
+# 變更追蹤區塊大小（ID數）及推送狀態中保存區塊雜湊的鍵；
+# 刪除的記錄無法經推送移除，由監控主機的合併同步（Merkle校對）處理
+CHANGE_BLOCK_SIZE = 256
+BLOCK_HASHES_KEY = 'block_hashes'
+
+class IngestClient:
+    """推送式數據上傳客戶端"""
+
+    def __init__(self, ingest_url: str, token: str, source_id: str = "primary",
+                 db_path: str = "data/trading_signals.db", batch_size: int = 2000,
+                 state_file: str = PUSH_STATE_FILE):
+        self.ingest_url = ingest_url
+        self.token = token
+        self.source_id = source_id
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.state_file = state_file
+        self.state = self._load_state()
+        # 上次推送時已變更的區塊超過批次大小，剩餘區塊需要再次比較
+        self.changes_pending = False
+
+    def _load_state(self) -> Dict:
+        """載入各表已推送水位"""
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"載入推送狀態失敗: {str(e)}")
+        return {}
+
+    def _save_state(self):
+        """保存推送水位"""
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            with open(self.state_file, 'w') as f:
+                json.dump(self.state, f, indent=2)
+        except Exception as e:
+            logger.error(f"保存推送狀態失敗: {str(e)}")
+
+    def _read_new_rows(self, conn: sqlite3.Connection, table_name: str) -> List[Dict]:
+        """讀取水位之後的記錄"""
+        last_id = self.state.get(table_name, 0)
+        cursor = conn.execute(
+            f"SELECT * FROM {table_name} WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, self.batch_size)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _hash_blocks(self, conn: sqlite3.Connection, table_name: str,
+                     ranges: List[Tuple[int, int]]) -> List[str]:
+        """計算ID區間的雜湊（與Merkle校對相同的算法，信號原始數據按內容比較）"""
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})") if row[1] != 'id']
+        hashes = hash_ranges(conn, table_name, ['id'] + columns, ranges,
+                             payload_columns=PAYLOAD_COLUMNS.get(table_name, ()))
+        return [digest for _, digest in hashes]
+
+    def _block_range(self, block: int, last_id: int) -> Tuple[int, int]:
+        """區塊的ID區間，截至水位"""
+        low = block * CHANGE_BLOCK_SIZE
+        return low, min(low + CHANGE_BLOCK_SIZE - 1, last_id)
+
+    def _read_table_rows(self, conn: sqlite3.Connection, table_name: str,
+                         scan_changes: bool) -> Tuple[List[Dict], int, Dict[str, str]]:
+        """
+        讀取一個表待推送的記錄：雜湊已改變的區塊及水位之後的新記錄
+
+        Args:
+            scan_changes: 比較水位以下所有區塊（否則只比較水位所在的區塊，最近的記錄最常更新）
+
+        Returns:
+            Tuple: (記錄, 推送後的水位, 推送成功後保存的區塊雜湊)
+        """
+        last_id = self.state.get(table_name, 0)
+        stored_hashes = self.state.get(BLOCK_HASHES_KEY, {}).get(table_name, {})
+
+        blocks = []
+        if last_id:
+            blocks = range(last_id // CHANGE_BLOCK_SIZE + 1) if scan_changes else [last_id // CHANGE_BLOCK_SIZE]
+        ranges = [self._block_range(block, last_id) for block in blocks]
+
+        rows = []
+        new_hashes = {}
+        deferred_blocks = set()
+        for (low, high), digest in zip(ranges, self._hash_blocks(conn, table_name, ranges)):
+            key = str(low // CHANGE_BLOCK_SIZE)
+            if key not in stored_hashes:
+                # 舊版推送狀態沒有區塊雜湊，以當前內容作為基準
+                new_hashes[key] = digest
+            elif stored_hashes[key] != digest:
+                if len(rows) >= self.batch_size:
+                    deferred_blocks.add(key)
+                    self.changes_pending = True
+                    continue
+                rows.extend(dict(row) for row in conn.execute(
+                    f"SELECT * FROM {table_name} WHERE id BETWEEN ? AND ? ORDER BY id", (low, high)
+                ))
+                new_hashes[key] = digest
+
+        new_rows = self._read_new_rows(conn, table_name)
+        if new_rows:
+            rows.extend(new_rows)
+            last_id = new_rows[-1]['id']
+            # 新記錄所在的區塊以推送後的水位重新計算雜湊；延後的區塊保留舊雜湊，下次仍會推送
+            blocks = sorted({row['id'] // CHANGE_BLOCK_SIZE for row in new_rows} - {int(k) for k in deferred_blocks})
+            ranges = [self._block_range(block, last_id) for block in blocks]
+            new_hashes.update(zip((str(block) for block in blocks), self._hash_blocks(conn, table_name, ranges)))
+
+        return rows, last_id, new_hashes
+
+    def push_rows(self, rows_by_table: Dict[str, List[Dict]]) -> Dict:
+        """推送一個批次"""
+        response = requests.post(
+            self.ingest_url,
+            data=encode_batch(rows_by_table),
+            headers={
+                'Authorization': f'Bearer {self.token}',
+                'Content-Type': 'application/x-ndjson',
+                'Content-Encoding': 'gzip',
+                'X-Source-Id': self.source_id
+            },
+            timeout=30
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _apply_table_state(self, table_state: Dict[str, Tuple[int, Dict[str, str]]]):
+        """更新各表水位與區塊雜湊並保存"""
+        for table_name, (last_id, block_hashes) in table_state.items():
+            if last_id:
+                self.state[table_name] = last_id
+            self.state.setdefault(BLOCK_HASHES_KEY, {}).setdefault(table_name, {}).update(block_hashes)
+        self._save_state()
+
+    def push_new_rows(self, scan_changes: bool = False) -> int:
+        """
+        推送所有表的新記錄及已推送記錄的變更
+
+        Args:
+            scan_changes: 比較水位以下所有區塊的雜湊（否則只比較水位所在的區塊）
+
+        Returns:
+            int: 推送的記錄數
+        """
+        self.changes_pending = False
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            # 記錄與區塊雜湊取自同一讀取快照；推送前結束讀取事務，不阻塞交易機器人寫入
+            conn.execute('BEGIN')
+            existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+            rows_by_table = {}
+            table_state = {}
+            for table_name in TABLE_APPLY_ORDER:
+                if table_name in existing_tables:
+                    rows, last_id, block_hashes = self._read_table_rows(conn, table_name, scan_changes)
+                    if rows:
+                        rows_by_table[table_name] = rows
+                    if rows or block_hashes:
+                        table_state[table_name] = (last_id, block_hashes)
+            conn.commit()
+
+        if not rows_by_table:
+            if table_state:
+                self._apply_table_state(table_state)
+            return 0
+
+        result = self.push_rows(rows_by_table)
+        if not result.get('success', False):
+            raise RuntimeError(f"監控主機寫入失敗: {result.get('errors')}")
+
+        pushed = sum(len(rows) for rows in rows_by_table.values())
+        self._apply_table_state(table_state)
+
+        logger.info(f"📤 已推送 {pushed} 筆記錄到監控主機")
+        return pushed
+
+    def run_forever(self, interval_seconds: float = 2.0, change_scan_seconds: float = 60.0):
+        """持續推送，有積壓時立即推送下一批；每 change_scan_seconds 秒比較所有已推送區塊的雜湊"""
+        next_scan_time = 0.0
+        while True:
+            scan_changes = time.time() >= next_scan_time
+            try:
+                pushed = self.push_new_rows(scan_changes)
+                if scan_changes and not self.changes_pending:
+                    next_scan_time = time.time() + change_scan_seconds
+            except Exception as e:
+                logger.error(f"推送失敗: {str(e)}")
+                pushed = 0
+
+            if pushed == 0:
+                time.sleep(interval_seconds)
+
+def main():
+    """主程式 - 從環境變量讀取監控主機配置"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    ingest_url = os.environ.get('MONITOR_INGEST_URL')
+    token = os.environ.get('INGEST_API_TOKEN')
+    if not ingest_url or not token:
+        print("❌ 請設置 MONITOR_INGEST_URL 和 INGEST_API_TOKEN 環境變量")
+        sys.exit(1)
+
+    client = IngestClient(
+        ingest_url=ingest_url,
+        token=token,
+        source_id=os.environ.get('INGEST_SOURCE_ID', 'primary')
+    )
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--once':
+        print(f"📤 已推送 {client.push_new_rows(scan_changes=True)} 筆記錄")
+        return
+
+    client.run_forever(float(os.environ.get('INGEST_PUSH_INTERVAL', '2')),
+                       float(os.environ.get('INGEST_CHANGE_SCAN_INTERVAL', '60')))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+推送式數據接收處理器
+解析交易主機推送的壓縮NDJSON批次，驗證後以批量冪等UPSERT寫入監控數據庫
+"""
+import gzip
+import json
+import base64
+import binascii
+import time
+import zlib
+import logging
+from typing import Dict, List, Optional
+from sync.source_registry import SourceRegistry, source_registry
+from sync.local_row_writer import LocalRowWriter, PARTITIONED_FK_COLUMNS
+from sync.sync_state_manager import get_state_manager_for_source
+
+logger = logging.getLogger(__name__)
+
+# 解壓後的批次大小上限，防止壓縮炸彈
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+# 單批次最多行數
+MAX_ROWS_PER_BATCH = 50000
+
+# 二進制欄位值（如壓縮的信號原始數據）在NDJSON中以 {"$base64": "..."} 傳輸
+BLOB_VALUE_KEY = '$base64'
+
+# 寫入順序：先父表再子表，確保外鍵引用的記錄先到
+TABLE_APPLY_ORDER = [
+    'signals_received',
+    'orders_executed',
+    'trading_results',
+    'ml_features_v2',
+    'ml_signal_quality',
+    'ml_price_optimization'
+]
+
+class IngestError(Exception):
+    """推送批次無效"""
+
+    def __init__(self, message: str, details: Optional[List[str]] = None):
+        super().__init__(message)
+        self.details = details or []
+
+class IngestHandler:
+    """推送式數據接收處理器"""
+
+    def __init__(self, local_db_path: str = "data/trading_signals.db",
+                 registry: SourceRegistry = source_registry):
+        self.registry = registry
+        self.row_writer = LocalRowWriter(local_db_path)
+
+    def _decompress(self, body: bytes, content_encoding: str) -> bytes:
+        """按Content-Encoding解壓批次"""
+        encoding = (content_encoding or 'identity').strip().lower()
+
+        if encoding == 'identity':
+            data = body
+        elif encoding in ('gzip', 'deflate'):
+            # gzip: wbits=16+MAX_WBITS, deflate: zlib格式
+            wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+            decompressor = zlib.decompressobj(wbits)
+            data = decompressor.decompress(body, MAX_DECOMPRESSED_BYTES + 1)
+            if decompressor.unconsumed_tail:
+                raise IngestError('解壓後批次超過大小上限')
+        else:
+            raise IngestError(f'不支援的Content-Encoding: {encoding}')
+
+        if len(data) > MAX_DECOMPRESSED_BYTES:
+            raise IngestError('解壓後批次超過大小上限')
+        return data
+
+    def _parse_rows(self, data: bytes) -> Dict[str, List[Dict]]:
+        """解析並驗證NDJSON行，任何一行無效則整批拒絕"""
+        rows_by_table = {}
+        errors = []
+        row_count = 0
+
+        for line_no, line in enumerate(data.splitlines(), start=1):
+            if not line.strip():
+                continue
+
+            row_count += 1
+            if row_count > MAX_ROWS_PER_BATCH:
+                raise IngestError(f'批次超過 {MAX_ROWS_PER_BATCH} 行上限')
+
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                errors.append(f'第{line_no}行: JSON解析失敗 ({str(e)})')
+                continue
+
+            error = self._validate_item(item)
+            if error:
+                errors.append(f'第{line_no}行: {error}')
+                continue
+
+            rows_by_table.setdefault(item['table'], []).append(_decode_blob_values(item['row']))
+
+        if errors:
+            raise IngestError(f'批次包含 {len(errors)} 行無效記錄', errors[:50])
+        return rows_by_table
+
+    def _validate_item(self, item) -> Optional[str]:
+        """驗證單行記錄，返回錯誤描述"""
+        if not isinstance(item, dict):
+            return '記錄必須是JSON物件'
+
+        table_name = item.get('table')
+        if table_name not in PARTITIONED_FK_COLUMNS:
+            return f'未知的表: {table_name}'
+
+        row = item.get('row')
+        if not isinstance(row, dict) or not row:
+            return 'row必須是非空JSON物件'
+
+        row_id = row.get('id')
+        if not isinstance(row_id, int) or isinstance(row_id, bool) or row_id <= 0:
+            return 'row.id必須是正整數'
+
+        for column, value in row.items():
+            if not isinstance(column, str) or not column.isidentifier():
+                return f'無效的欄位名: {column}'
+            if isinstance(value, dict):
+                if set(value) != {BLOB_VALUE_KEY} or not isinstance(value[BLOB_VALUE_KEY], str):
+                    return f'欄位 {column} 的二進制值格式無效'
+                try:
+                    base64.b64decode(value[BLOB_VALUE_KEY], validate=True)
+                except binascii.Error:
+                    return f'欄位 {column} 的二進制值不是有效的base64'
+            elif value is not None and not isinstance(value, (str, int, float, bool)):
+                return f'欄位 {column} 的值必須是純量'
+
+        return None
+
+    def _advance_watermark(self, source, table_name: str, rows: List[Dict]):
+        """推送的記錄與現有水位連續時推進水位，避免拉取同步重複抓取"""
+        state_manager = get_state_manager_for_source(source)
+        last_id = state_manager.get_last_sync_info(table_name).get('last_id', 0)
+
+        ids = sorted(row['id'] for row in rows)
+        if ids[0] > last_id + 1:
+            # 中間有缺口，保留水位讓拉取同步補齊
+            return
+
+        for row_id in ids:
+            if row_id > last_id + 1:
+                break
+            last_id = max(last_id, row_id)
+
+        state_manager.update_table_sync_state(table_name, last_id, time.time())
+
+    def process_batch(self, body: bytes, content_encoding: str = 'identity',
+                      source_id: Optional[str] = None) -> Dict:
+        """
+        處理一個推送批次
+
+        Args:
+            body: 請求主體
+            content_encoding: 壓縮方式 (gzip/deflate/identity)
+            source_id: 推送來源ID
+
+        Returns:
+            Dict: 各表寫入結果
+        """
+        source = self.registry.get_source(source_id) if source_id else self.registry.get_default_source()
+        if source is None:
+            raise IngestError(f'未註冊的來源: {source_id}')
+
+        data = self._decompress(body, content_encoding)
+        rows_by_table = self._parse_rows(data)
+
+        result = {
+            'success': True,
+            'source_id': source.source_id,
+            'records_applied': 0,
+            'table_results': {},
+            'errors': []
+        }
+
+        for table_name in TABLE_APPLY_ORDER:
+            rows = rows_by_table.get(table_name)
+            if not rows:
+                continue
+
+            table_result = self.row_writer.apply_rows(table_name, rows, source)
+            result['table_results'][table_name] = {
+                'success': table_result['success'],
+                'records_applied': table_result.get('records_inserted', 0),
+                'records_quarantined': table_result.get('records_quarantined', 0)
+            }
+
+            if table_result['success']:
+                result['records_applied'] += table_result['records_inserted']
+                self._advance_watermark(source, table_name, rows)
+            else:
+                result['success'] = False
+                result['errors'].append(f"{table_name}: {table_result.get('error', '未知錯誤')}")
+
+        logger.info(f"📥 [{source.source_id}] 接收推送批次: {result['records_applied']} 筆記錄")
+        return result
+
+def _encode_blob_value(value):
+    """json.dumps 的default鉤子：二進制值編碼為base64物件"""
+    if isinstance(value, bytes):
+        return {BLOB_VALUE_KEY: base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'無法編碼的值類型: {type(value).__name__}')
+
+def _decode_blob_values(row: Dict) -> Dict:
+    """將base64物件還原為二進制值"""
+    for column, value in row.items():
+        if isinstance(value, dict):
+            row[column] = base64.b64decode(value[BLOB_VALUE_KEY])
+    return row
+
+def encode_batch(rows_by_table: Dict[str, List[Dict]]) -> bytes:
+    """將記錄編碼為gzip壓縮的NDJSON批次"""
+    lines = []
+    for table_name, rows in rows_by_table.items():
+        for row in rows:
+            lines.append(json.dumps({'table': table_name, 'row': row}, ensure_ascii=False,
+                                    separators=(',', ':'), default=_encode_blob_value))
+    return gzip.compress('\n'.join(lines).encode('utf-8'))
+
+# 創建全局實例
+ingest_handler = IngestHandler()
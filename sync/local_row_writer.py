@@ -0,0 +1,289 @@
+"""
+本地數據寫入器
+將遠程拉取或推送的記錄以批量冪等UPSERT寫入監控數據庫，並套用來源分區
+"""
+import re
+import json
+import time
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+from sync.source_registry import SyncSource, source_registry
+from database.signal_payload import PAYLOAD_COLUMNS, encode_signal_payload
+from database.local_ids import ID_PARTITION_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 可寫入的表及其引用其他表ID的欄位（寫入時套用同一來源的ID偏移）
+PARTITIONED_FK_COLUMNS = {
+    'signals_received': [],
+    'orders_executed': ['signal_id'],
+    'trading_results': ['order_id'],
+    'ml_features_v2': ['signal_id'],
+    'ml_signal_quality': ['signal_id'],
+    'ml_price_optimization': ['signal_id']
+}
+
+SOURCE_COLUMN = 'source_id'
+
+# 無法寫入的遠程記錄（如撞上 client_order_id、order_id 等次要唯一鍵）隔離於此，不阻塞整頁寫入
+QUARANTINE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS sync_quarantine (
+        source_id TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        remote_id INTEGER NOT NULL,
+        error TEXT,
+        row_json TEXT,
+        quarantined_at REAL NOT NULL,
+        PRIMARY KEY (source_id, table_name, remote_id)
+    )
+'''
+
+# ALTER TABLE ADD COLUMN 只接受常量預設值
+_CONSTANT_DEFAULT = re.compile(r"^(NULL|[-+]?\d+(\.\d+)?([eE][-+]?\d+)?|'([^']|'')*'|X'[0-9A-Fa-f]*')$", re.IGNORECASE)
+
+def _json_value(value):
+    """json.dumps 的default鉤子：二進制值以十六進制保存"""
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f'無法編碼的值類型: {type(value).__name__}')
+
+class LocalRowWriter:
+    """本地數據寫入器"""
+
+    def __init__(self, local_db_path: str = "data/trading_signals.db"):
+        self.local_db_path = local_db_path
+
+    def _get_local_columns(self, conn: sqlite3.Connection, table_name: str) -> List[str]:
+        """獲取本地表欄位"""
+        cursor = conn.execute(f"PRAGMA table_info({table_name})")
+        return [row[1] for row in cursor.fetchall()]
+
+    def _ensure_source_column(self, conn: sqlite3.Connection, table_name: str, columns: List[str]):
+        """確保本地表具有來源分區欄位"""
+        if SOURCE_COLUMN in columns:
+            return
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {SOURCE_COLUMN} TEXT DEFAULT 'primary'")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_source_id ON {table_name}({SOURCE_COLUMN})")
+        columns.append(SOURCE_COLUMN)
+        logger.info(f"已為 {table_name} 新增來源分區欄位")
+
+    def sync_schema(self, table_name: str, remote_columns: List[Dict], create_sql: Optional[str] = None) -> Dict:
+        """
+        按欄位名對齊遠程表結構：本地缺表時按遠程建表語句創建，
+        遠程新增的欄位以可空欄位加入本地，本地多出的欄位保持不變
+
+        Args:
+            table_name: 表名
+            remote_columns: 遠程 PRAGMA table_info 欄位（name/type/notnull/dflt_value/pk）
+            create_sql: 遠程建表語句
+
+        Returns:
+            Dict: {'table_created', 'added_columns', 'local_only_columns'}
+        """
+        result = {
+            'table_created': False,
+            'added_columns': [],
+            'local_only_columns': []
+        }
+
+        with sqlite3.connect(self.local_db_path, timeout=30) as conn:
+            local_info = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+
+            if not local_info:
+                if not create_sql:
+                    raise ValueError(f'本地表 {table_name} 不存在且缺少遠程建表語句')
+                conn.execute(re.sub(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?', 'CREATE TABLE IF NOT EXISTS ',
+                                    create_sql, count=1, flags=re.IGNORECASE))
+                conn.commit()
+                result['table_created'] = True
+                logger.info(f"已按遠程結構創建本地表 {table_name}")
+                return result
+
+            local_columns = {row[1] for row in local_info}
+            remote_names = {column['name'] for column in remote_columns}
+
+            for column in remote_columns:
+                name = column['name']
+                if name in local_columns:
+                    continue
+
+                definition = f'"{name.replace(chr(34), chr(34) * 2)}" {column.get("type") or ""}'.rstrip()
+                default = column.get('dflt_value')
+                if default is not None and _CONSTANT_DEFAULT.match(str(default).strip()):
+                    definition += f' DEFAULT {default}'
+
+                conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {definition}")
+                result['added_columns'].append(name)
+
+            # 本地獨有欄位：遠程記錄不提供值，NOT NULL 且無預設值的欄位會導致寫入失敗
+            for row in local_info:
+                name, notnull, default = row[1], row[3], row[4]
+                if name in remote_names or name == SOURCE_COLUMN:
+                    continue
+                result['local_only_columns'].append(name)
+                if notnull and default is None:
+                    logger.warning(f"{table_name}.{name} 為本地獨有的NOT NULL欄位，遠程記錄將無法寫入")
+
+            conn.commit()
+
+        if result['added_columns']:
+            logger.info(f"{table_name} 已新增遠程欄位: {result['added_columns']}")
+        return result
+
+    def _to_local_row(self, table_name: str, row: Dict, source: SyncSource) -> Dict:
+        """套用來源分區：偏移ID與外鍵並標記來源，信號原始數據統一為二進制編碼"""
+        local_row = dict(row)
+        local_row['id'] = source.to_local_id(row['id'])
+        for fk_column in PARTITIONED_FK_COLUMNS[table_name]:
+            if local_row.get(fk_column) is not None:
+                local_row[fk_column] = source.to_local_id(local_row[fk_column])
+        for payload_column in PAYLOAD_COLUMNS.get(table_name, ()):
+            if payload_column in local_row:
+                local_row[payload_column] = encode_signal_payload(local_row[payload_column])
+        local_row[SOURCE_COLUMN] = source.source_id
+        return local_row
+
+    def _apply_rows_individually(self, conn: sqlite3.Connection, table_name: str, sql: str,
+                                 columns: tuple, values: List[list], source: SyncSource) -> int:
+        """
+        逐行寫入（批量寫入觸發約束錯誤時使用），違反約束的記錄移入 sync_quarantine
+
+        Returns:
+            int: 隔離的記錄數
+        """
+        quarantined = 0
+        id_index = columns.index('id')
+        for row_values in values:
+            conn.execute('SAVEPOINT apply_row')
+            try:
+                conn.execute(sql, row_values)
+            except sqlite3.IntegrityError as e:
+                conn.execute('ROLLBACK TO apply_row')
+                remote_id = source.to_remote_id(row_values[id_index])
+                conn.execute(QUARANTINE_TABLE)
+                conn.execute('''
+                    INSERT OR REPLACE INTO sync_quarantine
+                    (source_id, table_name, remote_id, error, row_json, quarantined_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (source.source_id, table_name, remote_id, str(e),
+                      json.dumps(dict(zip(columns, row_values)), ensure_ascii=False, default=_json_value),
+                      time.time()))
+                quarantined += 1
+                logger.warning(f"{table_name} 遠程記錄 {remote_id} 違反約束，已隔離: {e}")
+            conn.execute('RELEASE apply_row')
+        return quarantined
+
+    @staticmethod
+    def _restore_local_sequence(conn: sqlite3.Connection, table_name: str, local_seq: Optional[int]):
+        """
+        寫入其他分區的記錄後 sqlite_sequence 會跳到該分區，恢復為本地分區內的值
+        （寫入前低於分區上限的序號與本地分區的最大ID中較大者），本地寫入的ID不會進入其他來源的分區
+        """
+        max_local_id = conn.execute(f"SELECT MAX(id) FROM {table_name} WHERE id < ?",
+                                    (ID_PARTITION_SIZE,)).fetchone()[0]
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq >= ?",
+                     (max(local_seq or 0, max_local_id or 0), table_name, ID_PARTITION_SIZE))
+
+    def apply_rows(self, table_name: str, rows: List[Dict], source: Optional[SyncSource] = None) -> Dict:
+        """
+        批量冪等寫入記錄
+
+        Args:
+            table_name: 表名
+            rows: 記錄列表（欄位名 -> 值，ID為遠程ID）
+            source: 記錄來源，預設為主來源
+
+        Returns:
+            Dict: 寫入結果
+        """
+        if table_name not in PARTITIONED_FK_COLUMNS:
+            return {
+                'success': False,
+                'error': f'不支援的表: {table_name}'
+            }
+
+        if not rows:
+            return {
+                'success': True,
+                'records_inserted': 0,
+                'records_quarantined': 0,
+                'max_remote_id': None
+            }
+
+        source = source or source_registry.get_default_source()
+
+        try:
+            with sqlite3.connect(self.local_db_path, timeout=30) as conn:
+                # 整頁在同一事務中提交，各組以保存點隔離；事務先讀取表結構與序號，開始時即取得寫鎖，
+                # 並行同步的其他來源等待而非在升級鎖或補欄位時衝突
+                if not conn.in_transaction:
+                    conn.execute('BEGIN IMMEDIATE')
+                local_columns = self._get_local_columns(conn, table_name)
+                if not local_columns:
+                    return {
+                        'success': False,
+                        'error': f'本地表 {table_name} 不存在'
+                    }
+                self._ensure_source_column(conn, table_name, local_columns)
+                local_column_set = set(local_columns)
+
+                local_seq = None
+                if source.id_offset:
+                    seq_row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ? AND seq < ?",
+                                           (table_name, ID_PARTITION_SIZE)).fetchone()
+                    local_seq = seq_row[0] if seq_row else None
+
+                # 按欄位組合分組，每組一條UPSERT語句批量執行
+                grouped_rows = {}
+                skipped_columns = set()
+                max_remote_id = None
+                for row in rows:
+                    if row.get('id') is None:
+                        raise ValueError(f'{table_name} 記錄缺少id欄位')
+                    remote_id = int(row['id'])
+                    max_remote_id = remote_id if max_remote_id is None else max(max_remote_id, remote_id)
+
+                    local_row = self._to_local_row(table_name, row, source)
+                    columns = tuple(c for c in local_row if c in local_column_set)
+                    skipped_columns.update(c for c in local_row if c not in local_column_set)
+                    grouped_rows.setdefault(columns, []).append([local_row[c] for c in columns])
+
+                quarantined = 0
+                for columns, values in grouped_rows.items():
+                    placeholders = ','.join(['?'] * len(columns))
+                    update_clause = ','.join(f"{c}=excluded.{c}" for c in columns if c != 'id')
+                    sql = f'''
+                        INSERT INTO {table_name} ({','.join(columns)})
+                        VALUES ({placeholders})
+                        ON CONFLICT(id) DO UPDATE SET {update_clause}
+                    '''
+                    # ON CONFLICT(id) 不處理次要唯一鍵衝突，批量失敗時改為逐行寫入並隔離衝突記錄
+                    conn.execute('SAVEPOINT apply_group')
+                    try:
+                        conn.executemany(sql, values)
+                    except sqlite3.IntegrityError:
+                        conn.execute('ROLLBACK TO apply_group')
+                        quarantined += self._apply_rows_individually(conn, table_name, sql, columns, values, source)
+                    conn.execute('RELEASE apply_group')
+
+                if source.id_offset:
+                    self._restore_local_sequence(conn, table_name, local_seq)
+                conn.commit()
+
+            if skipped_columns:
+                logger.warning(f"{table_name} 本地缺少欄位，已略過: {sorted(skipped_columns)}")
+
+            return {
+                'success': True,
+                'records_inserted': len(rows) - quarantined,
+                'records_quarantined': quarantined,
+                'max_remote_id': max_remote_id
+            }
+
+        except Exception as e:
+            logger.error(f"寫入 {table_name} 記錄時出錯: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Merkle樹完整性校對工具
+在遠程與本地對相同ID區間計算雜湊，只向下展開不一致的區間，
+最後只重新抓取不一致的葉區間，以 O(log n) 次往返找出並修復漂移與缺失記錄
+"""
+import sys
+import json
+import sqlite3
+import logging
+from typing import Dict, List, Optional, Tuple
+from sync.source_registry import SyncSource, source_registry, ID_PARTITION_SIZE
+from sync.remote_change_detector import create_remote_detector
+from sync.local_row_writer import LocalRowWriter, PARTITIONED_FK_COLUMNS, SOURCE_COLUMN
+from database.archive_manager import ArchiveManager
+from database.signal_payload import PAYLOAD_COLUMNS, PAYLOAD_ZDICT_V1
+
+logger = logging.getLogger(__name__)
+
+# 區間雜湊與抓取工具：同一份源碼在本地執行，並經SSH傳到遠程執行，確保兩端算法完全一致
+# 信號原始數據以JSON文本比較（文本與壓縮編碼的記錄內容相同即視為一致），
+# 解碼規則與 database/signal_payload.py 相同，遠程只需Python標準庫
+RANGE_TOOLS_SOURCE = '''
+import json
+import zlib
+import hashlib
+
+def _payload_text(value):
+    if not isinstance(value, bytes) or not value:
+        return value
+    if value[0] == 1:
+        decompressor = zlib.decompressobj(-15, zdict=PAYLOAD_ZDICT)
+        return (decompressor.decompress(value[1:]) + decompressor.flush()).decode("utf-8")
+    if value[0] == 0:
+        return value[1:].decode("utf-8")
+    return value
+
+def _canonical_payload(value):
+    value = _payload_text(value)
+    try:
+        return json.dumps(json.loads(value), sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return value
+
+def _normalize_row(row, id_offset, fk_indexes, payload_indexes, canonical):
+    values = list(row)
+    values[0] = values[0] - id_offset
+    for index in fk_indexes:
+        if values[index] is not None:
+            values[index] = values[index] - id_offset
+    for index in payload_indexes:
+        values[index] = _canonical_payload(values[index]) if canonical else _payload_text(values[index])
+    for index, value in enumerate(values):
+        if isinstance(value, bytes):
+            values[index] = value.hex()
+    return values
+
+def _range_rows(conn, table, columns, low, high, id_offset, fk_columns, payload_columns, canonical):
+    fk_indexes = [columns.index(c) for c in fk_columns if c in columns]
+    payload_indexes = [columns.index(c) for c in payload_columns if c in columns]
+    cursor = conn.execute(
+        "SELECT " + ",".join(columns) + " FROM " + table +
+        " WHERE id BETWEEN ? AND ? ORDER BY id",
+        (low + id_offset, high + id_offset)
+    )
+    for row in cursor:
+        yield _normalize_row(row, id_offset, fk_indexes, payload_indexes, canonical)
+
+def hash_ranges(conn, table, columns, ranges, id_offset=0, fk_columns=(), payload_columns=()):
+    results = []
+    for low, high in ranges:
+        digest = hashlib.sha256()
+        count = 0
+        for values in _range_rows(conn, table, columns, low, high, id_offset, fk_columns,
+                                  payload_columns, True):
+            digest.update(json.dumps(values, separators=(",", ":")).encode("utf-8"))
+            digest.update(b"\\n")
+            count += 1
+        results.append([count, digest.hexdigest()])
+    return results
+
+def fetch_ranges(conn, table, columns, ranges, id_offset=0, fk_columns=(), payload_columns=()):
+    rows = []
+    for low, high in ranges:
+        for values in _range_rows(conn, table, columns, low, high, id_offset, fk_columns,
+                                  payload_columns, False):
+            rows.append(dict(zip(columns, values)))
+    return rows
+
+def table_bounds(conn, table, low, high):
+    return list(conn.execute(
+        "SELECT MIN(id), MAX(id) FROM " + table + " WHERE id BETWEEN ? AND ?", (low, high)
+    ).fetchone())
+'''
+
+RANGE_TOOLS_SOURCE = f"PAYLOAD_ZDICT = {PAYLOAD_ZDICT_V1!r}\n" + RANGE_TOOLS_SOURCE
+
+_range_tools = {}
+exec(RANGE_TOOLS_SOURCE, _range_tools)
+
+# 本地區間雜湊（推送客戶端以同一算法追蹤已推送區塊的變更）
+hash_ranges = _range_tools['hash_ranges']
+
+# 遠程執行入口：以唯讀方式打開數據庫並輸出JSON結果
+_REMOTE_RUNNER = '''
+import sqlite3
+_args = json.loads({args!r})
+_conn = sqlite3.connect("file:" + _args["db_path"] + "?mode=ro", uri=True)
+if _args["op"] == "columns":
+    _result = [row[1] for row in _conn.execute("PRAGMA table_info(" + _args["table"] + ")")]
+elif _args["op"] == "bounds":
+    _result = table_bounds(_conn, _args["table"], 0, _args["max_id"])
+else:
+    _tool = hash_ranges if _args["op"] == "hash" else fetch_ranges
+    _result = _tool(_conn, _args["table"], _args["columns"], _args["ranges"],
+                    payload_columns=_args["payload_columns"])
+print(json.dumps(_result, separators=(",", ":")))
+'''
+
+class MerkleReconciler:
+    """遠程與本地表的Merkle樹校對器"""
+
+    def __init__(self, local_db_path: str = "data/trading_signals.db",
+                 source: Optional[SyncSource] = None, fanout: int = 16, leaf_size: int = 64):
+        self.local_db_path = local_db_path
+        self.source = source or source_registry.get_default_source()
+        self.remote_detector = create_remote_detector(self.source)
+        self.row_writer = LocalRowWriter(local_db_path)
+        self.archive_manager = ArchiveManager(local_db_path)
+        self.fanout = fanout
+        self.leaf_size = leaf_size
+        self.round_trips = 0
+
+    def _remote_call(self, op: str, table_name: str, **kwargs):
+        """執行一次遠程區間工具調用（一次SSH往返）"""
+        args = dict(kwargs, op=op, table=table_name, db_path=self.remote_detector.remote_db_path,
+                    payload_columns=PAYLOAD_COLUMNS.get(table_name, ()))
+        script = RANGE_TOOLS_SOURCE + _REMOTE_RUNNER.format(args=json.dumps(args))
+
+        self.round_trips += 1
+        result = self.remote_detector._execute_remote_python(script)
+        if not result['success']:
+            raise RuntimeError(f"遠程調用失敗 ({op}): {result.get('error')}")
+        return json.loads(result['output'])
+
+    def _get_compare_columns(self, conn: sqlite3.Connection, table_name: str) -> Optional[List[str]]:
+        """兩端共有的欄位（按遠程順序，id在首位），排除本地專屬欄位；遠程沒有此表時返回None"""
+        remote_columns = self._remote_call('columns', table_name)
+        if not remote_columns:
+            return None
+        local_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+
+        columns = [c for c in remote_columns if c in local_columns and c != SOURCE_COLUMN]
+        if 'id' not in columns:
+            raise ValueError(f'{table_name} 缺少id欄位，無法校對')
+        columns.remove('id')
+        return ['id'] + columns
+
+    def _local_hashes(self, conn, table_name, columns, ranges) -> List:
+        return _range_tools['hash_ranges'](
+            conn, table_name, columns, ranges,
+            self.source.id_offset, PARTITIONED_FK_COLUMNS[table_name], PAYLOAD_COLUMNS.get(table_name, ())
+        )
+
+    def _split_range(self, low: int, high: int) -> List[Tuple[int, int]]:
+        """將區間切分為至多fanout個子區間"""
+        step = max(1, -(-(high - low + 1) // self.fanout))
+        return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+    def _find_mismatched_leaves(self, conn, table_name: str, columns: List[str],
+                                low: int, high: int) -> Tuple[List[Tuple[int, int]], int]:
+        """逐層比較區間雜湊，返回不一致的葉區間"""
+        pending = [(low, high)]
+        leaves = []
+        ranges_compared = 0
+
+        while pending:
+            remote_hashes = self._remote_call('hash', table_name, columns=columns, ranges=pending)
+            local_hashes = self._local_hashes(conn, table_name, columns, pending)
+            ranges_compared += len(pending)
+
+            next_level = []
+            for (range_low, range_high), remote_hash, local_hash in zip(pending, remote_hashes, local_hashes):
+                if remote_hash == local_hash:
+                    continue
+                if range_high - range_low + 1 <= self.leaf_size:
+                    leaves.append((range_low, range_high))
+                else:
+                    next_level.extend(self._split_range(range_low, range_high))
+            pending = next_level
+
+        return leaves, ranges_compared
+
+    def _repair_leaves(self, conn, table_name: str, columns: List[str],
+                       leaves: List[Tuple[int, int]]) -> Dict:
+        """重新抓取不一致的葉區間，刪除遠程已不存在的本地記錄"""
+        remote_rows = self._remote_call('fetch', table_name, columns=columns, ranges=leaves)
+
+        write_result = self.row_writer.apply_rows(table_name, remote_rows, self.source)
+        if not write_result['success']:
+            raise RuntimeError(write_result.get('error'))
+
+        remote_ids = {row['id'] for row in remote_rows}
+        stale_ids = []
+        for low, high in leaves:
+            cursor = conn.execute(
+                f"SELECT id FROM {table_name} WHERE id BETWEEN ? AND ?",
+                (low + self.source.id_offset, high + self.source.id_offset)
+            )
+            stale_ids.extend(
+                local_id for (local_id,) in cursor.fetchall()
+                if self.source.to_remote_id(local_id) not in remote_ids
+            )
+
+        if stale_ids:
+            conn.executemany(f"DELETE FROM {table_name} WHERE id = ?", [(i,) for i in stale_ids])
+            conn.commit()
+
+        return {
+            'rows_repaired': len(remote_rows),
+            'rows_deleted': len(stale_ids)
+        }
+
+    def reconcile_table(self, table_name: str, dry_run: bool = False) -> Dict:
+        """
+        校對並修復單個表
+
+        Args:
+            table_name: 表名
+            dry_run: 只檢查不修復
+
+        Returns:
+            Dict: 校對結果
+        """
+        round_trips_before = self.round_trips
+        try:
+            with sqlite3.connect(self.local_db_path, timeout=30) as conn:
+                columns = self._get_compare_columns(conn, table_name)
+                if columns is None:
+                    return {
+                        'success': True,
+                        'table_name': table_name,
+                        'ranges_compared': 0,
+                        'mismatched_ranges': 0,
+                        'rows_repaired': 0,
+                        'rows_deleted': 0,
+                        'round_trips': self.round_trips - round_trips_before,
+                        'message': '遠程表不存在'
+                    }
+
+                # 根區間覆蓋兩端的最大ID（遠程ID空間）
+                remote_max = self._remote_call('bounds', table_name, max_id=ID_PARTITION_SIZE - 1)[1] or 0
+                local_max = conn.execute(
+                    f"SELECT MAX(id) FROM {table_name} WHERE id BETWEEN ? AND ?",
+                    (self.source.id_offset, self.source.id_offset + ID_PARTITION_SIZE - 1)
+                ).fetchone()[0]
+                local_max = self.source.to_remote_id(local_max) if local_max is not None else 0
+                high = max(remote_max, local_max)
+
+                # 已移至歸檔分區的ID區間不再校對，否則會被當作缺失記錄重新抓取
+                archived_ceiling = self.archive_manager.get_archived_id_ceiling(
+                    table_name, self.source.id_offset // ID_PARTITION_SIZE
+                )
+                low = self.source.to_remote_id(archived_ceiling) + 1 if archived_ceiling else 0
+
+                result = {
+                    'success': True,
+                    'table_name': table_name,
+                    'ranges_compared': 0,
+                    'mismatched_ranges': 0,
+                    'rows_repaired': 0,
+                    'rows_deleted': 0
+                }
+
+                if high >= low and high > 0:
+                    leaves, ranges_compared = self._find_mismatched_leaves(conn, table_name, columns, low, high)
+                    result['ranges_compared'] = ranges_compared
+                    result['mismatched_ranges'] = len(leaves)
+
+                    if leaves and not dry_run:
+                        result.update(self._repair_leaves(conn, table_name, columns, leaves))
+
+                result['round_trips'] = self.round_trips - round_trips_before
+                print(f"🔍 [{self.source.source_id}] {table_name}: 比較 {result['ranges_compared']} 個區間, "
+                      f"不一致 {result['mismatched_ranges']} 個, 修復 {result['rows_repaired']} 筆, "
+                      f"刪除 {result['rows_deleted']} 筆, 往返 {result['round_trips']} 次")
+                return result
+
+        except Exception as e:
+            logger.error(f"校對表 {table_name} 時出錯: {str(e)}")
+            return {
+                'success': False,
+                'table_name': table_name,
+                'error': str(e),
+                'round_trips': self.round_trips - round_trips_before
+            }
+
+    def reconcile_all_tables(self, dry_run: bool = False) -> Dict:
+        """校對所有可同步的表"""
+        summary = {
+            'success': True,
+            'source_id': self.source.source_id,
+            'table_results': {},
+            'errors': []
+        }
+
+        for table_name in PARTITIONED_FK_COLUMNS:
+            table_result = self.reconcile_table(table_name, dry_run)
+            summary['table_results'][table_name] = table_result
+            if not table_result['success']:
+                summary['success'] = False
+                summary['errors'].append(f"{table_name}: {table_result.get('error')}")
+
+        return summary
+
+def main():
+    """主程式"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    source_id = args[args.index('--source') + 1] if '--source' in args else None
+    table_name = args[args.index('--table') + 1] if '--table' in args else None
+
+    source = source_registry.get_source(source_id) if source_id else source_registry.get_default_source()
+    if source is None:
+        print(f"❌ 未註冊的來源: {source_id}")
+        sys.exit(1)
+
+    reconciler = MerkleReconciler(source=source)
+    if table_name:
+        result = reconciler.reconcile_table(table_name, dry_run)
+    else:
+        result = reconciler.reconcile_all_tables(dry_run)
+
+    print(f"📊 校對{'成功' if result['success'] else '失敗'}，共 {reconciler.round_trips} 次遠程往返")
+
+if __name__ == '__main__':
+    main()
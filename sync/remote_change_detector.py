@@ -2,21 +2,29 @@
 遠程變更檢測器
 檢測交易主機的數據變更，支援增量同步
 """
+import json
+import shlex
 import subprocess
 import logging
 from typing import Dict, Optional, Tuple
 from datetime import datetime
+from sync.source_registry import SyncSource, source_registry
+from sync.remote_impact_budget import RemoteImpactBudget
 
 logger = logging.getLogger(__name__)
 
 class RemoteChangeDetector:
     """遠程變更檢測器"""
     
-    def __init__(self, remote_host: str, remote_user: str, ssh_key_path: str, remote_db_path: str):
+    def __init__(self, remote_host: str, remote_user: str, ssh_key_path: str, remote_db_path: str,
+                 source_id: str = "primary", impact_budget: Optional[RemoteImpactBudget] = None):
         self.remote_host = remote_host
         self.remote_user = remote_user
         self.ssh_key_path = ssh_key_path
         self.remote_db_path = remote_db_path
+        self.source_id = source_id
+        # 遠程命令以低CPU/IO優先級執行，避免影響交易主機下單
+        self.impact_budget = impact_budget or RemoteImpactBudget()
     
     def check_table_changes(self, table_name: str, last_id: int = 0, last_timestamp: float = 0) -> Dict:
         """
@@ -99,19 +107,26 @@ class RemoteChangeDetector:
                 'error': str(e)
             }
     
-    def _execute_remote_sql(self, sql_query: str) -> Dict:
+    def _execute_remote_sql(self, sql_query: str, json_output: bool = False) -> Dict:
         """
         執行遠程SQL查詢 - 調試版本
+
+        Args:
+            sql_query: SQL查詢
+            json_output: 是否以JSON格式輸出（保留欄位名稱與類型）
         """
         try:
             # 構建SSH命令 - 簡化輸出格式
+            mode_flag = '-json ' if json_output else ''
             ssh_command = [
                 'ssh',
                 '-i', self.ssh_key_path,
                 '-o', 'ConnectTimeout=10',
                 '-o', 'StrictHostKeyChecking=no',
                 f'{self.remote_user}@{self.remote_host}',
-                f'sqlite3 {self.remote_db_path} "{sql_query}"'  # 移除 -header -column
+                self.impact_budget.wrap_command(
+                    f'sqlite3 {mode_flag}{shlex.quote(self.remote_db_path)} {shlex.quote(sql_query)}'
+                )
             ]
             
             # 執行命令
@@ -149,6 +164,101 @@ class RemoteChangeDetector:
                 'command': sql_query
             }
     
+    def _execute_remote_python(self, script: str, timeout: int = 120) -> Dict:
+        """
+        在遠程主機執行Python腳本（腳本經stdin傳入，輸出為stdout）
+        """
+        try:
+            ssh_command = [
+                'ssh',
+                '-i', self.ssh_key_path,
+                '-o', 'ConnectTimeout=10',
+                '-o', 'StrictHostKeyChecking=no',
+                f'{self.remote_user}@{self.remote_host}',
+                self.impact_budget.wrap_command('python3 -')
+            ]
+            
+            result = subprocess.run(
+                ssh_command,
+                input=script,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+            
+            if result.returncode == 0:
+                return {
+                    'success': True,
+                    'output': result.stdout
+                }
+            else:
+                return {
+                    'success': False,
+                    'error': result.stderr,
+                    'returncode': result.returncode
+                }
+                
+        except subprocess.TimeoutExpired:
+            return {
+                'success': False,
+                'error': 'SSH命令超時'
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def get_table_schema(self, table_name: str) -> Dict:
+        """
+        獲取遠程表結構（一次往返）
+
+        Returns:
+            Dict: {'success', 'exists', 'columns': [{name, type, notnull, dflt_value, pk}], 'create_sql'}
+        """
+        sql_query = (
+            "SELECT p.name AS name, p.type AS type, p.\"notnull\" AS \"notnull\", "
+            "p.dflt_value AS dflt_value, p.pk AS pk, m.sql AS create_sql "
+            "FROM sqlite_master m JOIN pragma_table_info(m.name) p "
+            f"WHERE m.type = 'table' AND m.name = '{table_name}' ORDER BY p.cid;"
+        )
+        result = self._execute_remote_sql(sql_query, json_output=True)
+        if not result['success']:
+            return {'success': False, 'error': result['error']}
+        
+        rows = json.loads(result['output']) if result['output'].strip() else []
+        return {
+            'success': True,
+            'exists': bool(rows),
+            'columns': [{k: row[k] for k in ('name', 'type', 'notnull', 'dflt_value', 'pk')} for row in rows],
+            'create_sql': rows[0]['create_sql'] if rows else None
+        }
+    
+    def get_remote_load_per_cpu(self) -> Optional[float]:
+        """獲取遠程主機每核心的1分鐘平均負載，失敗時返回None"""
+        try:
+            ssh_command = [
+                'ssh',
+                '-i', self.ssh_key_path,
+                '-o', 'ConnectTimeout=10',
+                '-o', 'StrictHostKeyChecking=no',
+                f'{self.remote_user}@{self.remote_host}',
+                'cat /proc/loadavg; nproc'
+            ]
+            
+            result = subprocess.run(ssh_command, capture_output=True, text=True, timeout=15)
+            if result.returncode != 0:
+                return None
+            
+            lines = result.stdout.split()
+            load_1min = float(lines[0])
+            cpu_count = int(lines[-1])
+            return load_1min / max(cpu_count, 1)
+            
+        except Exception as e:
+            logger.warning(f"獲取遠程負載失敗: {str(e)}")
+            return None
+    
     def check_all_tables_changes(self, last_sync_states: Dict) -> Dict:
         """
         檢查所有表的變更
@@ -190,11 +300,15 @@ class RemoteChangeDetector:
         return changes_summary
 
 # 創建配置實例
-def create_remote_detector():
-    """創建遠程檢測器實例"""
+def create_remote_detector(source: Optional[SyncSource] = None):
+    """創建遠程檢測器實例 - 未指定來源時使用主來源"""
+    if source is None:
+        source = source_registry.get_default_source()
     return RemoteChangeDetector(
-        remote_host="15.168.60.229",
-        remote_user="ec2-user", 
-        ssh_key_path="/home/ec2-user/.ssh/trading_monitor",
-        remote_db_path="/home/ec2-user/69trading-clean/data/trading_signals.db"
+        remote_host=source.remote_host,
+        remote_user=source.remote_user,
+        ssh_key_path=source.ssh_key_path,
+        remote_db_path=source.remote_db_path,
+        source_id=source.source_id,
+        impact_budget=source.impact_budget
     )
@@ -0,0 +1,128 @@
+"""
+遠程影響預算
+限制同步在交易主機上的CPU/IO優先級、讀取速率，並在主機負載過高時暫停
+"""
+import time
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class RemoteImpactBudget:
+    """遠程影響預算配置"""
+
+    def __init__(self, cpu_nice: int = 10, io_class: int = 3, io_level: int = 7,
+                 max_rows_per_second: float = 2000, max_bytes_per_second: float = 512 * 1024,
+                 max_load_per_cpu: Optional[float] = 0.8, load_check_interval: float = 10,
+                 max_pause_seconds: float = 300, page_size: int = 500):
+        self.cpu_nice = cpu_nice                          # nice值 (0-19)，越大優先級越低
+        self.io_class = io_class                          # ionice類別: 1=realtime, 2=best-effort, 3=idle
+        self.io_level = io_level                          # best-effort優先級 (0-7)
+        self.max_rows_per_second = max_rows_per_second    # 每秒最多讀取行數，0表示不限
+        self.max_bytes_per_second = max_bytes_per_second  # 每秒最多傳輸字節，0表示不限
+        self.max_load_per_cpu = max_load_per_cpu          # 每核心1分鐘負載上限，None表示不檢查
+        self.load_check_interval = load_check_interval    # 負載檢查間隔（秒）
+        self.max_pause_seconds = max_pause_seconds        # 單次負載暫停上限，超過則延後到下次同步
+        self.page_size = page_size                        # 每次遠程查詢的行數
+
+    def wrap_command(self, command: str) -> str:
+        """以低CPU/IO優先級包裝遠程命令"""
+        prefix = []
+        if self.cpu_nice:
+            prefix.append(f'nice -n {int(self.cpu_nice)}')
+        if self.io_class:
+            ionice = f'ionice -c {int(self.io_class)}'
+            if self.io_class == 2:
+                ionice += f' -n {int(self.io_level)}'
+            prefix.append(ionice)
+        return ' '.join(prefix + [command])
+
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'RemoteImpactBudget':
+        return cls(**(data or {}))
+
+class RemoteImpactThrottler:
+    """按預算對同步讀取進行限速與負載暫停，並記錄節流指標"""
+
+    def __init__(self, budget: RemoteImpactBudget):
+        self.budget = budget
+        self.reset()
+
+    def reset(self):
+        """開始新一輪同步"""
+        self._started = time.monotonic()
+        self._last_load_check = 0.0
+        self.metrics = {
+            'rows_fetched': 0,
+            'bytes_fetched': 0,
+            'throttle_sleep_seconds': 0.0,
+            'load_pauses': 0,
+            'load_pause_seconds': 0.0,
+            'last_remote_load_per_cpu': None,
+            'deferred_by_load': False
+        }
+
+    def throttle(self, rows: int, nbytes: int):
+        """記錄已讀取的量，超出速率預算時休眠"""
+        self.metrics['rows_fetched'] += rows
+        self.metrics['bytes_fetched'] += nbytes
+
+        required = 0.0
+        if self.budget.max_rows_per_second:
+            required = max(required, self.metrics['rows_fetched'] / self.budget.max_rows_per_second)
+        if self.budget.max_bytes_per_second:
+            required = max(required, self.metrics['bytes_fetched'] / self.budget.max_bytes_per_second)
+
+        # 負載暫停的時間不計入限速額度，避免暫停結束後突發讀取
+        active_seconds = time.monotonic() - self._started - self.metrics['load_pause_seconds']
+        sleep_seconds = required - active_seconds
+        if sleep_seconds > 0:
+            time.sleep(sleep_seconds)
+            self.metrics['throttle_sleep_seconds'] += sleep_seconds
+
+    def wait_for_remote_load(self, detector) -> bool:
+        """
+        遠程負載過高時暫停
+
+        Returns:
+            bool: False 表示暫停超過上限，應延後本次同步
+        """
+        if self.budget.max_load_per_cpu is None:
+            return True
+
+        now = time.monotonic()
+        if now - self._last_load_check < self.budget.load_check_interval:
+            return True
+
+        paused = 0.0
+        while True:
+            self._last_load_check = time.monotonic()
+            load_per_cpu = detector.get_remote_load_per_cpu()
+            self.metrics['last_remote_load_per_cpu'] = load_per_cpu
+
+            if load_per_cpu is None or load_per_cpu <= self.budget.max_load_per_cpu:
+                return True
+
+            if paused >= self.budget.max_pause_seconds:
+                logger.warning(f"遠程負載持續過高 ({load_per_cpu:.2f}/核心)，延後同步")
+                self.metrics['deferred_by_load'] = True
+                return False
+
+            if paused == 0.0:
+                self.metrics['load_pauses'] += 1
+                logger.info(f"⏸️ 遠程負載 {load_per_cpu:.2f}/核心 超過上限 {self.budget.max_load_per_cpu}，暫停同步")
+
+            wait_seconds = self.budget.load_check_interval
+            time.sleep(wait_seconds)
+            paused += wait_seconds
+            self.metrics['load_pause_seconds'] += wait_seconds
+
+    def get_metrics(self) -> Dict:
+        """獲取本輪節流指標"""
+        metrics = dict(self.metrics)
+        metrics['elapsed_seconds'] = round(time.monotonic() - self._started, 3)
+        metrics['throttle_sleep_seconds'] = round(metrics['throttle_sleep_seconds'], 3)
+        return metrics
@@ -0,0 +1,255 @@
+"""
+唯讀快照管理
+同步完成後以SQLite備份API將監控數據庫發布為不再修改的快照文件，並原子切換 CURRENT 指標；
+Web讀取以 mode=ro&immutable=1 打開當前快照，不需加鎖也不需檢查文件變更
+
+每次發布都完整備份數據庫（耗時與數據庫大小成正比），高頻寫入路徑改用 schedule_publish()：
+在背景線程合併發布，間隔不短於 SNAPSHOT_MIN_INTERVAL，也不短於上次發布耗時的 PUBLISH_COST_RATIO 倍，
+發布佔用的時間因此有上限；間隔內到達的寫入由延後的發布帶出，不需等待下一次寫入
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from urllib.request import pathname2url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "data/trading_signals.db"
+DEFAULT_SNAPSHOT_DIR = "data/snapshots"
+CURRENT_POINTER = "CURRENT"
+
+# 保留的舊快照數量：切換指標前已打開舊快照的讀取者仍可讀完
+KEEP_SNAPSHOTS = 3
+
+# 推送接收等高頻寫入路徑的最短發布間隔（秒）
+SNAPSHOT_MIN_INTERVAL = float(os.environ.get('MONITOR_SNAPSHOT_MIN_INTERVAL', '10'))
+# 發布間隔至少為上次發布耗時的倍數：數據庫變大時發布最多佔用約 1/PUBLISH_COST_RATIO 的時間
+PUBLISH_COST_RATIO = 10
+
+class SnapshotManager:
+    """快照發布與讀取"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR,
+                 keep: int = KEEP_SNAPSHOTS):
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.keep = keep
+        self.pointer_path = os.path.join(snapshot_dir, CURRENT_POINTER)
+        self._publish_lock = threading.Lock()
+        self._last_publish = 0.0
+        self._last_duration = 0.0
+
+        # 延後發布：有未發布的寫入時由計時器在間隔結束後發布
+        self._schedule_lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+
+        # 當前快照路徑按指標文件的inode與mtime快取（指標每次替換都是新文件），每次讀取只需一次stat
+        self._pointer_key = None
+        self._current_path = None
+
+        # 每個線程保留一個到當前快照的連接：快照不會改變，頁面快取永遠有效
+        self._local = threading.local()
+
+    # ------------------------------------------------------------------
+    # 發布
+    # ------------------------------------------------------------------
+
+    def publish(self) -> Dict:
+        """
+        將監控數據庫發布為新快照
+
+        快照先寫入臨時文件，完成後改名並原子替換 CURRENT 指標，
+        已發布的快照文件永不修改，因此讀取端可安全使用 immutable=1
+        """
+        if not os.path.exists(self.db_path):
+            return {'success': False, 'error': '數據庫不存在'}
+
+        with self._publish_lock:
+            error = self._prepare_publish()
+            if error:
+                logger.error(f"未發布快照: {error}")
+                return {'success': False, 'error': error}
+
+            # 此後的寫入需要下一次發布
+            with self._schedule_lock:
+                self._dirty = False
+            started = time.monotonic()
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+
+            name = f"trading_signals.{datetime.now().strftime('%Y%m%d%H%M%S%f')}.db"
+            snapshot_path = os.path.join(self.snapshot_dir, name)
+            temp_path = snapshot_path + '.tmp'
+
+            try:
+                source = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro",
+                                         uri=True, timeout=30)
+                target = sqlite3.connect(temp_path)
+                try:
+                    source.backup(target)
+                    # 快照以rollback journal模式保存，唯讀打開時不需要 -wal/-shm 文件
+                    target.execute("PRAGMA journal_mode=DELETE")
+                finally:
+                    target.close()
+                    source.close()
+
+                os.replace(temp_path, snapshot_path)
+                self._write_pointer(name)
+                self._prune(name)
+            except Exception as e:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                logger.error(f"發布快照失敗: {str(e)}")
+                with self._schedule_lock:
+                    self._dirty = True
+                return {'success': False, 'error': str(e)}
+
+            self._last_publish = time.time()
+            self._last_duration = time.monotonic() - started
+            duration = round(self._last_duration, 3)
+            logger.info(f"📸 已發布快照 {name} ({duration} 秒)")
+            return {
+                'success': True,
+                'snapshot': name,
+                'size_bytes': os.path.getsize(snapshot_path),
+                'duration': duration
+            }
+
+    def _prepare_publish(self) -> Optional[str]:
+        """
+        發布前檢查數據庫已有監控端表格，並處理權益曲線待重放的結果變更，
+        快照中的檢查點與狀態因此是最新的（唯讀讀取端不需寫入）
+
+        Returns:
+            Optional[str]: 不可發布的原因
+        """
+        from database import ArchiveManager, EquityCurveEngine
+        from database.analytics_aggregates import get_data_version
+
+        conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro", uri=True, timeout=30)
+        try:
+            initialized = get_data_version(conn) is not None
+        finally:
+            conn.close()
+        if not initialized:
+            return '數據庫缺少監控端聚合表（未初始化），發布後各統計面板將為空'
+
+        try:
+            EquityCurveEngine(self.db_path, archive_manager=ArchiveManager(self.db_path)).sync()
+        except sqlite3.Error as e:
+            return f'更新權益曲線檢查點失敗: {str(e)}'
+        return None
+
+    def schedule_publish(self, min_interval: float = SNAPSHOT_MIN_INTERVAL):
+        """
+        標記有新數據並在背景發布，供高頻寫入路徑使用（調用者不等待備份）
+
+        距上次發布已超過間隔時立即在背景發布，否則在間隔結束時發布一次，
+        期間的多次調用合併為同一次發布
+        """
+        interval = max(min_interval, self._last_duration * PUBLISH_COST_RATIO)
+        with self._schedule_lock:
+            self._dirty = True
+            if self._timer is not None:
+                return
+            delay = max(0.0, self._last_publish + interval - time.time())
+            self._timer = threading.Timer(delay, self._publish_pending, args=(min_interval,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _publish_pending(self, min_interval: float):
+        """計時器回調：發布未發布的寫入；發布期間又有寫入時再排程下一次"""
+        with self._schedule_lock:
+            dirty = self._dirty
+        if dirty:
+            self.publish()
+        with self._schedule_lock:
+            self._timer = None
+            reschedule = self._dirty
+        if reschedule:
+            self.schedule_publish(min_interval)
+
+    def _write_pointer(self, name: str):
+        """原子替換指標；多個進程同時發布時不讓較舊的快照覆蓋較新的指標"""
+        if os.path.exists(self.pointer_path):
+            with open(self.pointer_path, 'r') as f:
+                if f.read().strip() > name:
+                    return
+        temp_path = self.pointer_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(name)
+        os.replace(temp_path, self.pointer_path)
+
+    def _prune(self, current_name: str):
+        """刪除超出保留數量的舊快照"""
+        snapshots = sorted(
+            f for f in os.listdir(self.snapshot_dir)
+            if f.startswith('trading_signals.') and f.endswith('.db') and f != current_name
+        )
+        for name in snapshots[:max(0, len(snapshots) - (self.keep - 1))]:
+            try:
+                os.remove(os.path.join(self.snapshot_dir, name))
+            except OSError as e:
+                logger.warning(f"刪除舊快照 {name} 失敗: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------------
+
+    def get_current_path(self) -> Optional[str]:
+        """當前快照路徑，尚未發布時返回None"""
+        try:
+            stat = os.stat(self.pointer_path)
+        except FileNotFoundError:
+            return None
+
+        pointer_key = (stat.st_ino, stat.st_mtime_ns)
+        if pointer_key != self._pointer_key:
+            with open(self.pointer_path, 'r') as f:
+                name = f.read().strip()
+            self._current_path = os.path.join(self.snapshot_dir, name)
+            self._pointer_key = pointer_key
+        return self._current_path
+
+    def has_data(self) -> bool:
+        """是否有可讀取的快照或數據庫"""
+        return self.get_current_path() is not None or os.path.exists(self.db_path)
+
+    @contextmanager
+    def connect(self, time_range: Optional[Tuple[float, float]] = None):
+        """
+        打開唯讀連接
+
+        有快照時以 immutable=1 打開當前快照並在線程內重用，指標切換後自動改用新快照；
+        尚未發布快照時以 mode=ro 打開監控數據庫
+
+        Args:
+            time_range: 與記憶體副本相同的連接接口；快照包含全部數據，不需要按範圍選擇
+        """
+        snapshot_path = self.get_current_path()
+        if snapshot_path is None:
+            conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro", uri=True)
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.path != snapshot_path:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(
+                f"file:{pathname2url(os.path.abspath(snapshot_path))}?mode=ro&immutable=1", uri=True
+            )
+            self._local.conn = conn
+            self._local.path = snapshot_path
+        yield conn
+
+# 創建全局實例
+snapshot_manager = SnapshotManager()
@@ -0,0 +1,174 @@
+"""
+同步來源註冊表
+管理多台交易主機的連線配置，每個來源擁有獨立的分區與同步水位
+"""
+import json
+import os
+import logging
+from typing import Dict, List, Optional
+from sync.remote_impact_budget import RemoteImpactBudget
+from database.local_ids import ID_PARTITION_SIZE
+
+logger = logging.getLogger(__name__)
+
+SOURCES_CONFIG_FILE = "data/sync_sources.json"
+DEFAULT_SOURCE_ID = "primary"
+
+# 每個來源佔用的ID分區大小（database.local_ids）：本地 id = partition_slot * ID_PARTITION_SIZE + 遠程 id
+# 主來源 partition_slot=0，因此既有單主機數據的ID保持不變；監控主機本地寫入的ID同樣在第一個分區內
+
+class SyncSource:
+    """單一同步來源（交易主機）配置"""
+
+    def __init__(self, source_id: str, remote_host: str, remote_user: str,
+                 ssh_key_path: str, remote_db_path: str, partition_slot: int = 0,
+                 enabled: bool = True, impact_budget: Optional[RemoteImpactBudget] = None):
+        self.source_id = source_id
+        self.remote_host = remote_host
+        self.remote_user = remote_user
+        self.ssh_key_path = os.path.expanduser(ssh_key_path)
+        self.remote_db_path = remote_db_path
+        self.partition_slot = int(partition_slot)
+        self.enabled = enabled
+        self.impact_budget = impact_budget or RemoteImpactBudget()
+
+    @property
+    def id_offset(self) -> int:
+        """本地ID偏移量"""
+        return self.partition_slot * ID_PARTITION_SIZE
+
+    @property
+    def state_file(self) -> str:
+        """來源專屬的同步狀態文件 - 主來源沿用原有文件"""
+        if self.source_id == DEFAULT_SOURCE_ID:
+            return "data/sync_state.json"
+        return f"data/sync_state_{self.source_id}.json"
+
+    def to_local_id(self, remote_id: Optional[int]) -> Optional[int]:
+        """遠程ID轉換為本地分區ID"""
+        if remote_id is None:
+            return None
+        return int(remote_id) + self.id_offset
+
+    def to_remote_id(self, local_id: Optional[int]) -> Optional[int]:
+        """本地分區ID還原為遠程ID"""
+        if local_id is None:
+            return None
+        return int(local_id) - self.id_offset
+
+    def to_dict(self) -> Dict:
+        return {
+            'source_id': self.source_id,
+            'remote_host': self.remote_host,
+            'remote_user': self.remote_user,
+            'ssh_key_path': self.ssh_key_path,
+            'remote_db_path': self.remote_db_path,
+            'partition_slot': self.partition_slot,
+            'enabled': self.enabled,
+            'impact_budget': self.impact_budget.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SyncSource':
+        return cls(
+            source_id=data['source_id'],
+            remote_host=data['remote_host'],
+            remote_user=data.get('remote_user', 'ec2-user'),
+            ssh_key_path=data.get('ssh_key_path', '~/.ssh/trading_monitor'),
+            remote_db_path=data['remote_db_path'],
+            partition_slot=data.get('partition_slot', 0),
+            enabled=data.get('enabled', True),
+            impact_budget=RemoteImpactBudget.from_dict(data.get('impact_budget'))
+        )
+
+def _get_default_source() -> SyncSource:
+    """原有的單一交易主機配置"""
+    return SyncSource(
+        source_id=DEFAULT_SOURCE_ID,
+        remote_host="15.168.60.229",
+        remote_user="ec2-user",
+        ssh_key_path="/home/ec2-user/.ssh/trading_monitor",
+        remote_db_path="/home/ec2-user/69trading-clean/data/trading_signals.db",
+        partition_slot=0
+    )
+
+class SourceRegistry:
+    """同步來源註冊表"""
+
+    def __init__(self, config_file: str = SOURCES_CONFIG_FILE):
+        self.config_file = config_file
+        self.sources = self._load_sources()
+
+    def _load_sources(self) -> Dict[str, SyncSource]:
+        """載入來源配置，無配置文件時使用原有單一主機"""
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, 'r') as f:
+                    data = json.load(f)
+
+                sources = {}
+                for item in data.get('sources', []):
+                    source = SyncSource.from_dict(item)
+                    sources[source.source_id] = source
+
+                self._validate(sources)
+                if sources:
+                    return sources
+            except Exception as e:
+                logger.error(f"載入同步來源配置失敗: {str(e)}，使用預設來源")
+
+        default_source = _get_default_source()
+        return {default_source.source_id: default_source}
+
+    def _validate(self, sources: Dict[str, SyncSource]):
+        """確保每個來源的ID分區不重疊"""
+        slots = {}
+        for source in sources.values():
+            if source.partition_slot in slots:
+                raise ValueError(
+                    f"來源 {source.source_id} 與 {slots[source.partition_slot]} "
+                    f"使用相同的partition_slot: {source.partition_slot}"
+                )
+            slots[source.partition_slot] = source.source_id
+
+    def _save_sources(self):
+        """保存來源配置"""
+        try:
+            os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
+            with open(self.config_file, 'w') as f:
+                json.dump({'sources': [s.to_dict() for s in self.sources.values()]}, f, indent=2)
+        except Exception as e:
+            logger.error(f"保存同步來源配置失敗: {str(e)}")
+
+    def get_source(self, source_id: str = DEFAULT_SOURCE_ID) -> Optional[SyncSource]:
+        """根據ID獲取來源"""
+        return self.sources.get(source_id)
+
+    def get_default_source(self) -> SyncSource:
+        """獲取主來源，不存在時取第一個來源"""
+        return self.sources.get(DEFAULT_SOURCE_ID) or next(iter(self.sources.values()))
+
+    def get_enabled_sources(self) -> List[SyncSource]:
+        """獲取所有啟用的來源"""
+        return [s for s in self.sources.values() if s.enabled]
+
+    def register_source(self, source: SyncSource):
+        """註冊或更新來源"""
+        sources = dict(self.sources)
+        sources[source.source_id] = source
+        self._validate(sources)
+        self.sources = sources
+        self._save_sources()
+        logger.info(f"已註冊同步來源: {source.source_id} ({source.remote_host})")
+
+    def remove_source(self, source_id: str) -> bool:
+        """移除來源"""
+        if source_id not in self.sources:
+            return False
+        del self.sources[source_id]
+        self._save_sources()
+        logger.info(f"已移除同步來源: {source_id}")
+        return True
+
+# 創建全局實例
+source_registry = SourceRegistry()
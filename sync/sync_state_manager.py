@@ -75,5 +75,37 @@ class SyncStateManager:
         """獲取同步統計"""
         return self.state_data.get("sync_statistics", {})
 
+    def record_throttle_metrics(self, metrics: Dict):
+        """記錄最近一次同步的遠程影響節流指標，並累計總量"""
+        stats = self.state_data.setdefault("sync_statistics", {})
+        stats["last_throttle"] = metrics
+
+        totals = stats.setdefault("throttle_totals", {
+            "rows_fetched": 0,
+            "bytes_fetched": 0,
+            "throttle_sleep_seconds": 0,
+            "load_pauses": 0,
+            "load_pause_seconds": 0,
+            "deferred_syncs": 0
+        })
+        totals["rows_fetched"] += metrics.get("rows_fetched", 0)
+        totals["bytes_fetched"] += metrics.get("bytes_fetched", 0)
+        totals["throttle_sleep_seconds"] = round(totals["throttle_sleep_seconds"] + metrics.get("throttle_sleep_seconds", 0), 3)
+        totals["load_pauses"] += metrics.get("load_pauses", 0)
+        totals["load_pause_seconds"] += metrics.get("load_pause_seconds", 0)
+        totals["deferred_syncs"] += 1 if metrics.get("deferred_by_load") else 0
+        self._save_state()
+
 # 創建全局實例
 sync_state_manager = SyncStateManager()
+
+# 各來源的狀態管理器（每個來源使用獨立的狀態文件保存水位）
+_source_state_managers = {sync_state_manager.state_file: sync_state_manager}
+
+def get_state_manager_for_source(source) -> SyncStateManager:
+    """獲取來源專屬的同步狀態管理器"""
+    manager = _source_state_managers.get(source.state_file)
+    if manager is None:
+        manager = SyncStateManager(source.state_file)
+        _source_state_managers[source.state_file] = manager
+    return manager
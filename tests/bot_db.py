@@ -0,0 +1,68 @@
+"""
+交易主機數據庫：測試用的舊版交易機器人表結構與樣本交易
+"""
+import sqlite3
+from datetime import datetime, timezone
+
+# 2026-03-02 10:00 UTC 起每小時一筆信號、訂單與結果
+BASE_TS = datetime(2026, 3, 2, 10, tzinfo=timezone.utc).timestamp()
+TRADES = [
+    # (signal_type, symbol, 成交價偏差, pnl)
+    ('breakout_buy', 'BTCUSDT', 0.0, 12.5),
+    ('breakout_buy', 'BTCUSDT', 1.0, -4.0),
+    ('trend_sell', 'ETHUSDT', 0.5, 7.5),
+]
+
+def create_bot_db(path, trades=TRADES, client_prefix='order'):
+    """交易機器人的舊版結構：沒有 opposite、成交品質等監控端欄位，也沒有任何聚合表"""
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE signals_received (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp REAL NOT NULL,
+                signal_type TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                side TEXT NOT NULL,
+                open_price REAL,
+                close_price REAL,
+                strategy_name TEXT
+            );
+            CREATE TABLE orders_executed (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                signal_id INTEGER,
+                client_order_id TEXT UNIQUE NOT NULL,
+                symbol TEXT NOT NULL,
+                side TEXT NOT NULL,
+                order_type TEXT,
+                quantity REAL,
+                price REAL,
+                execution_timestamp REAL NOT NULL,
+                status TEXT
+            );
+            CREATE TABLE trading_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER,
+                client_order_id TEXT,
+                symbol TEXT NOT NULL,
+                final_pnl REAL,
+                result_timestamp REAL NOT NULL,
+                is_successful BOOLEAN,
+                holding_time_minutes INTEGER
+            );
+        """)
+        for index, (signal_type, symbol, gap, pnl) in enumerate(trades):
+            ts = BASE_TS + index * 3600
+            signal_id = conn.execute(
+                "INSERT INTO signals_received (timestamp, signal_type, symbol, side, open_price, close_price) "
+                "VALUES (?, ?, ?, 'BUY', 100, 100)", (ts, signal_type, symbol)
+            ).lastrowid
+            order_id = conn.execute(
+                "INSERT INTO orders_executed (signal_id, client_order_id, symbol, side, order_type, quantity, "
+                "price, execution_timestamp, status) VALUES (?, ?, ?, 'BUY', 'LIMIT', 1, ?, ?, 'FILLED')",
+                (signal_id, f'{client_prefix}-{index}', symbol, 100 + gap, ts + 1)
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO trading_results (order_id, client_order_id, symbol, final_pnl, result_timestamp, "
+                "is_successful, holding_time_minutes) VALUES (?, ?, ?, ?, ?, ?, 30)",
+                (order_id, f'{client_prefix}-{index}', symbol, pnl, ts + 1800, int(pnl > 0))
+            )
@@ -0,0 +1,68 @@
+"""
+權益曲線讀取測試：API讀取唯讀快照不寫入數據庫，降採樣不超過點數上限並保留最後一點
+"""
+import os
+import sqlite3
+
+import pytest
+
+import app as app_module
+from database import TradingDataManager
+from database.equity_curve import _downsample, _sample
+from sync.snapshot_manager import SnapshotManager
+from bot_db import create_bot_db
+
+DB_PATH = os.path.join('data', 'trading_signals.db')
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """監控數據庫有尚未處理的權益曲線變更（同步寫入後尚未發布快照）"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    create_bot_db(DB_PATH)
+    TradingDataManager(DB_PATH)
+
+    snapshots = SnapshotManager()
+    monkeypatch.setattr(app_module, 'snapshot_manager', snapshots)
+    monkeypatch.setattr(app_module, '_equity_curve_engine', None)
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    client.snapshots = snapshots
+    return client
+
+def _equity_state(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT dirty_from IS NOT NULL, trades FROM equity_curve_state").fetchone()
+
+def test_equity_curve_api_replays_pending_changes_without_writing(client):
+    assert _equity_state(DB_PATH) == (1, 0)
+
+    curve = client.get('/api/equity-curve').get_json()
+    assert [point['cumulative_pnl'] for point in curve['points']] == [12.5, 8.5, 16.0]
+    assert curve['summary']['cumulative_pnl'] == 16.0
+    assert curve['summary']['max_drawdown'] == 4.0
+    assert client.get('/api/analytics/bundle').get_json()['equity']['total_trades'] == 3
+    assert _equity_state(DB_PATH) == (1, 0)
+
+    # 發布的快照已處理變更，之後的寫入在下次發布前不影響API
+    assert client.snapshots.publish()['success']
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("UPDATE trading_results SET final_pnl = 2.5 WHERE id = 1")
+    assert client.get('/api/equity-curve').get_json()['summary']['cumulative_pnl'] == 16.0
+    assert client.snapshots.publish()['success']
+    assert client.get('/api/equity-curve').get_json()['summary']['cumulative_pnl'] == 6.0
+
+@pytest.mark.parametrize('total', [3, 10, 11, 500, 1001])
+@pytest.mark.parametrize('max_points', [2, 3, 4, 10])
+def test_sampling_stays_within_max_points(total, max_points):
+    points = [{'trades': i + 1, 'cumulative_pnl': float((i * 7919) % 23 - 11)} for i in range(total)]
+    trough = min(points, key=lambda p: p['cumulative_pnl'])
+
+    for sampled in (_sample(points, max_points), _downsample(points, max_points)):
+        assert len(sampled) <= max_points
+        assert sampled[-1] is points[-1]
+        assert [p['trades'] for p in sampled] == sorted({p['trades'] for p in sampled})
+
+    if max_points >= 3:
+        assert any(p['cumulative_pnl'] == trough['cumulative_pnl'] for p in _downsample(points, max_points))
@@ -0,0 +1,99 @@
+"""
+全量複製同步測試：從交易主機複製的數據庫沒有監控端表格，同步後的快照須能直接提供統計面板
+"""
+import os
+import shutil
+
+import pytest
+
+import smart_sync
+import sync.snapshot_manager
+from database import AnalyticsManager
+from sync.snapshot_manager import SnapshotManager
+from bot_db import create_bot_db
+
+@pytest.fixture
+def full_copy_sync(tmp_path, monkeypatch):
+    """以本地文件模擬交易主機，scp 改為文件複製，執行一次全量同步"""
+    remote_db = tmp_path / 'remote' / 'trading_signals.db'
+    os.makedirs(remote_db.parent)
+    create_bot_db(remote_db)
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+
+    def fake_run(cmd, **kwargs):
+        assert cmd[0] == 'scp'
+        shutil.copyfile(remote_db, cmd[-1])
+        return smart_sync.subprocess.CompletedProcess(cmd, 0, '', '')
+
+    monkeypatch.setattr(smart_sync.subprocess, 'run', fake_run)
+    monkeypatch.setattr(smart_sync, 'check_remote_db_exists', lambda: True)
+    monkeypatch.setattr(smart_sync, 'get_remote_db_info',
+                        lambda: (os.path.getsize(remote_db), os.path.getmtime(remote_db)))
+    snapshots = SnapshotManager()
+    monkeypatch.setattr(sync.snapshot_manager, 'snapshot_manager', snapshots)
+
+    result = smart_sync.sync_from_remote()
+    assert result['success'], result
+    assert result['snapshot']['success']
+    return snapshots
+
+def test_full_copy_sync_serves_panels_from_snapshot(full_copy_sync):
+    analytics = AnalyticsManager(smart_sync.LOCAL_DB_PATH, connection_provider=full_copy_sync.connect)
+
+    win_rate = analytics.get_win_rate_stats()
+    assert win_rate['total_trades'] == 3
+    assert win_rate['successful_trades'] == 2
+    assert win_rate['total_pnl'] == 16.0
+    assert {row['signal_type']: row['total'] for row in win_rate['by_signal_type']} == {
+        'breakout_buy': 2, 'trend_sell': 1
+    }
+
+    symbols = {row['symbol']: row for row in analytics.get_symbol_performance()['by_symbol']}
+    assert symbols['BTCUSDT']['total_trades'] == 2
+    assert symbols['ETHUSDT']['total_pnl'] == 7.5
+
+    execution = analytics.get_execution_analysis()
+    assert execution['total_orders'] == 3
+
+    with full_copy_sync.connect() as conn:
+        daily = conn.execute("SELECT total_signals, total_orders, successful_trades, failed_trades "
+                             "FROM daily_stats WHERE date = '2026-03-02'").fetchone()
+        counts = dict(conn.execute("SELECT name, row_count FROM table_row_counts"))
+    assert daily == (3, 3, 2, 1)
+    assert counts['signals_received'] == 3
+
+def test_full_copy_snapshot_includes_monitor_tables(full_copy_sync):
+    analytics = AnalyticsManager(smart_sync.LOCAL_DB_PATH, connection_provider=full_copy_sync.connect)
+
+    # 成交品質（049）：複製前不存在的欄位由初始化為既有訂單計算
+    fill_quality = analytics.get_fill_quality(group_by='symbol')
+    assert fill_quality['overall']['total_orders'] == 3
+    assert fill_quality['overall']['priced_orders'] == 3
+    assert fill_quality['overall']['worst_slippage'] == pytest.approx(0.01)
+
+    # 分位數草圖（046）
+    percentiles = analytics.get_percentiles('final_pnl')
+    assert percentiles['count'] == 3
+
+    # 時段分桶（044）
+    time_analysis = analytics.get_time_analysis()
+    assert sum(row['total_signals'] for row in time_analysis['hourly_stats']) == 3
+    assert len(time_analysis['hourly_stats']) == 3
+
+    # 權益曲線狀態（045）在發布前處理完畢，快照讀取端不需重放
+    with full_copy_sync.connect() as conn:
+        state = conn.execute("SELECT dirty_from, trades, cumulative_pnl, max_drawdown "
+                             "FROM equity_curve_state WHERE id = 1").fetchone()
+    assert state == (None, 3, 16.0, 4.0)
+
+def test_publish_refuses_uninitialized_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    create_bot_db('data/trading_signals.db')
+
+    snapshots = SnapshotManager()
+    result = snapshots.publish()
+    assert not result['success']
+    assert snapshots.get_current_path() is None
@@ -0,0 +1,45 @@
+"""
+導入副作用測試：交易主機上的同步客戶端只導入編碼模組，不得打開或初始化當前目錄的數據庫
+"""
+import os
+import sys
+import sqlite3
+import subprocess
+import importlib.util
+
+def _run_python(code, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    return subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+def test_sync_client_imports_do_not_touch_database(tmp_path):
+    # 模擬交易主機：當前目錄的 data/trading_signals.db 是交易機器人的數據庫
+    os.makedirs(tmp_path / 'data')
+    bot_db = tmp_path / 'data' / 'trading_signals.db'
+    with sqlite3.connect(bot_db) as conn:
+        conn.execute("CREATE TABLE signals_received (id INTEGER PRIMARY KEY, timestamp REAL)")
+
+    modules = ['sync.local_row_writer', 'sync.incremental_sync_engine', 'sync.ingest_handler', 'database']
+    if importlib.util.find_spec('requests') is not None:
+        modules.append('sync.ingest_client')
+    result = _run_python(f"import {', '.join(modules)}", tmp_path)
+    assert result.returncode == 0, result.stderr
+
+    with sqlite3.connect(bot_db) as conn:
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    assert names == {'signals_received'}
+
+def test_managers_are_created_on_first_access(tmp_path):
+    os.makedirs(tmp_path / 'data')
+    result = _run_python(
+        "import os, database\n"
+        "import database.trading_data_manager\n"
+        "assert not os.path.exists(database.DB_PATH)\n"
+        "from database import trading_data_manager\n"
+        "assert isinstance(trading_data_manager, database.TradingDataManager)\n"
+        "assert database.trading_data_manager is trading_data_manager\n"
+        "assert database.analytics_manager.archive_manager is database.archive_manager\n"
+        "assert os.path.exists(database.DB_PATH)\n",
+        tmp_path
+    )
+    assert result.returncode == 0, result.stderr
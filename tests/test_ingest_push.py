@@ -0,0 +1,91 @@
+"""
+推送同步測試：已推送記錄的更新按區塊雜湊重新推送到監控主機
+"""
+import os
+import sqlite3
+
+import pytest
+
+import sync.ingest_client
+from database import AnalyticsManager, TradingDataManager
+from database.local_ids import ID_PARTITION_SIZE
+from sync.ingest_client import BLOCK_HASHES_KEY, IngestClient
+from sync.ingest_handler import IngestHandler
+from sync.source_registry import SourceRegistry, SyncSource
+from bot_db import create_bot_db
+
+class _Response:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+@pytest.fixture
+def push_env(tmp_path, monkeypatch):
+    """交易主機數據庫經推送客戶端寫入監控數據庫（HTTP改為直接調用接收處理器）"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    bot_db = tmp_path / 'bot.db'
+    create_bot_db(bot_db)
+    monitor_db = str(tmp_path / 'data' / 'trading_signals.db')
+    TradingDataManager(monitor_db)
+
+    registry = SourceRegistry(config_file=str(tmp_path / 'data' / 'sync_sources.json'))
+    registry.sources = {'desk2': SyncSource('desk2', 'localhost', 'monitor', '~/.ssh/none', 'unused',
+                                            partition_slot=1)}
+    handler = IngestHandler(monitor_db, registry)
+
+    def fake_post(url, data, headers, timeout):
+        return _Response(handler.process_batch(data, headers['Content-Encoding'], headers['X-Source-Id']))
+
+    monkeypatch.setattr(sync.ingest_client.requests, 'post', fake_post)
+    # 每個區塊兩個ID，水位（3）所在的區塊為 [2, 3]
+    monkeypatch.setattr(sync.ingest_client, 'CHANGE_BLOCK_SIZE', 2)
+    client = IngestClient('http://monitor/api/ingest', 'token', source_id='desk2', db_path=str(bot_db),
+                          state_file=str(tmp_path / 'data' / 'ingest_push_state.json'))
+    assert client.push_new_rows() == 9
+    return bot_db, monitor_db, client
+
+def _monitor_value(monitor_db, sql):
+    with sqlite3.connect(monitor_db) as conn:
+        return conn.execute(sql).fetchone()
+
+def test_push_resends_changed_blocks(push_env):
+    bot_db, monitor_db, client = push_env
+    with sqlite3.connect(bot_db) as conn:
+        conn.execute("UPDATE trading_results SET final_pnl = 6.0, is_successful = 1 WHERE id = 2")
+        conn.execute("UPDATE orders_executed SET status = 'CANCELED' WHERE id = 1")
+
+    # 平時只比較水位所在的區塊：結果2已送達，區塊 [0, 1] 的訂單1留待完整比較
+    assert client.push_new_rows() == 2
+    assert _monitor_value(monitor_db, f"SELECT final_pnl FROM trading_results WHERE id = {ID_PARTITION_SIZE + 2}") == (6.0,)
+    assert _monitor_value(monitor_db, f"SELECT status FROM orders_executed WHERE id = {ID_PARTITION_SIZE + 1}") == ('FILLED',)
+
+    assert client.push_new_rows(scan_changes=True) == 1
+    assert _monitor_value(monitor_db, f"SELECT status FROM orders_executed WHERE id = {ID_PARTITION_SIZE + 1}") == ('CANCELED',)
+    assert client.push_new_rows(scan_changes=True) == 0
+
+    win_rate = AnalyticsManager(monitor_db).get_win_rate_stats()
+    assert win_rate['successful_trades'] == 3
+    assert win_rate['total_pnl'] == 26.0
+
+def test_push_state_without_block_hashes_takes_current_rows_as_baseline(push_env):
+    bot_db, monitor_db, client = push_env
+    # 舊版推送狀態只有水位
+    client.state = {table: last_id for table, last_id in client.state.items() if table != BLOCK_HASHES_KEY}
+
+    assert client.push_new_rows(scan_changes=True) == 0
+    with sqlite3.connect(bot_db) as conn:
+        conn.execute("UPDATE trading_results SET final_pnl = 1.0 WHERE id = 1")
+    assert client.push_new_rows(scan_changes=True) == 1
+
+    # 新記錄與所在區塊一起推送後不再重複推送
+    with sqlite3.connect(bot_db) as conn:
+        conn.execute("INSERT INTO signals_received (timestamp, signal_type, symbol, side) "
+                     "VALUES (0, 'breakout_buy', 'BTCUSDT', 'BUY')")
+    assert client.push_new_rows() == 1
+    assert client.push_new_rows(scan_changes=True) == 0
@@ -0,0 +1,118 @@
+"""
+合併同步測試：各來源只寫入自己的ID分區，既有記錄的變更經Merkle校對同步，
+推送接收的記錄不被覆蓋，本地寫入的ID留在第一個分區
+"""
+import os
+import sqlite3
+import subprocess
+
+import pytest
+
+import smart_sync
+import sync.multi_source_sync
+from database import AnalyticsManager, TradingDataManager
+from database.local_ids import ID_PARTITION_SIZE
+from sync.local_row_writer import LocalRowWriter
+from sync.multi_source_sync import MultiSourceSyncCoordinator
+from sync.remote_impact_budget import RemoteImpactBudget
+from sync.source_registry import SourceRegistry, SyncSource
+from bot_db import BASE_TS, create_bot_db
+
+_real_run = subprocess.run
+
+def _fake_ssh(cmd, **kwargs):
+    """SSH 命令改為在本機執行（遠程數據庫即本地文件）"""
+    assert cmd[0] == 'ssh'
+    if '/proc/loadavg' in cmd[-1]:
+        return subprocess.CompletedProcess(cmd, 0, '0.00 0.00 0.00 1/1 1\n1\n', '')
+    return _real_run(['bash', '-c', cmd[-1]], **kwargs)
+
+def _source(source_id, slot, remote_db):
+    budget = RemoteImpactBudget(max_rows_per_second=0, max_bytes_per_second=0, max_load_per_cpu=None)
+    return SyncSource(source_id, 'localhost', 'monitor', '~/.ssh/none', str(remote_db),
+                      partition_slot=slot, impact_budget=budget)
+
+@pytest.fixture
+def merge_env(tmp_path, monkeypatch):
+    """兩台交易主機（主來源與分區1）、一個只經推送接收的來源（分區2）"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    remotes = {}
+    remotes['primary'] = tmp_path / 'primary.db'
+    create_bot_db(remotes['primary'])
+    remotes['desk2'] = tmp_path / 'desk2.db'
+    create_bot_db(remotes['desk2'], [('trend_sell', 'SOLUSDT', 0.2, -2.0)], client_prefix='desk2')
+
+    registry = SourceRegistry(config_file=str(tmp_path / 'data' / 'sync_sources.json'))
+    registry.sources = {
+        'primary': _source('primary', 0, remotes['primary']),
+        'desk2': _source('desk2', 1, remotes['desk2'])
+    }
+    monkeypatch.setattr(subprocess, 'run', _fake_ssh)
+    monkeypatch.setattr(sync.multi_source_sync, 'multi_source_sync',
+                        MultiSourceSyncCoordinator(smart_sync.LOCAL_DB_PATH, registry))
+    monkeypatch.setattr('sync.source_registry.source_registry', registry)
+    return remotes
+
+def _rows_by_source(db_path, table_name):
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute(f"SELECT source_id, COUNT(*) FROM {table_name} GROUP BY source_id"))
+
+def test_merge_sync_picks_up_updates_and_keeps_other_partitions(merge_env):
+    result = smart_sync.sync_all_sources()
+    assert result['success'], result['errors']
+    assert _rows_by_source(smart_sync.LOCAL_DB_PATH, 'trading_results') == {'primary': 3, 'desk2': 1}
+
+    # 只經推送接收的來源寫入分區2
+    pushed = _source('pushed', 2, 'unused')
+    LocalRowWriter(smart_sync.LOCAL_DB_PATH).apply_rows('signals_received', [{
+        'id': 1, 'timestamp': BASE_TS, 'signal_type': 'breakout_sell', 'symbol': 'XRPUSDT', 'side': 'SELL'
+    }], pushed)
+
+    # 主來源更新既有記錄（ID水位之下）並刪除一筆結果
+    with sqlite3.connect(merge_env['primary']) as conn:
+        conn.execute("UPDATE trading_results SET final_pnl = 6.0, is_successful = 1 WHERE id = 2")
+        conn.execute("UPDATE orders_executed SET status = 'CANCELED' WHERE id = 3")
+        conn.execute("DELETE FROM trading_results WHERE id = 3")
+
+    result = smart_sync.sync_all_sources()
+    assert result['success'], result['errors']
+    assert result['source_results']['primary']['total_records_synced'] > 0
+
+    with sqlite3.connect(smart_sync.LOCAL_DB_PATH) as conn:
+        assert conn.execute("SELECT final_pnl FROM trading_results WHERE id = 2").fetchone() == (6.0,)
+        assert conn.execute("SELECT status FROM orders_executed WHERE id = 3").fetchone() == ('CANCELED',)
+    assert _rows_by_source(smart_sync.LOCAL_DB_PATH, 'trading_results') == {'primary': 2, 'desk2': 1}
+    assert _rows_by_source(smart_sync.LOCAL_DB_PATH, 'signals_received') == {'primary': 3, 'desk2': 1, 'pushed': 1}
+
+    # 聚合表由觸發器隨校對的更新與刪除維護
+    win_rate = AnalyticsManager(smart_sync.LOCAL_DB_PATH).get_win_rate_stats()
+    assert win_rate['total_trades'] == 3
+    assert win_rate['successful_trades'] == 2
+    assert win_rate['total_pnl'] == 16.5
+
+def test_full_copy_refused_with_multiple_sources(merge_env):
+    result = smart_sync.sync_from_remote()
+    assert not result['success']
+    assert not os.path.exists(smart_sync.LOCAL_DB_PATH)
+
+def test_local_inserts_stay_below_partition_base(merge_env):
+    assert smart_sync.sync_all_sources()['success']
+    manager = TradingDataManager(smart_sync.LOCAL_DB_PATH)
+
+    signal_id = manager.record_signal_received({'signal_type': 'breakout_buy', 'symbol': 'BTCUSDT', 'side': 'BUY'})
+    assert manager.record_order_executed(signal_id, {
+        'client_order_id': 'local-1', 'symbol': 'BTCUSDT', 'side': 'BUY', 'quantity': 1, 'price': 100
+    })
+    assert manager.record_trading_result_by_client_id('local-1', {
+        'client_order_id': 'local-1', 'symbol': 'BTCUSDT', 'final_pnl': 1.0, 'exit_method': 'TP',
+        'entry_price': 100, 'exit_price': 101, 'total_quantity': 1, 'result_timestamp': BASE_TS,
+        'is_successful': True, 'holding_time_minutes': 5
+    })
+
+    with sqlite3.connect(smart_sync.LOCAL_DB_PATH) as conn:
+        assert signal_id == 4
+        assert conn.execute("SELECT id FROM orders_executed WHERE client_order_id = 'local-1'").fetchone() == (4,)
+        assert conn.execute("SELECT MAX(id) FROM trading_results WHERE id < ?", (ID_PARTITION_SIZE,)).fetchone() == (4,)
+        sequences = dict(conn.execute("SELECT name, seq FROM sqlite_sequence"))
+    assert all(seq < ID_PARTITION_SIZE for seq in sequences.values())
@@ -0,0 +1,49 @@
+"""
+交易結果冪等寫入測試：既有重複數據無法建立唯一索引時，各寫入路徑仍不重複寫入同一訂單的結果
+"""
+import sqlite3
+
+import pytest
+
+from database import TradingDataManager
+from bot_db import BASE_TS, create_bot_db
+
+@pytest.fixture
+def db_with_duplicate_result(tmp_path):
+    path = str(tmp_path / 'trading_signals.db')
+    create_bot_db(path)
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO trading_results (order_id, client_order_id, symbol, final_pnl, result_timestamp) "
+                     "SELECT order_id, client_order_id, symbol, final_pnl, result_timestamp FROM trading_results WHERE id = 1")
+        # 尚無結果的訂單4
+        conn.execute("INSERT INTO orders_executed (signal_id, client_order_id, symbol, side, execution_timestamp) "
+                     "VALUES (1, 'order-3', 'BTCUSDT', 'BUY', ?)", (BASE_TS,))
+    return path
+
+def _result(client_order_id):
+    return {
+        'client_order_id': client_order_id, 'symbol': 'BTCUSDT', 'final_pnl': 1.0, 'exit_method': 'TP',
+        'entry_price': 100, 'exit_price': 101, 'total_quantity': 1, 'result_timestamp': BASE_TS,
+        'is_successful': True, 'holding_time_minutes': 5
+    }
+
+def _result_counts(path):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT order_id, COUNT(*) FROM trading_results GROUP BY order_id"))
+
+def test_results_without_unique_index_are_not_duplicated(db_with_duplicate_result):
+    path = db_with_duplicate_result
+    manager = TradingDataManager(path, write_behind=True)
+    assert not manager.results_order_unique
+
+    # 寫後佇列：快取命中（訂單2、4）與未命中（訂單3）兩條路徑
+    manager._cache_order_id('order-1', 2)
+    manager._cache_order_id('order-3', 4)
+    for _ in range(2):
+        for client_order_id in ('order-1', 'order-2', 'order-3'):
+            assert manager.record_trading_result_by_client_id(client_order_id, _result(client_order_id))
+    assert manager.flush_writes(timeout=10)
+    assert manager.get_failed_writes() == []
+
+    assert TradingDataManager(path).record_trading_result_by_client_id('order-1', _result('order-1'))
+    assert _result_counts(path) == {1: 2, 2: 1, 3: 1, 4: 1}